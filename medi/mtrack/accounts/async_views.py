@@ -0,0 +1,39 @@
+"""
+Async dashboard, routed instead of views.dashboard when ASYNC_VIEWS is set.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.shortcuts import render
+
+from appointments.models import Appointment, AppointmentStats, DoctorRatingSummary
+from appointments.views import role_required
+from .views import RECENT_APPOINTMENTS
+
+
+async def _recent(queryset):
+    return [appointment async for appointment in queryset[:RECENT_APPOINTMENTS].aiterator()]
+
+
+@role_required(None)
+async def dashboard(request):
+    user = request.user
+    context = {'user': user}
+    recent = Appointment.objects.for_patient(user) if user.is_patient() else Appointment.objects.for_doctor(user)
+
+    # The counters row, the recent list and the ratings don't depend on each other
+    lookups = [sync_to_async(AppointmentStats.for_user)(user), _recent(recent)]
+    if user.is_doctor():
+        lookups.append(sync_to_async(DoctorRatingSummary.for_doctor)(user))
+    stats, context['appointments'], *ratings = await asyncio.gather(*lookups)
+
+    if user.is_patient():
+        context['pending_count'] = stats.pending_count
+        context['confirmed_count'] = stats.confirmed_count
+        context['completed_count'] = stats.completed_count
+    elif user.is_doctor():
+        context['average_rating'] = ratings[0].average_rating
+        context['total_appointments'] = stats.total_count
+        context['completed_appointments'] = stats.completed_count
+
+    return render(request, 'accounts/dashboard.html', context)
@@ -0,0 +1,93 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.paginator import Paginator
+
+from .models import User
+
+VERSION_KEY = 'doctor_directory:version'
+TIMEOUT = 60 * 60
+# How stale another worker's directory can get without a shared cache
+LOCAL_TIMEOUT = 30
+PAGE_SIZE = 20
+
+
+def _cache():
+    # (cache, how long a version lasts). A doctor added or renamed in one
+    # worker must show up in all of them, so with a shared cache the version
+    # is kept until bumped; otherwise each process starts a new one every
+    # LOCAL_TIMEOUT seconds.
+    if 'shared' in settings.CACHES:
+        return caches['shared'], None
+    return caches['default'], LOCAL_TIMEOUT
+
+
+def version():
+    # Bumped on every account change, so it also keys caches holding user names
+    cache, lifetime = _cache()
+    current = cache.get(VERSION_KEY)
+    if current is None:
+        # Start from the clock so a fresh version never matches entries
+        # left over from before the version key was evicted.
+        cache.add(VERSION_KEY, time.time_ns(), lifetime)
+        current = cache.get(VERSION_KEY)
+    return current
+
+
+def invalidate():
+    cache, lifetime = _cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), lifetime)
+
+
+def _load():
+    doctors = [
+        {
+            'id': doctor['id'],
+            'name': f"{doctor['first_name']} {doctor['last_name']}".strip() or doctor['username'],
+            'specialization': doctor['specialization'],
+        }
+        for doctor in User.objects.filter(role='doctor', is_active=True)
+        .order_by('first_name', 'last_name', 'id')
+        .values('id', 'username', 'first_name', 'last_name', 'specialization')
+    ]
+    return doctors, frozenset(doctor['id'] for doctor in doctors)
+
+
+def _directory():
+    key = f'doctor_directory:{version()}'
+    cache = _cache()[0]
+    directory = cache.get(key)
+    if directory is None:
+        directory = _load()
+        cache.set(key, directory, TIMEOUT)
+    return directory
+
+
+def get_doctors():
+    return _directory()[0]
+
+
+def doctor_ids():
+    return _directory()[1]
+
+
+def choices():
+    return [
+        (doctor['id'], f"{doctor['name']} ({doctor['specialization']})" if doctor['specialization'] else doctor['name'])
+        for doctor in get_doctors()
+    ]
+
+
+def search(query='', page=1, per_page=PAGE_SIZE):
+    doctors = get_doctors()
+    query = query.strip().lower()
+    if query:
+        doctors = [
+            doctor for doctor in doctors
+            if query in doctor['name'].lower() or query in doctor['specialization'].lower()
+        ]
+    return Paginator(doctors, per_page).get_page(page)
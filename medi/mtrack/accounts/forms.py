@@ -1,7 +1,7 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.core.exceptions import ValidationError
-from .models import User
+from .models import User, validate_meditrack_email
 
 class CustomUserCreationForm(UserCreationForm):
     email = forms.EmailField(required=True)
@@ -15,8 +15,7 @@ class CustomUserCreationForm(UserCreationForm):
     
     def clean_email(self):
         email = self.cleaned_data.get('email')
-        if not email.endswith('@meditrack.local'):
-            raise ValidationError('Email must end with @meditrack.local')
+        validate_meditrack_email(email)
         if User.objects.filter(email=email).exists():
             raise ValidationError('This email is already registered.')
         return email
@@ -0,0 +1,102 @@
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.core.cache import caches
+from django.db import router
+from django.utils.crypto import constant_time_compare, get_random_string
+from django.utils.functional import SimpleLazyObject
+
+from .models import User
+
+PRINCIPAL_SESSION_KEY = '_auth_principal'
+# Enough of the user row for templates, role checks and the admin's
+# is_staff/is_active checks. Anything else is loaded on first access.
+PRINCIPAL_FIELDS = ('id', 'username', 'first_name', 'last_name', 'role', 'is_active', 'is_staff', 'is_superuser')
+TOKEN_TIMEOUT = 60 * 60 * 24
+
+
+def token_key(user_id):
+    return f'auth_principal:{user_id}'
+
+
+def _token_cache():
+    # A revocation has to reach every worker, so tokens only live in the
+    # shared cache; without one there is no cached principal and every
+    # request loads and verifies the user as Django does.
+    return caches['shared'] if 'shared' in settings.CACHES else None
+
+
+def invalidate(user_id):
+    cache = _token_cache()
+    if cache is not None:
+        cache.delete(token_key(user_id))
+
+
+def _current_token(cache, user_id):
+    # The token changes whenever the user row is saved (see accounts.signals),
+    # which revokes every session's cached principal for that user. A new
+    # password deletes it too, so the next request goes back through
+    # Django's check of the session hash against the user's password.
+    token = cache.get(token_key(user_id))
+    if token is None:
+        cache.add(token_key(user_id), get_random_string(16), TOKEN_TIMEOUT)
+        token = cache.get(token_key(user_id))
+    return token
+
+
+def _principal_user(cache, session):
+    principal = session.get(PRINCIPAL_SESSION_KEY)
+    if not principal:
+        return None
+    fields = principal['fields']
+    if (
+        str(fields['id']) != session.get(SESSION_KEY)
+        or session.get(BACKEND_SESSION_KEY) not in settings.AUTHENTICATION_BACKENDS
+        or not constant_time_compare(principal['hash'], session.get(HASH_SESSION_KEY) or '')
+        or not constant_time_compare(principal['token'], cache.get(token_key(fields['id'])) or '')
+    ):
+        return None
+    # A User instance with only these fields loaded; the rest (password,
+    # email, ...) are deferred and fetched if something asks for them.
+    # from_db() expects the values in the model's field order.
+    names = [field.attname for field in User._meta.concrete_fields if field.attname in PRINCIPAL_FIELDS]
+    return User.from_db(router.db_for_read(User), names, [fields[name] for name in names])
+
+
+def get_user(request):
+    if not hasattr(request, '_cached_user'):
+        cache = _token_cache()
+        user = None if cache is None else _principal_user(cache, request.session)
+        if user is None:
+            user = auth.get_user(request)
+            if user.is_authenticated and cache is not None:
+                request.session[PRINCIPAL_SESSION_KEY] = {
+                    'fields': {name: getattr(user, name) for name in PRINCIPAL_FIELDS},
+                    'hash': request.session.get(HASH_SESSION_KEY),
+                    'token': _current_token(cache, user.pk),
+                }
+        request._cached_user = user
+    return request._cached_user
+
+
+async def aget_user(request):
+    # Shares get_user's per-request cache, so user and auser() agree
+    return await sync_to_async(get_user)(request)
+
+
+class PrincipalAuthenticationMiddleware(AuthenticationMiddleware):
+    """
+    AuthenticationMiddleware that caches the logged-in user's principal in
+    the session, so most requests never load the User row. Needs the
+    'shared' cache (SHARED_CACHE_DIR) to revoke principals in every worker.
+    """
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: get_user(request))
+        # For async views; Django 4.2's AuthenticationMiddleware has no auser()
+        request.auser = partial(aget_user, request)
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='specialization',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
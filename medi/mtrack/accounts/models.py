@@ -1,6 +1,11 @@
 from django.contrib.auth.models import AbstractUser
+from django.core.exceptions import ValidationError
 from django.db import models
 
+def validate_meditrack_email(email):
+    if not email.endswith('@meditrack.local'):
+        raise ValidationError('Email must end with @meditrack.local')
+
 class User(AbstractUser):
     ROLE_CHOICES = [
         ('patient', 'Patient'),
@@ -8,12 +13,11 @@ class User(AbstractUser):
     ]
     
     role = models.CharField(max_length=10, choices=ROLE_CHOICES)
+    specialization = models.CharField(max_length=100, blank=True)
     
     def clean(self):
         super().clean()
-        if not self.email.endswith('@meditrack.local'):
-            from django.core.exceptions import ValidationError
-            raise ValidationError('Email must end with @meditrack.local')
+        validate_meditrack_email(self.email)
     
     def is_patient(self):
         return self.role == 'patient'
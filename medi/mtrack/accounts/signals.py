@@ -0,0 +1,25 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import directory, middleware
+from .models import User
+
+# Saves that can't change what the doctor directory shows
+DIRECTORY_IRRELEVANT_FIELDS = {'last_login', 'password'}
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    # Password, role or any other change revokes cached session principals
+    middleware.invalidate(instance.pk)
+    if update_fields and set(update_fields) <= DIRECTORY_IRRELEVANT_FIELDS:
+        return
+    directory.invalidate()
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    middleware.invalidate(instance.pk)
+    directory.invalidate()
@@ -0,0 +1,13 @@
+from .models import User
+
+
+def make_user(username, role, **extra):
+    """A user with a valid MediTrack email and a name, for tests."""
+    return User.objects.create(
+        username=username,
+        email=f'{username}@meditrack.local',
+        first_name=username.title(),
+        last_name='Test',
+        role=role,
+        **extra
+    )
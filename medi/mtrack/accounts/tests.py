@@ -1,3 +1,197 @@
-from django.test import TestCase
+import datetime
+import tempfile
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from appointments.forms import AppointmentForm
+from . import directory, middleware
+from .models import User
+from .testing import make_user
+
+# One process stands in for several workers sharing SHARED_CACHE_DIR
+SHARED_CACHES = {
+    **settings.CACHES,
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared'},
+}
+
+
+class DoctorDirectoryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = make_user('house', 'doctor', specialization='Diagnostics')
+        self.patient = make_user('patient', 'patient')
+
+    def test_directory_is_served_from_cache(self):
+        directory.get_doctors()
+        with self.assertNumQueries(0):
+            self.assertEqual(directory.get_doctors()[0]['specialization'], 'Diagnostics')
+            self.assertIn(self.doctor.id, directory.doctor_ids())
+
+    def test_saving_a_user_invalidates(self):
+        directory.get_doctors()
+        make_user('wilson', 'doctor', specialization='Oncology')
+        self.assertEqual(len(directory.get_doctors()), 2)
+        self.doctor.role = 'patient'
+        self.doctor.save()
+        self.assertEqual(len(directory.get_doctors()), 1)
+
+    def test_a_change_reaches_other_workers_through_the_shared_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            shared = {**SHARED_CACHES, 'shared': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': tmp,
+            }}
+            with override_settings(CACHES=shared):
+                other_worker = FileBasedCache(tmp, {})
+                seen = directory.version()
+                self.assertEqual(other_worker.get(directory.VERSION_KEY), seen)
+                make_user('wilson', 'doctor', specialization='Oncology')
+                self.assertNotEqual(other_worker.get(directory.VERSION_KEY), seen)
+                self.assertEqual(len(directory.get_doctors()), 2)
+
+    def test_login_does_not_invalidate(self):
+        directory.get_doctors()
+        self.client.force_login(self.doctor)
+        with self.assertNumQueries(0):
+            directory.get_doctors()
+
+    def test_form_renders_and_validates_without_user_queries(self):
+        directory.get_doctors()
+        with self.assertNumQueries(0):
+            form = AppointmentForm()
+            self.assertIn('House Test (Diagnostics)', str(form['preferred_doctor']))
+            form = AppointmentForm({'preferred_doctor': self.patient.id})
+            form.is_valid()
+        self.assertIn('preferred_doctor', form.errors)
+
+    def test_lookup_endpoint_searches_and_paginates(self):
+        for i in range(directory.PAGE_SIZE + 5):
+            make_user(f'cardio{i}', 'doctor', specialization='Cardiology')
+        self.client.force_login(self.patient)
+        url = reverse('accounts:doctor_lookup')
+        data = self.client.get(url, {'q': 'cardio'}).json()
+        self.assertEqual(data['count'], directory.PAGE_SIZE + 5)
+        self.assertEqual(len(data['results']), directory.PAGE_SIZE)
+        data = self.client.get(url, {'q': 'cardio', 'page': 2}).json()
+        self.assertEqual(len(data['results']), 5)
+        data = self.client.get(url, {'q': 'diag'}).json()
+        self.assertEqual([doctor['id'] for doctor in data['results']], [self.doctor.id])
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class PrincipalMiddlewareTests(TestCase):
+    def setUp(self):
+        self.patient = make_user('patient', 'patient')
+        self.url = reverse('accounts:dashboard')
+        self.client.force_login(self.patient)
+        self.client.get(self.url)
+
+    def user_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url)
+        return response, [q['sql'] for q in ctx.captured_queries if 'FROM "accounts_user"' in q['sql']]
+
+    def test_cached_principal_skips_user_row(self):
+        response, queries = self.user_queries()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, [])
+        self.assertEqual(response.context['user'], self.patient)
+
+    def test_password_change_logs_out_other_sessions(self):
+        self.patient.set_password('new-secret-123')
+        self.patient.save()
+        response = self.client.get(self.url)
+        self.assertRedirects(response, f"{reverse('accounts:login')}?next={self.url}", fetch_redirect_response=False)
+
+    def test_role_change_is_picked_up(self):
+        self.patient.role = 'doctor'
+        self.patient.save(update_fields=['role'])
+        response, queries = self.user_queries()
+        self.assertTrue(queries)
+        self.assertTrue(response.context['user'].is_doctor())
+
+    def test_revocation_in_another_worker_ends_the_session(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            shared = {**SHARED_CACHES, 'shared': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': tmp,
+            }}
+            with override_settings(CACHES=shared):
+                self.client.get(self.url)
+                self.assertEqual(self.user_queries()[1], [])
+                # Another worker saves a new password: the row changes and
+                # its own cache instance deletes the token
+                User.objects.filter(pk=self.patient.pk).update(password='changed')
+                FileBasedCache(tmp, {}).delete(middleware.token_key(self.patient.pk))
+                response = self.client.get(self.url)
+        self.assertRedirects(response, f"{reverse('accounts:login')}?next={self.url}", fetch_redirect_response=False)
+
+    @override_settings(CACHES=settings.CACHES)
+    def test_without_a_shared_cache_every_request_loads_the_user(self):
+        response, queries = self.user_queries()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(self.user_queries()[1], queries)
+
+    def test_role_required_sends_anonymous_users_to_login(self):
+        self.client.logout()
+        url = reverse('appointments:book_appointment')
+        response = self.client.get(url)
+        self.assertRedirects(response, f"{reverse('accounts:login')}?next={url}", fetch_redirect_response=False)
+
+
+@override_settings(
+    CACHES=SHARED_CACHES,
+    SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+    SESSION_CACHE_ALIAS='shared',
+)
+class SessionStorageTests(TestCase):
+    def setUp(self):
+        self.patient = make_user('patient', 'patient')
+        self.doctor = make_user('doctor', 'doctor')
+        self.url = reverse('accounts:dashboard')
+
+    def session_queries(self, send):
+        with CaptureQueriesContext(connection) as ctx:
+            response = send()
+        return response, [q['sql'] for q in ctx.captured_queries if 'django_session' in q['sql']]
+
+    def test_session_reads_come_from_the_cache(self):
+        self.client.force_login(self.patient)
+        self.client.get(self.url)
+        response, queries = self.session_queries(lambda: self.client.get(self.url))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, [])
+
+    def test_logout_ends_the_cached_session(self):
+        self.client.force_login(self.patient)
+        self.client.get(self.url)
+        session_cookie = self.client.cookies['sessionid'].value
+        self.client.post(reverse('accounts:logout'))
+        self.client.cookies['sessionid'] = session_cookie
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+
+    def test_messages_travel_in_a_cookie(self):
+        self.client.force_login(self.patient)
+        self.client.get(self.url)
+        response, queries = self.session_queries(lambda: self.client.post(reverse('appointments:book_appointment'), {
+            'preferred_doctor': self.doctor.id,
+            'appointment_date': datetime.date.today() + datetime.timedelta(days=1),
+            'appointment_time': '10:00',
+            'health_concern': 'Headache',
+        }))
+        self.assertEqual(queries, [])
+        self.assertIn('messages', response.cookies)
+        self.assertContains(self.client.get(response.url), 'Appointment booked successfully!')
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+    def test_signed_cookie_sessions(self):
+        self.client.force_login(self.patient)
+        response, queries = self.session_queries(lambda: self.client.get(self.url))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, [])
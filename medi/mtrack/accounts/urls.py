@@ -1,6 +1,9 @@
+from django.conf import settings
 from django.urls import path
 from django.contrib.auth import views as auth_views
-from . import views
+from . import async_views, views
+
+reads = async_views if settings.ASYNC_VIEWS else views
 
 app_name = 'accounts'
 
@@ -8,5 +11,6 @@ urlpatterns = [
     path('register/', views.register, name='register'),
     path('login/', auth_views.LoginView.as_view(template_name='accounts/login.html'), name='login'),
     path('logout/', auth_views.LogoutView.as_view(), name='logout'),
-    path('dashboard/', views.dashboard, name='dashboard'),
+    path('dashboard/', reads.dashboard, name='dashboard'),
+    path('doctors/', views.doctor_lookup, name='doctor_lookup'),
 ]
\ No newline at end of file
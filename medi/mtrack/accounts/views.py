@@ -4,9 +4,12 @@ from django.shortcuts import render,redirect
 from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Avg
+from django.http import JsonResponse
 from .forms import CustomUserCreationForm
-from appointments.models import Appointment, Feedback
+from . import directory
+from appointments.models import Appointment, AppointmentStats, DoctorRatingSummary
+
+RECENT_APPOINTMENTS = 5
 
 def register(request):
     if request.method == 'POST':
@@ -24,28 +27,32 @@ def register(request):
 def dashboard(request):
     user = request.user
     context = {'user': user}
+    # Counters come from the user's AppointmentStats row rather than
+    # counting over Appointment/Feedback on every page load.
+    stats = AppointmentStats.for_user(user)
     
     if user.is_patient():
-        appointments = Appointment.objects.filter(patient=user).order_by('-created_at')
-        context['appointments'] = appointments
+        context['appointments'] = Appointment.objects.for_patient(user)[:RECENT_APPOINTMENTS]
         
         # Count appointments by status
-        context['pending_count'] = appointments.filter(status='pending').count()
-        context['confirmed_count'] = appointments.filter(status='confirmed').count()
-        context['completed_count'] = appointments.filter(status='completed').count()
+        context['pending_count'] = stats.pending_count
+        context['confirmed_count'] = stats.confirmed_count
+        context['completed_count'] = stats.completed_count
         
     elif user.is_doctor():
-        appointments = Appointment.objects.filter(doctor=user).order_by('-created_at')
-        context['appointments'] = appointments
-        
-        # Calculate average rating
-        feedbacks = Feedback.objects.filter(appointment__doctor=user)
-        if feedbacks.exists():
-            context['average_rating'] = feedbacks.aggregate(Avg('rating'))['rating__avg']
-        else:
-            context['average_rating'] = 0
-            
-        context['total_appointments'] = appointments.count()
-        context['completed_appointments'] = appointments.filter(status='completed').count()
+        context['appointments'] = Appointment.objects.for_doctor(user)[:RECENT_APPOINTMENTS]
+        context['average_rating'] = DoctorRatingSummary.for_doctor(user).average_rating
+        context['total_appointments'] = stats.total_count
+        context['completed_appointments'] = stats.completed_count
     
-    return render(request, 'accounts/dashboard.html', context)
\ No newline at end of file
+    return render(request, 'accounts/dashboard.html', context)
+
+@login_required
+def doctor_lookup(request):
+    page = directory.search(request.GET.get('q', ''), request.GET.get('page'))
+    return JsonResponse({
+        'results': page.object_list,
+        'page': page.number,
+        'num_pages': page.paginator.num_pages,
+        'count': page.paginator.count,
+    })
\ No newline at end of file
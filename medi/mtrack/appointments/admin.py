@@ -1,22 +1,61 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 
 # Register your models here.
 from .models import Appointment, Prescription, Feedback
+from .pagination import EstimatedCountPaginator
+from . import bulk, search
+
+class ChangelistAdmin(admin.ModelAdmin):
+    # Changelists stay usable at 50k+ rows: no COUNT(*) over the whole
+    # table, and no second count for "N total" next to a filtered count
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 @admin.register(Appointment)
-class AppointmentAdmin(admin.ModelAdmin):
+class AppointmentAdmin(ChangelistAdmin):
     list_display = ('patient', 'doctor', 'appointment_date', 'appointment_time', 'status', 'created_at')
+    list_select_related = ('patient', 'doctor')
+    # Drill-down by year/month/day reads appt_date_idx
+    date_hierarchy = 'appointment_date'
     list_filter = ('status', 'appointment_date', 'created_at')
-    search_fields = ('patient__username', 'doctor__username', 'health_concern')
+    # Turns on the search box; get_search_results answers from the
+    # full-text index rather than LIKE over these fields
+    search_fields = ('health_concern',)
     readonly_fields = ('created_at', 'updated_at')
 
+    actions = ('mark_confirmed', 'mark_in_progress', 'mark_completed')
+
+    def _transition(self, request, queryset, new_status):
+        results = bulk.transition(queryset.values_list('pk', flat=True), new_status)
+        updated = sum(result == bulk.UPDATED for result in results.values())
+        self.message_user(request, f'{updated} of {len(results)} appointment(s) moved to {new_status}.',
+                          messages.SUCCESS if updated == len(results) else messages.WARNING)
+
+    @admin.action(description='Confirm selected appointments (assigns the preferred doctor)')
+    def mark_confirmed(self, request, queryset):
+        self._transition(request, queryset, 'confirmed')
+
+    @admin.action(description='Mark selected appointments in progress')
+    def mark_in_progress(self, request, queryset):
+        self._transition(request, queryset, 'in_progress')
+
+    @admin.action(description='Mark selected appointments completed')
+    def mark_completed(self, request, queryset):
+        self._transition(request, queryset, 'completed')
+
+    def get_search_results(self, request, queryset, search_term):
+        # Concern, prescription and patient name, all through the index
+        return search.filter_queryset(queryset, search_term), False
+
 @admin.register(Prescription)
-class PrescriptionAdmin(admin.ModelAdmin):
+class PrescriptionAdmin(ChangelistAdmin):
     list_display = ('appointment', 'created_at')
+    list_select_related = ('appointment__patient',)
     readonly_fields = ('created_at',)
 
 @admin.register(Feedback)
-class FeedbackAdmin(admin.ModelAdmin):
+class FeedbackAdmin(ChangelistAdmin):
     list_display = ('patient', 'doctor', 'rating', 'created_at')
+    list_select_related = ('patient', 'doctor')
     list_filter = ('rating', 'created_at')
     readonly_fields = ('created_at',)
\ No newline at end of file
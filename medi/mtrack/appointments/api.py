@@ -0,0 +1,233 @@
+"""
+JSON API for the mobile and kiosk clients: the same operations as the HTML
+views, validated by the same forms, with trimmed payloads. GETs carry an
+ETag and Last-Modified built from Appointment.updated_at, so a client
+polling for changes gets a 304 before anything is serialized. Clients
+log in for a session cookie and send the CSRF token with POSTs, like the
+HTML forms do.
+"""
+import hashlib
+import json
+from functools import wraps
+
+from django.db import transaction
+from django.db.models import Q
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.http import require_http_methods
+
+from .forms import AppointmentForm, FeedbackForm, PrescriptionForm
+from .models import Appointment, Feedback, Prescription
+from .pagination import paginate
+from . import booking, bulk, stats
+
+# bulk.transition outcomes as HTTP statuses
+OUTCOME_STATUS = {bulk.UPDATED: 200, bulk.NOT_FOUND: 404, bulk.INVALID: 409, bulk.CONFLICT: 409}
+
+
+def api_view(role=None, methods=('GET',)):
+    # JSON errors instead of the HTML views' login redirects and messages
+    def decorator(view_func):
+        @require_http_methods(methods)
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if not request.user.is_authenticated:
+                return error('Authentication required.', 401)
+            if role is not None and request.user.role != role:
+                return error('Not allowed for this account.', 403)
+            return view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def error(message, status, **extra):
+    return JsonResponse({'error': message, **extra}, status=status)
+
+
+def form_data(request):
+    # JSON bodies for apps, form encoding for anything else
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or '{}')
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+    return request.POST
+
+
+def person(user):
+    if user is None:
+        return None
+    return {'id': user.id, 'name': user.get_full_name()}
+
+
+def serialize(appointment):
+    return {
+        'id': appointment.id,
+        'status': appointment.status,
+        'date': appointment.appointment_date.isoformat() if appointment.appointment_date else None,
+        'time': appointment.appointment_time.isoformat(timespec='minutes') if appointment.appointment_time else None,
+        'health_concern': appointment.health_concern,
+        'patient': person(appointment.patient),
+        'doctor': person(appointment.doctor),
+        'preferred_doctor': person(appointment.preferred_doctor),
+        'updated_at': appointment.updated_at.isoformat(),
+    }
+
+
+def serialize_detail(appointment):
+    data = serialize(appointment)
+    prescription = getattr(appointment, 'prescription', None)
+    feedback = getattr(appointment, 'feedback', None)
+    data['prescription'] = prescription and {
+        'medicine_names': prescription.medicine_names,
+        'dosage_instructions': prescription.dosage_instructions,
+        'frequency': prescription.frequency,
+    }
+    data['feedback'] = feedback and {'rating': feedback.rating, 'comment': feedback.comment}
+    return data
+
+
+def visible_to(user):
+    return Q(patient=user) | Q(doctor=user) | Q(preferred_doctor=user)
+
+
+def _conditional(request, etag, last_modified, build):
+    # 304 (or 412) straight from the validators; build() only runs for a 200
+    # HTTP dates have whole seconds
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = build()
+    response['ETag'] = etag
+    if timestamp:
+        response['Last-Modified'] = http_date(timestamp)
+    return response
+
+
+def _detail(appointment_id, status=200):
+    appointment = Appointment.objects.select_related('patient', 'doctor', 'preferred_doctor') \
+        .with_records().get(pk=appointment_id)
+    return JsonResponse(serialize_detail(appointment), status=status)
+
+
+@api_view(methods=('GET', 'POST'))
+def appointments(request):
+    if request.method == 'POST':
+        return book(request)
+    user = request.user
+    if user.is_patient():
+        queryset = Appointment.objects.for_patient(user)
+    elif request.GET.get('queue') == 'pending':
+        queryset = Appointment.objects.pending_queue()
+    else:
+        queryset = Appointment.objects.for_doctor(user)
+    page = paginate(queryset, request.GET.get('cursor'))
+
+    # The page's rows are already loaded; the validators cover which rows
+    # are on it and when each last changed
+    versions = ','.join(f'{row.id}:{row.updated_at.timestamp()}' for row in page)
+    etag = '"%s"' % hashlib.md5(f'{versions}|{page.next_cursor}'.encode()).hexdigest()
+    last_modified = max((row.updated_at for row in page), default=None)
+    return _conditional(request, etag, last_modified, lambda: JsonResponse({
+        'results': [serialize(row) for row in page],
+        'next_cursor': page.next_cursor,
+    }))
+
+
+@api_view(methods=('GET',))
+def appointment(request, appointment_id):
+    updated_at = Appointment.objects.filter(visible_to(request.user), pk=appointment_id) \
+        .values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        return error('Appointment not found.', 404)
+    # Adding a prescription or feedback touches updated_at (see signals)
+    etag = f'"{appointment_id}-{updated_at.timestamp()}"'
+    return _conditional(request, etag, updated_at, lambda: _detail(appointment_id))
+
+
+@api_view('patient', methods=('POST',))
+def book(request):
+    data = form_data(request)
+    if data is None:
+        return error('Malformed JSON body.', 400)
+    form = AppointmentForm(data)
+    if not form.is_valid():
+        return error('Invalid appointment.', 400, errors=form.errors.get_json_data())
+    appointment = form.save(commit=False)
+    appointment.patient = request.user
+    try:
+        booking.book(appointment)
+    except booking.BookingError as e:
+        return error(str(e), 409)
+    return _detail(appointment.id, status=201)
+
+
+def _transition(request, appointment_id, new_status):
+    outcome = bulk.transition([appointment_id], new_status, doctor=request.user)[appointment_id]
+    if outcome != bulk.UPDATED:
+        return error(f'Cannot move this appointment to {new_status}.', OUTCOME_STATUS[outcome], outcome=outcome)
+    return _detail(appointment_id)
+
+
+@api_view('doctor', methods=('POST',))
+def accept(request, appointment_id):
+    return _transition(request, appointment_id, 'confirmed')
+
+
+@api_view('doctor', methods=('POST',))
+def update_status(request, appointment_id):
+    data = form_data(request)
+    if data is None:
+        return error('Malformed JSON body.', 400)
+    new_status = data.get('status')
+    if new_status not in dict(Appointment.STATUS_CHOICES):
+        return error('Unknown status.', 400)
+    return _transition(request, appointment_id, new_status)
+
+
+@api_view('doctor', methods=('POST',))
+def add_prescription(request, appointment_id):
+    appointment = Appointment.objects.filter(
+        pk=appointment_id, doctor=request.user, status='completed'
+    ).only('id').first()
+    if appointment is None:
+        return error('Appointment not found.', 404)
+    if Prescription.objects.filter(appointment=appointment).exists():
+        return error('Prescription already exists for this appointment.', 409)
+    data = form_data(request)
+    if data is None:
+        return error('Malformed JSON body.', 400)
+    form = PrescriptionForm(data)
+    if not form.is_valid():
+        return error('Invalid prescription.', 400, errors=form.errors.get_json_data())
+    prescription = form.save(commit=False)
+    prescription.appointment = appointment
+    prescription.save()
+    return _detail(appointment.id, status=201)
+
+
+@api_view('patient', methods=('POST',))
+def submit_feedback(request, appointment_id):
+    appointment = Appointment.objects.filter(
+        pk=appointment_id, patient=request.user, status='completed'
+    ).only('id', 'doctor_id').first()
+    if appointment is None:
+        return error('Appointment not found.', 404)
+    if Feedback.objects.filter(appointment=appointment).exists():
+        return error('Feedback already submitted for this appointment.', 409)
+    data = form_data(request)
+    if data is None:
+        return error('Malformed JSON body.', 400)
+    form = FeedbackForm(data)
+    if not form.is_valid():
+        return error('Invalid feedback.', 400, errors=form.errors.get_json_data())
+    feedback = form.save(commit=False)
+    feedback.appointment = appointment
+    feedback.patient = request.user
+    feedback.doctor_id = appointment.doctor_id
+    with transaction.atomic():
+        feedback.save()
+        stats.record_feedback(feedback)
+    return _detail(appointment.id, status=201)
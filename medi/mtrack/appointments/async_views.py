@@ -0,0 +1,58 @@
+"""
+Async versions of the read-only appointment pages. urls.py routes to these
+instead of views.py when ASYNC_VIEWS is set, for ASGI deployments where a
+sync view would hold a worker thread for the whole request.
+
+Everything a template reads is loaded before render(), so rendering never
+touches the database from the event loop.
+"""
+from django.http import Http404
+from django.shortcuts import render
+
+from .models import Appointment
+from .pagination import apaginate
+from .views import role_required
+
+
+@role_required(None)
+async def appointments_list(request):
+    if request.user.is_patient():
+        appointments = Appointment.objects.for_patient(request.user)
+    else:
+        appointments = Appointment.objects.pending_queue()
+
+    page = await apaginate(appointments, request.GET.get('cursor'))
+    return render(request, 'appointments/appointments_list.html', {
+        'appointments': page,
+        'page': page,
+    })
+
+
+@role_required('doctor')
+async def my_appointments(request):
+    page = await apaginate(Appointment.objects.for_doctor(request.user), request.GET.get('cursor'))
+    return render(request, 'appointments/my_appointments.html', {
+        'appointments': page,
+        'page': page,
+    })
+
+
+@role_required(None)
+async def appointment_detail(request, appointment_id):
+    try:
+        appointment = await Appointment.objects.select_related(
+            'patient', 'doctor', 'preferred_doctor'
+        ).with_records().aget(id=appointment_id)
+    except Appointment.DoesNotExist:
+        raise Http404("Appointment not found")
+
+    # Compare ids: the related users are loaded, but this avoids relying on it
+    if request.user.id not in (appointment.patient_id, appointment.doctor_id, appointment.preferred_doctor_id):
+        raise Http404("Appointment not found")
+
+    # Both were prefetched by with_records(), so these don't query
+    return render(request, 'appointments/appointment_detail.html', {
+        'appointment': appointment,
+        'prescription': getattr(appointment, 'prescription', None),
+        'feedback': getattr(appointment, 'feedback', None),
+    })
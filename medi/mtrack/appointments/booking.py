@@ -0,0 +1,79 @@
+import random
+import time
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, OperationalError, connection, transaction
+
+from .models import ACTIVE_STATUSES, MAX_APPOINTMENTS_PER_DAY, Appointment
+from . import slots, stats
+
+User = get_user_model()
+
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 0.02  # seconds, doubled on every retry
+
+
+class BookingError(Exception):
+    pass
+
+
+@contextmanager
+def booking_transaction(appointment):
+    with transaction.atomic():
+        if connection.features.has_select_for_update:
+            # Serialize bookings per patient and per doctor. Locking in pk
+            # order keeps two bookings from deadlocking on each other.
+            user_ids = [appointment.patient_id, appointment.preferred_doctor_id]
+            list(User.objects.select_for_update().filter(pk__in=user_ids).order_by('pk').values_list('pk'))
+        elif connection.vendor == 'sqlite':
+            # SQLite has no row locks. Take the database write lock before
+            # reading (the equivalent of BEGIN IMMEDIATE) so the check and
+            # the insert below happen without another writer in between.
+            with connection.cursor() as cursor:
+                cursor.execute(f'UPDATE {Appointment._meta.db_table} SET id = id WHERE 0')
+        yield
+
+
+def _book_once(appointment):
+    with booking_transaction(appointment):
+        same_day = Appointment.objects.filter(
+            patient_id=appointment.patient_id,
+            appointment_date=appointment.appointment_date,
+        )
+        taken = set(same_day.values_list('day_slot', flat=True))
+        free = [slot for slot in range(1, MAX_APPOINTMENTS_PER_DAY + 1) if slot not in taken]
+        if not free:
+            raise BookingError(f'You cannot book more than {MAX_APPOINTMENTS_PER_DAY} appointments on the same day.')
+
+        slot_taken = Appointment.objects.filter(
+            preferred_doctor_id=appointment.preferred_doctor_id,
+            appointment_date=appointment.appointment_date,
+            appointment_time=appointment.appointment_time,
+            status__in=ACTIVE_STATUSES,
+        ).exists()
+        if appointment.preferred_doctor_id and slot_taken:
+            raise BookingError('This doctor is already booked at that time. Please choose another time.')
+
+        appointment.day_slot = free[0]
+        appointment.save()
+        stats.record_booking(appointment)
+        slots.record_booking(appointment)
+    return appointment
+
+
+def book(appointment):
+    """
+    Save a new appointment, enforcing the per-day limit and the doctor's
+    time slot atomically. Raises BookingError when the booking isn't allowed.
+    """
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            return _book_once(appointment)
+        except (IntegrityError, OperationalError):
+            # Lost a race to a concurrent booking (constraint violation) or
+            # timed out waiting for the lock; the next attempt re-reads.
+            appointment.pk = None
+            if attempt == MAX_ATTEMPTS - 1:
+                raise BookingError('The booking system is busy. Please try again.')
+            time.sleep(RETRY_DELAY * 2 ** attempt * random.uniform(0.5, 1.5))
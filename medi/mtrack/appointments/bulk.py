@@ -0,0 +1,85 @@
+"""
+Moving many appointments to one status at once, for the doctors' bulk
+endpoint and the admin actions. Each move is checked with
+Appointment.can_transition_to and applied with one conditional UPDATE per
+source status, all in one transaction.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import ACTIVE_STATUSES, Appointment, status_changed
+from . import slots, stats
+
+MAX_BATCH = 200
+
+# Per-appointment outcomes
+UPDATED = 'updated'
+NOT_FOUND = 'not_found'  # missing, or not this doctor's to move
+INVALID = 'invalid_transition'
+CONFLICT = 'conflict'  # another request moved it first
+
+ROW_FIELDS = ('id', 'status', 'patient_id', 'doctor_id', 'preferred_doctor_id', 'appointment_date', 'appointment_time')
+
+
+def _scope(doctor, accepting):
+    # The same rules as accept_appointment and update_appointment_status
+    if doctor is None:
+        return Q()
+    if accepting:
+        return Q(doctor=doctor) | Q(preferred_doctor=doctor)
+    return Q(doctor=doctor)
+
+
+def transition(ids, new_status, doctor=None):
+    """
+    Move the appointments with these ids to new_status, acting as `doctor`
+    (None for staff, who may move any appointment). Returns {id: outcome}.
+    """
+    ids = list(dict.fromkeys(ids))
+    results = {pk: NOT_FOUND for pk in ids}
+    accepting = new_status == 'confirmed'
+    scope = _scope(doctor, accepting)
+    moves = []
+    with transaction.atomic():
+        by_status = defaultdict(list)
+        for appointment in Appointment.objects.filter(scope, pk__in=ids).only(*ROW_FIELDS):
+            # Staff confirming assign the preferred doctor, so there must be one
+            unassignable = accepting and doctor is None and not (appointment.doctor_id or appointment.preferred_doctor_id)
+            if appointment.can_transition_to(new_status) and not unassignable:
+                by_status[appointment.status].append(appointment)
+            else:
+                results[appointment.pk] = INVALID
+
+        now = timezone.now()
+        changes = {'status': new_status, 'updated_at': now}
+        if accepting:
+            changes['doctor'] = doctor if doctor is not None else Coalesce('doctor', 'preferred_doctor')
+        for old_status, group in by_status.items():
+            pks = [appointment.pk for appointment in group]
+            updated = Appointment.objects.filter(scope, pk__in=pks, status=old_status).update(**changes)
+            won = set(pks)
+            if updated < len(pks):
+                won = set(Appointment.objects.filter(pk__in=pks, status=new_status, updated_at=now).values_list('pk', flat=True))
+            for appointment in group:
+                if appointment.pk not in won:
+                    results[appointment.pk] = CONFLICT
+                    continue
+                old_doctor_id = appointment.doctor_id
+                appointment.status = new_status
+                appointment.updated_at = now
+                if accepting:
+                    appointment.doctor_id = doctor.pk if doctor is not None else old_doctor_id or appointment.preferred_doctor_id
+                moves.append((appointment, old_status, old_doctor_id))
+                results[appointment.pk] = UPDATED
+
+        stats.record_transitions(moves)
+        for appointment, old_status, old_doctor_id in moves:
+            # confirmed -> in_progress keeps the same doctor's slot busy
+            if accepting or new_status not in ACTIVE_STATUSES:
+                slots.record_transition(appointment)
+            status_changed.send(sender=Appointment, instance=appointment, old_status=old_status, using=appointment._state.db)
+    return results
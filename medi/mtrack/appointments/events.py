@@ -0,0 +1,299 @@
+"""
+Live appointment updates over Server-Sent Events, so open pages learn about
+status changes instead of polling for them.
+
+A change (a booking, a status transition, an admin edit) is handed to the
+broker once its transaction commits. The broker delivers it to the Hub of
+every process serving streams, and the Hub fans it out to the streams
+subscribed to its channels: user:<id> for each person on the appointment,
+and 'pending' for the doctors' queue while it enters or leaves it.
+
+EVENTS_BROKER picks the broker: 'local' delivers within this process (one
+worker, and the tests); 'postgresql' goes through LISTEN/NOTIFY so every
+worker sees every change. Streams need the ASGI handler: under WSGI each
+one would hold a worker thread, so the view answers 204 and pages simply
+go without live updates.
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connections, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+
+from mtrack.routers import PRIMARY
+
+from .models import Appointment
+from .views import role_required
+
+QUEUE_SIZE = 50  # undelivered messages per stream before it must resync
+KEEPALIVE = 15  # seconds; keeps proxies from closing an idle stream
+# Django 4.2 doesn't notice a client going away mid-stream, so streams end
+# on their own and EventSource reconnects after RETRY_MS
+STREAM_SECONDS = 300
+RETRY_MS = 3000
+
+RESYNC = object()
+
+
+def message(appointment, old_status):
+    # Ids and status only: enough to patch a badge, no health details
+    return {
+        'id': appointment.pk,
+        'status': appointment.status,
+        'old_status': old_status,
+        'status_display': dict(Appointment.STATUS_CHOICES).get(appointment.status, appointment.status),
+        'badge': appointment.badge_class,
+        'patient_id': appointment.patient_id,
+        'doctor_id': appointment.doctor_id,
+        'preferred_doctor_id': appointment.preferred_doctor_id,
+        'updated_at': appointment.updated_at.isoformat() if appointment.updated_at else None,
+    }
+
+
+def channels_for(message):
+    channels = {f'user:{message[key]}' for key in ('patient_id', 'doctor_id', 'preferred_doctor_id') if message[key]}
+    if 'pending' in (message['status'], message['old_status']):
+        channels.add('pending')
+    return channels
+
+
+def user_channels(user):
+    channels = [f'user:{user.pk}']
+    if user.is_doctor():
+        channels.append('pending')
+    return channels
+
+
+class Subscription:
+    # One per open stream, so kept small: a list and, only while the stream
+    # waits, a future and a timer. asyncio.Queue plus wait_for() cost
+    # several times as much per idle stream (see benchmarks/events.py).
+    __slots__ = ('channels', 'loop', 'size', 'pending', 'waiter', 'overflowed')
+
+    def __init__(self, channels, loop, size):
+        self.channels = channels
+        self.loop = loop
+        self.size = size
+        self.pending = []
+        self.waiter = None
+        self.overflowed = False
+
+    def deliver(self, message):
+        # On the subscriber's event loop
+        if len(self.pending) >= self.size:
+            self.overflowed = True
+        else:
+            self.pending.append(message)
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    async def get(self, timeout):
+        """The next message, RESYNC after an overflow, or None on timeout."""
+        if not self.pending and not self.overflowed:
+            self.waiter = self.loop.create_future()
+            timer = self.loop.call_later(timeout, _wake, self.waiter)
+            try:
+                await self.waiter
+            finally:
+                timer.cancel()
+                self.waiter = None
+        if self.overflowed:
+            self.overflowed = False
+            self.pending.clear()
+            return RESYNC
+        return self.pending.pop(0) if self.pending else None
+
+
+def _wake(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+def _deliver(subscriptions, message):
+    for subscription in subscriptions:
+        subscription.deliver(message)
+
+
+class Hub:
+    """Fans messages out to the streams open in this process."""
+
+    def __init__(self):
+        self._channels = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, channels, size=QUEUE_SIZE):
+        # Called on the event loop that will read the subscription
+        subscription = Subscription(tuple(channels), asyncio.get_running_loop(), size)
+        with self._lock:
+            for channel in subscription.channels:
+                self._channels[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._channels.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._channels[channel]
+
+    def dispatch(self, message):
+        """Queue the message on every subscribed stream, from any thread."""
+        with self._lock:
+            subscriptions = set()
+            for channel in channels_for(message):
+                subscriptions.update(self._channels.get(channel, ()))
+        self._deliver(subscriptions, message)
+        return len(subscriptions)
+
+    def resync(self):
+        # Changes may have been missed: every stream tells its page to reload
+        with self._lock:
+            subscriptions = set().union(*self._channels.values())
+        self._deliver(subscriptions, RESYNC)
+
+    def _deliver(self, subscriptions, message):
+        # One wake-up per event loop, not per subscriber
+        by_loop = defaultdict(list)
+        for subscription in subscriptions:
+            by_loop[subscription.loop].append(subscription)
+        for loop, group in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(_deliver, group, message)
+            except RuntimeError:
+                # The loop has closed; its streams are gone
+                for subscription in group:
+                    self.unsubscribe(subscription)
+
+    def __len__(self):
+        with self._lock:
+            return len(set().union(*self._channels.values()))
+
+
+class LocalBroker:
+    """Straight to this process's hub."""
+
+    def __init__(self, hub):
+        self.hub = hub
+
+    def publish(self, message):
+        self.hub.dispatch(message)
+
+    def listen(self):
+        pass
+
+
+class PostgresBroker:
+    """
+    NOTIFY on publish; each process LISTENs on its own connection from a
+    daemon thread, started by its first stream. Changes made while that
+    connection is down are missed, so streams are told to resync.
+    """
+    CHANNEL = 'meditrack_appointments'
+    RECONNECT_DELAY = 1  # seconds
+
+    def __init__(self, hub):
+        self.hub = hub
+        self._listener = None
+        self._lock = threading.Lock()
+
+    def publish(self, message):
+        with connections[PRIMARY].cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [self.CHANNEL, json.dumps(message)])
+
+    def listen(self):
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name='appointment-events', daemon=True)
+                self._listener.start()
+
+    def _connect(self):
+        import psycopg
+
+        db = settings.DATABASES[PRIMARY]
+        return psycopg.connect(
+            dbname=db['NAME'], user=db['USER'], password=db['PASSWORD'],
+            host=db['HOST'], port=db['PORT'], autocommit=True,
+        )
+
+    def _listen(self):
+        import psycopg
+
+        while True:
+            try:
+                with self._connect() as conn:
+                    conn.execute(f'LISTEN {self.CHANNEL}')
+                    for notify in conn.notifies():
+                        self.hub.dispatch(json.loads(notify.payload))
+            except psycopg.OperationalError:
+                pass
+            self.hub.resync()
+            time.sleep(self.RECONNECT_DELAY)
+
+
+BROKERS = {'local': LocalBroker, 'postgresql': PostgresBroker}
+
+hub = Hub()
+_broker = None
+
+
+def broker():
+    global _broker
+    if _broker is None:
+        try:
+            _broker = BROKERS[settings.EVENTS_BROKER](hub)
+        except KeyError:
+            raise ImproperlyConfigured(f'EVENTS_BROKER must be one of {", ".join(BROKERS)}')
+    return _broker
+
+
+def publish(appointment, old_status=None, using=None):
+    """Send this appointment's change to the live streams once it commits."""
+    data = message(appointment, old_status)
+    transaction.on_commit(lambda: broker().publish(data), using=using, robust=True)
+
+
+def _format(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+async def _events(subscription):
+    yield f'retry: {RETRY_MS}\n' + _format('ready', {})
+    closes = time.monotonic() + STREAM_SECONDS
+    while time.monotonic() < closes:
+        data = await subscription.get(KEEPALIVE)
+        if data is None:
+            yield ': keepalive\n\n'
+        elif data is RESYNC:
+            yield _format('resync', {})
+        else:
+            yield _format('appointment', data)
+
+
+class EventStreamResponse(StreamingHttpResponse):
+    def __init__(self, subscription):
+        super().__init__(_events(subscription), content_type='text/event-stream')
+        self.subscription = subscription
+        self['Cache-Control'] = 'no-cache'
+        self['X-Accel-Buffering'] = 'no'  # nginx would otherwise buffer it
+
+    def close(self):
+        # The handler closes the response when the stream ends or fails
+        hub.unsubscribe(self.subscription)
+        super().close()
+
+
+@role_required(None)
+async def stream(request):
+    if not isinstance(request, ASGIRequest):
+        # 204 tells EventSource not to reconnect
+        return HttpResponse(status=204)
+    broker().listen()
+    return EventStreamResponse(hub.subscribe(user_channels(request.user)))
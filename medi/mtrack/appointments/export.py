@@ -0,0 +1,87 @@
+import csv
+import datetime
+import io
+import json
+import zlib
+
+from .models import Appointment
+
+CHUNK_SIZE = 2000
+
+# (output column, Appointment lookup); prescription and feedback are
+# LEFT JOINed in the same query.
+COLUMNS = [
+    ('appointment_id', 'id'),
+    ('patient', 'patient__username'),
+    ('preferred_doctor', 'preferred_doctor__username'),
+    ('doctor', 'doctor__username'),
+    ('appointment_date', 'appointment_date'),
+    ('appointment_time', 'appointment_time'),
+    ('status', 'status'),
+    ('health_concern', 'health_concern'),
+    ('created_at', 'created_at'),
+    ('medicine_names', 'prescription__medicine_names'),
+    ('dosage_instructions', 'prescription__dosage_instructions'),
+    ('frequency', 'prescription__frequency'),
+    ('rating', 'feedback__rating'),
+    ('feedback_comment', 'feedback__comment'),
+]
+HEADER = [name for name, lookup in COLUMNS]
+
+
+def export_rows(date_from=None, date_to=None, doctor_id=None, chunk_size=CHUNK_SIZE):
+    # Filters and ordering line up with the (doctor, appointment_date) and
+    # (appointment_date) indexes.
+    queryset = Appointment.objects.order_by('appointment_date', 'id')
+    if date_from:
+        queryset = queryset.filter(appointment_date__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(appointment_date__lte=date_to)
+    if doctor_id:
+        queryset = queryset.filter(doctor_id=doctor_id)
+    return queryset.values_list(*[lookup for name, lookup in COLUMNS]).iterator(chunk_size=chunk_size)
+
+
+def _plain(value):
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return value
+
+
+def csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(HEADER)
+    for row in rows:
+        writer.writerow([_plain(value) for value in row])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def jsonl_lines(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(HEADER, map(_plain, row)))) + '\n'
+
+
+def encode(lines, compress=True, flush_bytes=64 * 1024):
+    """Encode text lines to bytes, gzip-compressing if asked, in ~64KB chunks."""
+    compressor = zlib.compressobj(wbits=31) if compress else None  # 31 = gzip container
+    pending = []
+    size = 0
+    for line in lines:
+        data = line.encode()
+        pending.append(compressor.compress(data) if compressor else data)
+        size += len(data)
+        if size >= flush_bytes:
+            yield b''.join(pending)
+            pending, size = [], 0
+    if compressor:
+        pending.append(compressor.flush())
+    yield b''.join(pending)
+
+
+def export(fmt, compress=True, **filters):
+    lines = csv_lines if fmt == 'csv' else jsonl_lines
+    return encode(lines(export_rows(**filters)), compress=compress)
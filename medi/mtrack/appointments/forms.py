@@ -1,15 +1,28 @@
 from django import forms
-from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
-from .models import Appointment, Prescription, Feedback
+from accounts import directory
+from .models import SLOT_MINUTES, Appointment, Prescription, Feedback, validate_appointment_time
+from . import slots
 import datetime
 
-User = get_user_model()
+class DoctorChoiceField(forms.TypedChoiceField):
+    # Choices and validation come from the cached doctor directory, so
+    # rendering and validating the form doesn't query the users table.
+    def __init__(self, **kwargs):
+        super().__init__(coerce=int, choices=self.doctor_choices, **kwargs)
+
+    @staticmethod
+    def doctor_choices():
+        return [('', 'Select a doctor')] + directory.choices()
+
+    def valid_value(self, value):
+        try:
+            return int(value) in directory.doctor_ids()
+        except (TypeError, ValueError):
+            return False
 
 class AppointmentForm(forms.ModelForm):
-    preferred_doctor = forms.ModelChoiceField(
-        queryset=User.objects.filter(role='doctor'),
-        empty_label="Select a doctor",
+    preferred_doctor = DoctorChoiceField(
         widget=forms.Select(attrs={'class': 'form-control'})
     )
     
@@ -18,7 +31,7 @@ class AppointmentForm(forms.ModelForm):
     )
     
     appointment_time = forms.TimeField(
-        widget=forms.TimeInput(attrs={'type': 'time', 'class': 'form-control'})
+        widget=forms.TimeInput(attrs={'type': 'time', 'step': SLOT_MINUTES * 60, 'class': 'form-control'})
     )
     
     health_concern = forms.CharField(
@@ -26,9 +39,11 @@ class AppointmentForm(forms.ModelForm):
         widget=forms.Textarea(attrs={'rows': 3, 'class': 'form-control'})
     )
     
+    field_order = ['preferred_doctor', 'appointment_date', 'appointment_time', 'health_concern']
+    
     class Meta:
         model = Appointment
-        fields = ['preferred_doctor', 'appointment_date', 'appointment_time', 'health_concern']
+        fields = ['appointment_date', 'appointment_time', 'health_concern']
     
     def clean_appointment_date(self):
         date = self.cleaned_data.get('appointment_date')
@@ -39,12 +54,28 @@ class AppointmentForm(forms.ModelForm):
     def clean_appointment_time(self):
         time = self.cleaned_data.get('appointment_time')
         if time:
-            start_time = datetime.time(9, 0)
-            end_time = datetime.time(17, 0)
-            if not (start_time <= time <= end_time):
-                raise ValidationError('Appointment time must be between 9:00 AM and 5:00 PM')
+            validate_appointment_time(time)
         return time
 
+    def clean(self):
+        cleaned_data = super().clean()
+        doctor_id = cleaned_data.get('preferred_doctor')
+        date = cleaned_data.get('appointment_date')
+        time = cleaned_data.get('appointment_time')
+        if doctor_id and date and time and not slots.is_free(doctor_id, date, time):
+            suggestions = ', '.join(
+                start.strftime('%b %d %H:%M') for start in slots.next_free_slots(doctor_id, 3)
+            )
+            self.add_error('appointment_time', f'This doctor is already booked at that time. Next free: {suggestions}')
+        return cleaned_data
+
+    def save(self, commit=True):
+        appointment = super().save(commit=False)
+        appointment.preferred_doctor_id = self.cleaned_data['preferred_doctor']
+        if commit:
+            appointment.save()
+        return appointment
+
 class PrescriptionForm(forms.ModelForm):
     class Meta:
         model = Prescription
@@ -0,0 +1,157 @@
+import datetime
+import random
+import re
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import Min
+from django.conf import settings
+from django.utils import timezone
+
+from appointments.models import Appointment, AppointmentStats
+from appointments.pagination import PAGE_SIZE, page_queryset
+
+User = get_user_model()
+
+ALIAS = 'explain'
+
+# A plain "SCAN <table>" line in SQLite's query plan is a full table scan;
+# scans "USING INDEX" / "USING COVERING INDEX" are fine. A temp B-tree means
+# the rows are sorted after the fact instead of read in index order.
+FULL_SCAN = re.compile(r'\bSCAN (appointments_\w+|accounts_user)\s*$')
+TEMP_SORT = 'USE TEMP B-TREE FOR ORDER BY'
+
+STATUSES = ['pending', 'confirmed', 'in_progress', 'completed']
+SLOT_TIMES = [datetime.time(hour, minute) for hour in range(9, 17) for minute in (0, 30)]
+
+
+def view_queries(patient, doctor, date, position):
+    """The queries behind each view, as (name, queryset) pairs."""
+    def page(queryset):
+        return page_queryset(queryset, position)[:PAGE_SIZE + 1]
+
+    return [
+        ('book_appointment: same-day count',
+         Appointment.objects.filter(patient=patient, appointment_date=date).order_by()),
+        ('appointments_list: patient', page(Appointment.objects.for_patient(patient))),
+        ('appointments_list: pending queue', page(Appointment.objects.pending_queue())),
+        ('appointments_list: preferred doctor',
+         Appointment.objects.filter(preferred_doctor=doctor, status='pending').order_by()),
+        ('my_appointments', page(Appointment.objects.for_doctor(doctor))),
+        ('dashboard: recent appointments', Appointment.objects.for_patient(patient)[:5]),
+        ('dashboard: stats', AppointmentStats.objects.filter(user=doctor)),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Seed a large SQLite database and print the query plan behind each appointment view.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000,
+                            help='Number of appointments to seed (default: 1,000,000).')
+        parser.add_argument('--db-path', default=str(settings.BASE_DIR / 'explain.sqlite3'),
+                            help='SQLite file to seed and explain against.')
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--fail-on-scan', action='store_true',
+                            help='Exit with an error if any query does a full table scan.')
+
+    def handle(self, *args, **options):
+        # Always SQLite, whatever engine the default database uses; the
+        # default's OPTIONS (e.g. PostgreSQL's connect_timeout) don't apply
+        connections.settings[ALIAS] = {
+            **connections.settings['default'],
+            'ENGINE': 'django.db.backends.sqlite3', 'NAME': options['db_path'], 'OPTIONS': {},
+        }
+        try:
+            self.explain(options)
+        finally:
+            connections[ALIAS].close()
+            del connections[ALIAS]
+            del connections.settings[ALIAS]
+
+    def explain(self, options):
+        call_command('migrate', database=ALIAS, verbosity=0)
+
+        existing = Appointment.objects.using(ALIAS).count()
+        if existing < options['rows']:
+            self.seed(existing, options['rows'], options['batch_size'])
+
+        patient = User.objects.using(ALIAS).filter(role='patient').first()
+        doctor = User.objects.using(ALIAS).filter(role='doctor').first()
+        date = datetime.date.today()
+        # Explain the listings as if paging deep into the history
+        position = (timezone.now(), Appointment.objects.using(ALIAS).order_by('-id').values_list('id', flat=True)[0])
+
+        scans = []
+        for name, queryset in view_queries(patient, doctor, date, position):
+            plan = queryset.using(ALIAS).explain()
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(plan)
+            if TEMP_SORT in plan or any(FULL_SCAN.search(line) for line in plan.splitlines()):
+                scans.append(name)
+
+        if scans:
+            message = 'Full table scan or sort in: ' + ', '.join(scans)
+            if options['fail_on_scan']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS('All queries use an index.'))
+
+    def seed(self, start, count, batch_size):
+        self.stdout.write(f'Seeding {count - start} appointments into {connections[ALIAS].settings_dict["NAME"]}...')
+        started = time.monotonic()
+        password = make_password(None)
+        rng = random.Random(start)
+
+        # 200 doctors and 20,000 patients for the default million rows
+        doctor_count = max(2, count // 5000)
+        patient_count = max(doctor_count * len(SLOT_TIMES), count // 50)
+        with transaction.atomic(using=ALIAS):
+            if not User.objects.using(ALIAS).filter(role='doctor').exists():
+                users = [
+                    User(username=f'{role}{i}', email=f'{role}{i}@meditrack.local',
+                         first_name=role.title(), last_name=str(i), role=role, password=password)
+                    for role, total in (('doctor', doctor_count), ('patient', patient_count))
+                    for i in range(total)
+                ]
+                User.objects.using(ALIAS).bulk_create(users, batch_size=batch_size)
+            doctors = list(User.objects.using(ALIAS).filter(role='doctor').values_list('id', flat=True))
+            patients = list(User.objects.using(ALIAS).filter(role='patient').values_list('id', flat=True))
+
+        # Fill each day doctor by doctor and slot by slot, so rows never break
+        # the one-booking-per-doctor-slot or per-day limits. Past days are
+        # mostly completed; upcoming ones are still open.
+        per_day = len(doctors) * len(SLOT_TIMES)
+        first_day = Appointment.objects.using(ALIAS).aggregate(first=Min('appointment_date'))['first']
+        if first_day is None:
+            first_day = datetime.date.today() - datetime.timedelta(days=count * 9 // (per_day * 10))
+        for offset in range(start, count, batch_size):
+            batch = []
+            for k in range(offset, min(offset + batch_size, count)):
+                date = first_day + datetime.timedelta(days=k // per_day)
+                slot = k % per_day
+                if date < datetime.date.today():
+                    status = rng.choices(STATUSES, weights=[1, 1, 1, 17])[0]
+                else:
+                    status = rng.choices(STATUSES, weights=[5, 4, 1, 0])[0]
+                preferred = doctors[slot % len(doctors)]
+                batch.append(Appointment(
+                    patient_id=patients[k % len(patients)],
+                    preferred_doctor_id=preferred,
+                    doctor_id=None if status == 'pending' else preferred,
+                    appointment_date=date,
+                    appointment_time=SLOT_TIMES[slot // len(doctors)],
+                    health_concern='Seeded appointment',
+                    status=status,
+                ))
+            with transaction.atomic(using=ALIAS):
+                Appointment.objects.using(ALIAS).bulk_create(batch)
+
+        with connections[ALIAS].cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.stdout.write(f'Seeded in {time.monotonic() - started:.1f}s.')
@@ -0,0 +1,49 @@
+import datetime
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from appointments import export
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Stream appointments with their prescriptions and feedback to a gzip CSV/JSONL file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Output file, or - for stdout.')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv')
+        parser.add_argument('--from', dest='date_from', type=datetime.date.fromisoformat)
+        parser.add_argument('--to', dest='date_to', type=datetime.date.fromisoformat)
+        parser.add_argument('--doctor', help='Only appointments handled by this doctor (username).')
+        parser.add_argument('--no-gzip', action='store_true')
+        parser.add_argument('--chunk-size', type=int, default=export.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        doctor_id = None
+        if options['doctor']:
+            doctor_id = User.objects.filter(username=options['doctor'], role='doctor').values_list('id', flat=True).first()
+            if doctor_id is None:
+                raise CommandError(f'Unknown doctor "{options["doctor"]}".')
+
+        rows = export.export_rows(
+            date_from=options['date_from'],
+            date_to=options['date_to'],
+            doctor_id=doctor_id,
+            chunk_size=options['chunk_size'],
+        )
+        lines = export.csv_lines(rows) if options['format'] == 'csv' else export.jsonl_lines(rows)
+        chunks = export.encode(lines, compress=not options['no_gzip'])
+
+        if options['output'] == '-':
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            return
+        written = 0
+        with open(options['output'], 'wb') as handle:
+            for chunk in chunks:
+                handle.write(chunk)
+                written += len(chunk)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} bytes to {options["output"]}.'))
@@ -0,0 +1,311 @@
+import csv
+import datetime
+import gzip
+import io
+import json
+import os
+import time
+from collections import Counter
+
+from django import forms
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models.functions import Lower
+
+from accounts import directory
+from accounts.forms import CustomUserCreationForm
+from accounts.models import validate_meditrack_email
+from appointments import slots
+from appointments.models import (
+    ACTIVE_STATUSES, MAX_APPOINTMENTS_PER_DAY, Appointment, validate_appointment_time,
+)
+
+User = get_user_model()
+
+ROLES = {role for role, label in User.ROLE_CHOICES}
+# Imported users pass the registration form's checks: its name fields, and
+# the username rules it gets from the model (150 characters, letters,
+# digits and @.+-_)
+USER_FIELDS = {
+    'username': forms.CharField(max_length=150, validators=[User.username_validator]),
+    'first_name': CustomUserCreationForm.base_fields['first_name'],
+    'last_name': CustomUserCreationForm.base_fields['last_name'],
+}
+STATUSES = {status for status, label in Appointment.STATUS_CHOICES}
+
+
+def read_rows(path):
+    """
+    Yield one dict per CSV row or JSONL line without loading the file. A
+    line that isn't a JSON object yields a ValidationError instead, which
+    the importers report like any other bad row.
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    name = path[:-3] if path.endswith('.gz') else path
+    with opener(path, 'rt', encoding='utf-8', newline='') as handle:
+        if name.endswith('.jsonl'):
+            for line in handle:
+                if line.strip():
+                    try:
+                        row = json.loads(line)
+                    except ValueError as e:
+                        yield ValidationError(f'Invalid JSON: {e}.')
+                        continue
+                    yield row if isinstance(row, dict) else ValidationError('Expected a JSON object.')
+        elif name.endswith('.csv'):
+            yield from csv.DictReader(handle)
+        else:
+            raise CommandError('Input must be a .csv or .jsonl file (optionally gzipped).')
+
+
+def value(row, name):
+    # JSONL values may be null or numbers, and short CSV rows give None
+    return str(row.get(name) or '').strip()
+
+
+def split_invalid(batch):
+    rows = [(number, row) for number, row in batch if isinstance(row, dict)]
+    errors = [(number, ' '.join(row.messages)) for number, row in batch if not isinstance(row, dict)]
+    return rows, errors
+
+
+def clean_fields(fields, row):
+    cleaned = {}
+    for name, field in fields.items():
+        try:
+            cleaned[name] = field.clean(value(row, name))
+        except ValidationError as e:
+            raise ValidationError(f'{name}: {" ".join(e.messages)}')
+    return cleaned
+
+
+def batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class UserImporter:
+    def __init__(self, password):
+        # One hash for every seeded account: hashing per row would dominate
+        # the import. Users are expected to reset their password.
+        self.password = make_password(password)
+
+    def build(self, batch):
+        batch, errors = split_invalid(batch)
+        usernames = {value(row, 'username') for number, row in batch}
+        emails = {User.objects.normalize_email(value(row, 'email')).lower() for number, row in batch}
+        taken_usernames = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+        taken_emails = set(
+            User.objects.annotate(email_lower=Lower('email')).filter(email_lower__in=emails)
+            .values_list('email_lower', flat=True)
+        )
+
+        users = []
+        for number, row in batch:
+            username = value(row, 'username')
+            email = User.objects.normalize_email(value(row, 'email'))
+            role = value(row, 'role')
+            specialization = value(row, 'specialization')
+            try:
+                fields = clean_fields(USER_FIELDS, row)
+                validate_meditrack_email(email)
+                if role not in ROLES:
+                    raise ValidationError(f'Unknown role "{role}".')
+                if role == 'doctor' and not specialization:
+                    raise ValidationError('Specialization is required for doctors.')
+                if username in taken_usernames:
+                    raise ValidationError(f'Username "{username}" already exists.')
+                if email.lower() in taken_emails:
+                    raise ValidationError('This email is already registered.')
+            except ValidationError as e:
+                errors.append((number, ' '.join(e.messages)))
+                continue
+            taken_usernames.add(username)
+            taken_emails.add(email.lower())
+            users.append(User(
+                **fields,
+                email=email,
+                role=role,
+                specialization=specialization,
+                password=self.password,
+            ))
+        return users, errors
+
+    def save(self, objects, batch_size):
+        User.objects.bulk_create(objects, batch_size=batch_size)
+
+    def finish(self):
+        # bulk_create skips the post_save signal that normally does this
+        directory.invalidate()
+
+
+class AppointmentImporter:
+    def build(self, batch):
+        batch, errors = split_invalid(batch)
+        usernames = set()
+        for number, row in batch:
+            usernames.update(value(row, field) for field in ('patient', 'preferred_doctor', 'doctor'))
+        users = {
+            username: (pk, role, is_active)
+            for username, pk, role, is_active in User.objects.filter(username__in=usernames)
+            .values_list('username', 'id', 'role', 'is_active')
+        }
+        parsed = []
+        for number, row in batch:
+            try:
+                parsed.append((number, self.parse(row, users)))
+            except (ValidationError, ValueError) as e:
+                message = ' '.join(e.messages) if isinstance(e, ValidationError) else str(e)
+                errors.append((number, message))
+
+        # Bookings already in the database for the patients/days and doctor
+        # slots in this batch, for the per-day limit and double booking.
+        patients = {appointment.patient_id for number, appointment in parsed}
+        dates = {appointment.appointment_date for number, appointment in parsed}
+        existing = Appointment.objects.filter(patient_id__in=patients, appointment_date__in=dates)
+        day_slots = {}
+        for patient_id, date, day_slot in existing.values_list('patient_id', 'appointment_date', 'day_slot'):
+            day_slots.setdefault((patient_id, date), set()).add(day_slot)
+        booked = set(
+            Appointment.objects.filter(
+                preferred_doctor_id__in={appointment.preferred_doctor_id for number, appointment in parsed},
+                appointment_date__in=dates,
+                status__in=ACTIVE_STATUSES,
+            ).values_list('preferred_doctor_id', 'appointment_date', 'appointment_time')
+        )
+
+        appointments = []
+        for number, appointment in parsed:
+            key = (appointment.patient_id, appointment.appointment_date)
+            taken = day_slots.setdefault(key, set())
+            free = [slot for slot in range(1, MAX_APPOINTMENTS_PER_DAY + 1) if slot not in taken]
+            if not free:
+                errors.append((number, f'Patient already has {MAX_APPOINTMENTS_PER_DAY} appointments on this day.'))
+                continue
+            doctor_slot = (appointment.preferred_doctor_id, appointment.appointment_date, appointment.appointment_time)
+            if appointment.status in ACTIVE_STATUSES and appointment.preferred_doctor_id:
+                if doctor_slot in booked:
+                    errors.append((number, 'This doctor is already booked at that time.'))
+                    continue
+                booked.add(doctor_slot)
+            appointment.day_slot = free[0]
+            taken.add(free[0])
+            appointments.append(appointment)
+        return appointments, errors
+
+    def parse(self, row, users):
+        def user_id(field, role, required=False):
+            username = value(row, field)
+            if not username:
+                if required:
+                    raise ValidationError(f'{field} is required.')
+                return None
+            if username not in users:
+                raise ValidationError(f'Unknown user "{username}" in {field}.')
+            pk, user_role, is_active = users[username]
+            # As in AppointmentForm: patients book, active doctors are booked
+            if user_role != role or (role == 'doctor' and not is_active):
+                raise ValidationError(f'"{username}" in {field} is not an active {role}.')
+            return pk
+
+        appointment_time = datetime.time.fromisoformat(value(row, 'appointment_time'))
+        validate_appointment_time(appointment_time)
+        health_concern = value(row, 'health_concern')
+        if not health_concern or len(health_concern) > 200:
+            raise ValidationError('Health concern is required (max 200 characters).')
+        status = value(row, 'status') or 'pending'
+        if status not in STATUSES:
+            raise ValidationError(f'Unknown status "{status}".')
+        return Appointment(
+            patient_id=user_id('patient', 'patient', required=True),
+            preferred_doctor_id=user_id('preferred_doctor', 'doctor'),
+            doctor_id=user_id('doctor', 'doctor'),
+            appointment_date=datetime.date.fromisoformat(value(row, 'appointment_date')),
+            appointment_time=appointment_time,
+            health_concern=health_concern,
+            status=status,
+        )
+
+    def save(self, objects, batch_size):
+        Appointment.objects.bulk_create(objects, batch_size=batch_size)
+
+    def finish(self):
+        # Counters and slot maps are rebuilt once instead of per row
+        call_command('rebuild_appointment_stats', stdout=io.StringIO())
+        call_command('rebuild_rating_summaries', stdout=io.StringIO())
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        slots.rebuild()
+
+
+class Command(BaseCommand):
+    help = 'Stream users or appointments from a CSV/JSONL file into the database in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='.csv or .jsonl file, optionally gzipped (.csv.gz, .jsonl.gz).')
+        parser.add_argument('--kind', choices=['users', 'appointments'], required=True)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--checkpoint', help='Progress file (default: <path>.checkpoint).')
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint.')
+        parser.add_argument('--password', default=None,
+                            help='Password for every imported user (default: unusable password).')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        checkpoint = options['checkpoint'] or f'{path}.checkpoint'
+        importer = UserImporter(options['password']) if options['kind'] == 'users' else AppointmentImporter()
+
+        done = 0
+        if os.path.exists(checkpoint) and not options['restart']:
+            with open(checkpoint) as handle:
+                done = json.load(handle)['rows']
+            self.stdout.write(f'Resuming after row {done}.')
+
+        started = time.monotonic()
+        imported, skipped = 0, Counter()
+        rows = ((number, row) for number, row in enumerate(read_rows(path), start=1) if number > done)
+        for batch in batches(rows, options['batch_size']):
+            objects, errors = importer.build(batch)
+            try:
+                with transaction.atomic():
+                    importer.save(objects, options['batch_size'])
+                    # Last step before the commit, so a crash can't leave
+                    # the batch committed but unrecorded (and imported
+                    # twice on resume)
+                    self.save_checkpoint(checkpoint, batch[-1][0])
+            except BaseException:
+                # The batch rolled back: point the checkpoint back at it
+                self.save_checkpoint(checkpoint, done)
+                raise
+            done = batch[-1][0]
+
+            imported += len(objects)
+            for number, message in sorted(errors):
+                skipped[message] += 1
+                self.stderr.write(f'Row {number}: {message}')
+            elapsed = time.monotonic() - started
+            self.stdout.write(f'{done} rows read, {imported} imported, {imported / elapsed:.0f} rows/s')
+
+        importer.finish()
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported} {options["kind"]} in {elapsed:.1f}s '
+            f'({imported / elapsed if elapsed else 0:.0f} rows/s), skipped {sum(skipped.values())}.'
+        ))
+
+    def save_checkpoint(self, checkpoint, rows):
+        # Write-then-rename so a crash never leaves a half-written checkpoint
+        with open(f'{checkpoint}.tmp', 'w') as handle:
+            json.dump({'rows': rows}, handle)
+        os.replace(f'{checkpoint}.tmp', checkpoint)
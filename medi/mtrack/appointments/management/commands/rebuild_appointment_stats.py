@@ -0,0 +1,25 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from appointments.models import AppointmentStats
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per-user appointment counters used by the dashboard.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help='Only rebuild these users (default: everyone).')
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(role__in=['patient', 'doctor'])
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+        rebuilt = 0
+        for user in users.iterator():
+            with transaction.atomic():
+                AppointmentStats.rebuild(user)
+            rebuilt += 1
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt stats for {rebuilt} users.'))
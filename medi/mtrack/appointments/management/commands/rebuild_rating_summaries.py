@@ -0,0 +1,25 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from appointments.models import DoctorRatingSummary
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per-doctor rating summaries from Feedback.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help='Only rebuild these doctors (default: every doctor).')
+
+    def handle(self, *args, **options):
+        doctors = User.objects.filter(role='doctor')
+        if options['usernames']:
+            doctors = doctors.filter(username__in=options['usernames'])
+        rebuilt = 0
+        for doctor in doctors.iterator():
+            with transaction.atomic():
+                DoctorRatingSummary.rebuild(doctor)
+            rebuilt += 1
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rating summaries for {rebuilt} doctors.'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from appointments import slots
+
+
+class Command(BaseCommand):
+    help = "Recompute every doctor's free/busy slot bitmaps from open appointments."
+
+    def handle(self, *args, **options):
+        rows = slots.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} doctor-day slot maps.'))
@@ -0,0 +1,155 @@
+import datetime
+import io
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from accounts import directory
+from appointments import slots
+from appointments.models import MAX_APPOINTMENTS_PER_DAY, Appointment, Feedback, Prescription
+
+User = get_user_model()
+
+SPECIALIZATIONS = [
+    'General Practice', 'Cardiology', 'Dermatology', 'Pediatrics', 'Orthopedics',
+    'Neurology', 'Psychiatry', 'ENT', 'Ophthalmology', 'Gynecology',
+]
+CONCERNS = [
+    'Persistent headache', 'Seasonal allergies', 'Lower back pain', 'Follow-up visit',
+    'Skin rash', 'High blood pressure', 'Sore throat and fever', 'Trouble sleeping',
+    'Knee pain after running', 'Annual check-up', 'Chest tightness', 'Blurred vision',
+]
+MEDICINES = ['Paracetamol', 'Ibuprofen', 'Amoxicillin', 'Cetirizine', 'Omeprazole', 'Metformin']
+FREQUENCIES = ['Once daily', 'Twice daily', 'Three times daily', 'As needed']
+
+# Past appointments are mostly completed; a few were never closed out.
+PAST_STATUSES = (['completed', 'confirmed', 'in_progress', 'pending'], [80, 8, 2, 10])
+UPCOMING_STATUSES = (['pending', 'confirmed'], [55, 45])
+PRESCRIPTION_SHARE = 0.9
+FEEDBACK_SHARE = 0.6
+RATINGS = ([1, 2, 3, 4, 5], [4, 6, 15, 35, 40])
+DAYS_BACK, DAYS_AHEAD = 180, 30
+
+
+def popularity(count):
+    # A few doctors (and frequent patients) get most of the bookings
+    return [1 / (rank + 1) for rank in range(count)]
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic doctors, patients and appointments for benchmarking.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=20)
+        parser.add_argument('--patients', type=int, default=200)
+        parser.add_argument('--appointments', type=int, default=2000)
+        parser.add_argument('--prefix', default='seed', help='Username prefix for generated accounts.')
+        parser.add_argument('--password', default='meditrack-seed')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed, for repeatable data sets.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}-').exists():
+            raise CommandError(f'Accounts with prefix "{prefix}" already exist; pass another --prefix.')
+        if options['doctors'] < 1 or options['patients'] < 1:
+            raise CommandError('Need at least one doctor and one patient.')
+        rng = random.Random(options['seed'])
+        started = time.monotonic()
+
+        with transaction.atomic():
+            doctors, patients = self.create_users(rng, prefix, options)
+            appointments = self.create_appointments(rng, doctors, patients, options)
+            self.create_records(rng, appointments, options['batch_size'])
+
+        # bulk_create skips the signals and hooks that keep these in sync
+        call_command('rebuild_appointment_stats', stdout=io.StringIO())
+        call_command('rebuild_rating_summaries', stdout=io.StringIO())
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        slots.rebuild()
+        directory.invalidate()
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(doctors)} doctors, {len(patients)} patients and '
+            f'{len(appointments)} appointments in {time.monotonic() - started:.1f}s.'
+        ))
+
+    def create_users(self, rng, prefix, options):
+        # One hash for every account: hashing per user would dominate the run
+        password = make_password(options['password'])
+        users = [
+            User(username=f'{prefix}-doctor-{n}', email=f'{prefix}-doctor-{n}@meditrack.local',
+                 first_name='Doctor', last_name=str(n), role='doctor',
+                 specialization=rng.choice(SPECIALIZATIONS), password=password)
+            for n in range(options['doctors'])
+        ] + [
+            User(username=f'{prefix}-patient-{n}', email=f'{prefix}-patient-{n}@meditrack.local',
+                 first_name='Patient', last_name=str(n), role='patient', password=password)
+            for n in range(options['patients'])
+        ]
+        User.objects.bulk_create(users, batch_size=options['batch_size'])
+        # Re-read for primary keys on backends that don't return them
+        created = User.objects.filter(username__startswith=f'{prefix}-').order_by('id')
+        doctors = [user.id for user in created if user.role == 'doctor']
+        patients = [user.id for user in created if user.role == 'patient']
+        return doctors, patients
+
+    def create_appointments(self, rng, doctors, patients, options):
+        today = datetime.date.today()
+        doctor_weights, patient_weights = popularity(len(doctors)), popularity(len(patients))
+        patient_days = {}   # (patient, date) -> bookings, for the per-day limit
+        doctor_slots = set()  # (doctor, date, slot), for double booking
+
+        appointments = []
+        attempts = 0
+        while len(appointments) < options['appointments']:
+            attempts += 1
+            if attempts > options['appointments'] * 20:
+                raise CommandError('Not enough free slots; add doctors/patients or lower --appointments.')
+            doctor = rng.choices(doctors, doctor_weights)[0]
+            patient = rng.choices(patients, patient_weights)[0]
+            date = today + datetime.timedelta(days=rng.randint(-DAYS_BACK, DAYS_AHEAD))
+            slot = rng.randrange(slots.SLOTS_PER_DAY)
+            booked = patient_days.get((patient, date), 0)
+            if booked >= MAX_APPOINTMENTS_PER_DAY or (doctor, date, slot) in doctor_slots:
+                continue
+            patient_days[(patient, date)] = booked + 1
+            doctor_slots.add((doctor, date, slot))
+
+            status = rng.choices(*(PAST_STATUSES if date < today else UPCOMING_STATUSES))[0]
+            appointments.append(Appointment(
+                patient_id=patient,
+                preferred_doctor_id=doctor,
+                doctor_id=None if status == 'pending' else doctor,
+                appointment_date=date,
+                appointment_time=slots.slot_time(slot),
+                health_concern=rng.choice(CONCERNS),
+                status=status,
+                day_slot=booked + 1,
+            ))
+        return Appointment.objects.bulk_create(appointments, batch_size=options['batch_size'])
+
+    def create_records(self, rng, appointments, batch_size):
+        completed = [appointment for appointment in appointments if appointment.status == 'completed']
+        Prescription.objects.bulk_create([
+            Prescription(
+                appointment=appointment,
+                medicine_names=', '.join(rng.sample(MEDICINES, rng.randint(1, 3))),
+                dosage_instructions='Take after meals.',
+                frequency=rng.choice(FREQUENCIES),
+            )
+            for appointment in completed if rng.random() < PRESCRIPTION_SHARE
+        ], batch_size=batch_size)
+        Feedback.objects.bulk_create([
+            Feedback(
+                appointment=appointment,
+                patient_id=appointment.patient_id,
+                doctor_id=appointment.doctor_id,
+                rating=rng.choices(*RATINGS)[0],
+            )
+            for appointment in completed if rng.random() < FEEDBACK_SHARE
+        ], batch_size=batch_size)
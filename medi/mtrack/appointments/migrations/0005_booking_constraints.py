@@ -0,0 +1,92 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:51
+
+from django.db import migrations, models
+from django.db.models import Count
+
+MAX_APPOINTMENTS_PER_DAY = 2
+ACTIVE_STATUSES = ['pending', 'confirmed', 'in_progress']
+
+
+def resolve_conflicts(apps, schema_editor):
+    # Rows from before booking.book() may break the constraints below.
+    # Deleting bookings isn't ours to decide, so too many for one patient
+    # and day stops the migration with their ids.
+    Appointment = apps.get_model('appointments', 'Appointment')
+    appointments = Appointment.objects.using(schema_editor.connection.alias)
+    crowded = (
+        appointments.values('patient_id', 'appointment_date')
+        .annotate(count=Count('id'))
+        .filter(count__gt=MAX_APPOINTMENTS_PER_DAY)
+    )
+    problems = []
+    for group in crowded:
+        ids = appointments.filter(
+            patient_id=group['patient_id'], appointment_date=group['appointment_date'],
+        ).order_by('created_at', 'id').values_list('id', flat=True)
+        problems.append(f"patient {group['patient_id']} on {group['appointment_date']}: {', '.join(map(str, ids))}")
+    if problems:
+        raise RuntimeError(
+            f'More than {MAX_APPOINTMENTS_PER_DAY} appointments per patient and day; '
+            'remove or move these before migrating:\n' + '\n'.join(problems)
+        )
+
+    # Double-booked doctors keep the earliest booking; the later ones go
+    # back to "any doctor" for the admin to assign.
+    last_key, clashing = None, []
+    rows = appointments.filter(status__in=ACTIVE_STATUSES, preferred_doctor__isnull=False).order_by(
+        'preferred_doctor_id', 'appointment_date', 'appointment_time', 'created_at', 'id',
+    )
+    for appointment in rows.only('id', 'preferred_doctor_id', 'appointment_date', 'appointment_time').iterator():
+        key = (appointment.preferred_doctor_id, appointment.appointment_date, appointment.appointment_time)
+        if key == last_key:
+            clashing.append(appointment.id)
+        last_key = key
+    appointments.filter(id__in=clashing).update(preferred_doctor=None)
+
+
+def number_day_slots(apps, schema_editor):
+    # Existing bookings take slots 1, 2, ... per patient and day in booking order
+    Appointment = apps.get_model('appointments', 'Appointment')
+    db_alias = schema_editor.connection.alias
+    last_key, slot = None, 0
+    rows = Appointment.objects.using(db_alias).order_by('patient_id', 'appointment_date', 'created_at', 'id')
+    for appointment in rows.only('id', 'patient_id', 'appointment_date').iterator():
+        key = (appointment.patient_id, appointment.appointment_date)
+        slot = slot + 1 if key == last_key else 1
+        last_key = key
+        if slot != 1:
+            Appointment.objects.using(db_alias).filter(id=appointment.id).update(day_slot=slot)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0004_appointment_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(resolve_conflicts, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='appointment',
+            name='day_slot',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+        migrations.RunPython(number_day_slots, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(fields=('patient', 'appointment_date', 'day_slot'), name='appt_patient_day_slot_uniq'),
+        ),
+        # The constraint's index starts with (patient, appointment_date)
+        migrations.RemoveIndex(
+            model_name='appointment',
+            name='appt_patient_date_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.CheckConstraint(check=models.Q(('day_slot__gte', 1), ('day_slot__lte', 2)), name='appt_day_slot_range'),
+        ),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['pending', 'confirmed', 'in_progress'])), fields=('preferred_doctor', 'appointment_date', 'appointment_time'), name='appt_doctor_slot_uniq'),
+        ),
+    ]
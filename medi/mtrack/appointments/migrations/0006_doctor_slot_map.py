@@ -0,0 +1,50 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:54
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_slot_maps(apps, schema_editor):
+    # slots.rebuild() as of this migration: one bit per 30 minute slot from
+    # 9:00, set for every doctor holding an open appointment
+    Appointment = apps.get_model('appointments', 'Appointment')
+    DoctorSlotMap = apps.get_model('appointments', 'DoctorSlotMap')
+    db_alias = schema_editor.connection.alias
+    rows = Appointment.objects.using(db_alias).filter(status__in=['pending', 'confirmed', 'in_progress']).order_by()
+    busy = {}
+    for doctor_id, preferred_id, date, time in rows.values_list(
+        'doctor_id', 'preferred_doctor_id', 'appointment_date', 'appointment_time'
+    ).iterator():
+        bit = 1 << ((time.hour - 9) * 60 + time.minute) // 30
+        for holder in {doctor_id, preferred_id} - {None}:
+            busy[holder, date] = busy.get((holder, date), 0) | bit
+    DoctorSlotMap.objects.using(db_alias).bulk_create(
+        [DoctorSlotMap(doctor_id=doctor_id, date=date, busy=bits) for (doctor_id, date), bits in busy.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('appointments', '0005_booking_constraints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorSlotMap',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('busy', models.BigIntegerField(default=0)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_maps', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='doctorslotmap',
+            constraint=models.UniqueConstraint(fields=('doctor', 'date'), name='slotmap_doctor_date_uniq'),
+        ),
+        migrations.RunPython(fill_slot_maps, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:11
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+import django.db.models.deletion
+
+
+def fill_rating_summaries(apps, schema_editor):
+    # One grouped aggregate over Feedback, one bulk insert
+    Feedback = apps.get_model('appointments', 'Feedback')
+    DoctorRatingSummary = apps.get_model('appointments', 'DoctorRatingSummary')
+    db_alias = schema_editor.connection.alias
+    rows = Feedback.objects.using(db_alias).order_by().values('doctor_id').annotate(
+        rating_count=Count('id'),
+        rating_sum=Sum('rating'),
+        **{f'stars_{stars}': Count('id', filter=Q(rating=stars)) for stars in range(1, 6)}
+    )
+    DoctorRatingSummary.objects.using(db_alias).bulk_create([
+        DoctorRatingSummary(average_rating=row['rating_sum'] / row['rating_count'], **row)
+        for row in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_user_specialization'),
+        ('appointments', '0007_export_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorRatingSummary',
+            fields=[
+                ('doctor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_summary', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('rating_count', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.PositiveIntegerField(default=0)),
+                ('stars_1', models.PositiveIntegerField(default=0)),
+                ('stars_2', models.PositiveIntegerField(default=0)),
+                ('stars_3', models.PositiveIntegerField(default=0)),
+                ('stars_4', models.PositiveIntegerField(default=0)),
+                ('stars_5', models.PositiveIntegerField(default=0)),
+                ('average_rating', models.FloatField(default=0)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-average_rating', '-rating_count', 'doctor'], name='rating_top_idx')],
+            },
+        ),
+        migrations.RunPython(fill_rating_summaries, migrations.RunPython.noop),
+        # Ratings now live in DoctorRatingSummary
+        migrations.RemoveField(
+            model_name='appointmentstats',
+            name='rating_count',
+        ),
+        migrations.RemoveField(
+            model_name='appointmentstats',
+            name='rating_sum',
+        ),
+    ]
@@ -0,0 +1,70 @@
+from django.conf import settings
+from django.db import migrations
+
+# appointments.search reads and writes this table with raw SQL; its shape
+# depends on the database. The documents below are written as search.py
+# wrote them when this migration was made, so later changes there don't
+# change what this migration does.
+SQLITE_CREATE = (
+    "CREATE VIRTUAL TABLE appointments_search USING fts5("
+    "appointment_id UNINDEXED, concern, prescription, people, tokenize = 'porter unicode61')"
+)
+POSTGRES_CREATE = [
+    "CREATE TABLE appointments_search ("
+    "appointment_id bigint PRIMARY KEY REFERENCES appointments_appointment (id) ON DELETE CASCADE"
+    " DEFERRABLE INITIALLY DEFERRED, document tsvector NOT NULL)",
+    "CREATE INDEX appointments_search_document_idx ON appointments_search USING gin (document)",
+]
+SQLITE_FILL = (
+    "INSERT INTO appointments_search (appointment_id, concern, prescription, people)"
+    " SELECT a.id, a.health_concern,"
+    " COALESCE(p.medicine_names, '') || ' ' || COALESCE(p.dosage_instructions, ''),"
+    " u.first_name || ' ' || u.last_name || ' ' || u.username"
+    " FROM {appointment} a JOIN {user} u ON u.id = a.patient_id"
+    " LEFT JOIN {prescription} p ON p.appointment_id = a.id"
+)
+POSTGRES_FILL = (
+    "INSERT INTO appointments_search (appointment_id, document)"
+    " SELECT a.id,"
+    " setweight(to_tsvector('english', a.health_concern), 'A')"
+    " || setweight(to_tsvector('english', COALESCE(p.medicine_names, '') || ' '"
+    " || COALESCE(p.dosage_instructions, '')), 'B')"
+    " || setweight(to_tsvector('simple', u.first_name || ' ' || u.last_name || ' ' || u.username), 'C')"
+    " FROM {appointment} a JOIN {user} u ON u.id = a.patient_id"
+    " LEFT JOIN {prescription} p ON p.appointment_id = a.id"
+)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        create, fill = [SQLITE_CREATE], SQLITE_FILL
+    elif vendor == 'postgresql':
+        create, fill = POSTGRES_CREATE, POSTGRES_FILL
+    else:
+        return
+    for statement in create:
+        schema_editor.execute(statement)
+    tables = {
+        'appointment': apps.get_model('appointments', 'Appointment')._meta.db_table,
+        'prescription': apps.get_model('appointments', 'Prescription')._meta.db_table,
+        'user': apps.get_model(settings.AUTH_USER_MODEL)._meta.db_table,
+    }
+    schema_editor.execute(fill.format(**tables))
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute('DROP TABLE IF EXISTS appointments_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('appointments', '0008_doctor_rating_summary'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -1,13 +1,59 @@
 from django.db import models
+from django.db.models import Count, Q, Sum
 
 # Create your models here.
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
+from django.dispatch import Signal
 from django.utils import timezone
 import datetime
 
 User = get_user_model()
 
+# Columns the listing templates actually read. Everything else (e.g. the
+# related users' passwords and permissions) stays out of the SELECT.
+LIST_FIELDS = (
+    'id', 'appointment_date', 'appointment_time', 'health_concern', 'status',
+    'created_at', 'updated_at',
+    'patient__id', 'patient__first_name', 'patient__last_name',
+    'doctor__id', 'doctor__first_name', 'doctor__last_name',
+    'preferred_doctor__id', 'preferred_doctor__first_name', 'preferred_doctor__last_name',
+)
+
+# Length of a doctor's booking slot; appointments start on slot boundaries
+SLOT_MINUTES = 30
+
+def validate_appointment_time(time):
+    # Appointments run from 9 AM to 5 PM
+    if not (datetime.time(9, 0) <= time <= datetime.time(17, 0)):
+        raise ValidationError('Appointment time must be between 9:00 AM and 5:00 PM')
+    if time.minute % SLOT_MINUTES or time.second or time.microsecond:
+        raise ValidationError('Appointment time must be on the hour or half hour')
+
+MAX_APPOINTMENTS_PER_DAY = 2
+# Statuses that still occupy the doctor's time slot
+ACTIVE_STATUSES = ['pending', 'confirmed', 'in_progress']
+
+# Sent with instance and old_status after a status change made with
+# update(), which skips post_save: transition_to() and bulk.transition()
+status_changed = Signal()
+
+class AppointmentQuerySet(models.QuerySet):
+    def for_listing(self):
+        return self.select_related('patient', 'doctor', 'preferred_doctor').only(*LIST_FIELDS)
+
+    def with_records(self):
+        return self.prefetch_related('prescription', 'feedback')
+
+    def for_patient(self, user):
+        return self.filter(patient=user).for_listing().order_by('-created_at', '-id')
+
+    def for_doctor(self, user):
+        return self.filter(doctor=user).for_listing().order_by('-created_at', '-id')
+
+    def pending_queue(self):
+        return self.filter(status='pending').for_listing().order_by('-created_at', '-id')
+
 class Appointment(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -15,6 +61,13 @@ class Appointment(models.Model):
         ('in_progress', 'In Progress'),
         ('completed', 'Completed'),
     ]
+    # Bootstrap badge colour per status, so templates don't branch on it
+    STATUS_BADGES = {
+        'pending': 'secondary',
+        'confirmed': 'info',
+        'in_progress': 'warning',
+        'completed': 'success',
+    }
     
     patient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='patient_appointments')
     doctor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='doctor_appointments', null=True, blank=True)
@@ -25,26 +78,85 @@ class Appointment(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Which of the patient's daily booking slots this appointment uses; the
+    # constraints below cap a patient at MAX_APPOINTMENTS_PER_DAY a day.
+    day_slot = models.PositiveSmallIntegerField(default=1)
+
+    objects = AppointmentQuerySet.as_manager()
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Dashboard counts for doctors and the preferred-doctor queue
+            models.Index(fields=['doctor', 'status'], name='appt_doctor_status_idx'),
+            models.Index(fields=['preferred_doctor', 'status'], name='appt_preferred_status_idx'),
+            # Date-range exports, optionally for one doctor
+            models.Index(fields=['appointment_date'], name='appt_date_idx'),
+            models.Index(fields=['doctor', 'appointment_date'], name='appt_doctor_date_idx'),
+            # Keyset-paginated listings, newest first
+            models.Index(fields=['patient', '-created_at', '-id'], name='appt_patient_created_idx'),
+            models.Index(fields=['doctor', '-created_at', '-id'], name='appt_doctor_created_idx'),
+            # Doctors' pending queue
+            models.Index(
+                fields=['-created_at', '-id'],
+                condition=models.Q(status='pending'),
+                name='appt_pending_created_idx',
+            ),
+        ]
+        constraints = [
+            # Also the index behind the two-per-day check in book_appointment
+            models.UniqueConstraint(
+                fields=['patient', 'appointment_date', 'day_slot'],
+                name='appt_patient_day_slot_uniq',
+            ),
+            models.CheckConstraint(
+                check=models.Q(day_slot__gte=1, day_slot__lte=MAX_APPOINTMENTS_PER_DAY),
+                name='appt_day_slot_range',
+            ),
+            # A doctor can only hold one open appointment per time slot
+            models.UniqueConstraint(
+                fields=['preferred_doctor', 'appointment_date', 'appointment_time'],
+                condition=models.Q(status__in=ACTIVE_STATUSES),
+                name='appt_doctor_slot_uniq',
+            ),
+        ]
     
+    @property
+    def badge_class(self):
+        return self.STATUS_BADGES.get(self.status, 'secondary')
+
     def clean(self):
         # Validate appointment time (9 AM to 5 PM)
         if self.appointment_time:
-            start_time = datetime.time(9, 0)
-            end_time = datetime.time(17, 0)
-            if not (start_time <= self.appointment_time <= end_time):
-                raise ValidationError('Appointment time must be between 9:00 AM and 5:00 PM')
+            validate_appointment_time(self.appointment_time)
     
+    TRANSITIONS = {
+        'pending': ['confirmed'],
+        'confirmed': ['in_progress'],
+        'in_progress': ['completed'],
+        'completed': []
+    }
+
     def can_transition_to(self, new_status):
-        transitions = {
-            'pending': ['confirmed'],
-            'confirmed': ['in_progress'],
-            'in_progress': ['completed'],
-            'completed': []
-        }
-        return new_status in transitions.get(self.status, [])
+        return new_status in self.TRANSITIONS.get(self.status, [])
+
+    def transition_to(self, new_status, condition=None, **changes):
+        # Compare-and-swap: a single UPDATE ... WHERE id = ? AND status = ?
+        # that only touches the changed columns. Returns False if the move
+        # isn't allowed or another request changed the status first.
+        if not self.can_transition_to(new_status):
+            return False
+        changes.update(status=new_status, updated_at=timezone.now())
+        rows = Appointment.objects.filter(pk=self.pk, status=self.status)
+        if condition is not None:
+            rows = rows.filter(condition)
+        if not rows.update(**changes):
+            return False
+        old_status = self.status
+        for field, value in changes.items():
+            setattr(self, field, value)
+        status_changed.send(sender=Appointment, instance=self, old_status=old_status, using=rows.db)
+        return True
     
     def __str__(self):
         return f"{self.patient.get_full_name()} - {self.appointment_date} {self.appointment_time}"
@@ -68,4 +180,116 @@ class Feedback(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
-        return f"Feedback from {self.patient.get_full_name()} - Rating: {self.rating}"
\ No newline at end of file
+        return f"Feedback from {self.patient.get_full_name()} - Rating: {self.rating}"
+
+class AppointmentStats(models.Model):
+    # Denormalized per-user counters so the dashboard never scans Appointment
+    # or Feedback. Kept current by appointments.stats; rebuild with
+    # manage.py rebuild_appointment_stats.
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='appointment_stats')
+    pending_count = models.PositiveIntegerField(default=0)
+    confirmed_count = models.PositiveIntegerField(default=0)
+    in_progress_count = models.PositiveIntegerField(default=0)
+    completed_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def total_count(self):
+        return self.pending_count + self.confirmed_count + self.in_progress_count + self.completed_count
+
+    @classmethod
+    def compute(cls, user):
+        # One aggregate per role instead of a query per counter
+        counts = {
+            f'{status}_count': Count('id', filter=Q(status=status))
+            for status, label in Appointment.STATUS_CHOICES
+        }
+        if user.is_doctor():
+            return Appointment.objects.filter(doctor=user).order_by().aggregate(**counts)
+        return Appointment.objects.filter(patient=user).order_by().aggregate(**counts)
+
+    @classmethod
+    def rebuild(cls, user):
+        stats, created = cls.objects.update_or_create(user=user, defaults=cls.compute(user))
+        return stats
+
+    @classmethod
+    def for_user(cls, user):
+        return cls.objects.filter(user=user).first() or cls.rebuild(user)
+
+    def __str__(self):
+        return f"Stats for {self.user.get_full_name()}"
+
+
+STAR_FIELDS = {stars: f'stars_{stars}' for stars in range(1, 6)}
+
+
+class DoctorRatingSummary(models.Model):
+    # Per-doctor feedback aggregates, bumped in the transaction that saves
+    # each Feedback (appointments.stats.record_feedback); rebuild with
+    # manage.py rebuild_rating_summaries.
+    doctor = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='rating_summary')
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    stars_1 = models.PositiveIntegerField(default=0)
+    stars_2 = models.PositiveIntegerField(default=0)
+    stars_3 = models.PositiveIntegerField(default=0)
+    stars_4 = models.PositiveIntegerField(default=0)
+    stars_5 = models.PositiveIntegerField(default=0)
+    # Stored rather than computed so the top-rated list is an index scan
+    average_rating = models.FloatField(default=0)
+    last_updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-average_rating', '-rating_count', 'doctor'], name='rating_top_idx'),
+        ]
+
+    @property
+    def histogram(self):
+        return [(stars, getattr(self, field)) for stars, field in STAR_FIELDS.items()]
+
+    @classmethod
+    def compute(cls, doctor):
+        values = Feedback.objects.filter(doctor=doctor).order_by().aggregate(
+            rating_count=Count('id'),
+            rating_sum=Sum('rating', default=0),
+            **{field: Count('id', filter=Q(rating=stars)) for stars, field in STAR_FIELDS.items()}
+        )
+        values['average_rating'] = values['rating_sum'] / values['rating_count'] if values['rating_count'] else 0
+        return values
+
+    @classmethod
+    def rebuild(cls, doctor):
+        summary, created = cls.objects.update_or_create(doctor=doctor, defaults=cls.compute(doctor))
+        return summary
+
+    @classmethod
+    def for_doctor(cls, doctor):
+        return cls.objects.filter(doctor=doctor).first() or cls(doctor=doctor)
+
+    @classmethod
+    def top_rated(cls, min_ratings=1):
+        return cls.objects.filter(rating_count__gte=min_ratings).select_related('doctor').order_by(
+            '-average_rating', '-rating_count', 'doctor'
+        )
+
+    def __str__(self):
+        return f"Ratings for {self.doctor.get_full_name()}"
+
+
+class DoctorSlotMap(models.Model):
+    # One row per doctor and day; bit n of busy is set while an open
+    # appointment occupies slot n (see appointments.slots). Days without a
+    # row are entirely free.
+    doctor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='slot_maps')
+    date = models.DateField()
+    busy = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['doctor', 'date'], name='slotmap_doctor_date_uniq'),
+        ]
+
+    def __str__(self):
+        return f"Slots for {self.doctor.get_full_name()} on {self.date}"
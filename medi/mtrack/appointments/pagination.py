@@ -0,0 +1,112 @@
+import base64
+import datetime
+
+from django.core.exceptions import BadRequest
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+PAGE_SIZE = 20
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def encode_cursor(appointment):
+    raw = f'{appointment.created_at.isoformat()}|{appointment.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        created_at, pk = raw.split('|')
+        return datetime.datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise BadRequest('Invalid page cursor.')
+
+
+def page_queryset(queryset, position=None):
+    # Newest first, with the id as a tie-breaker so rows created in the same
+    # instant are neither skipped nor repeated between pages. The
+    # "created_at <= x" bound lets the database seek straight into the
+    # (..., created_at, id) index instead of counting past earlier pages.
+    queryset = queryset.order_by('-created_at', '-id')
+    if position is not None:
+        created_at, pk = position
+        queryset = queryset.filter(
+            Q(created_at__lte=created_at),
+            Q(created_at__lt=created_at) | Q(id__lt=pk),
+        )
+    return queryset
+
+
+def _page(rows, per_page):
+    if len(rows) > per_page:
+        return KeysetPage(rows[:per_page], encode_cursor(rows[per_page - 1]))
+    return KeysetPage(rows)
+
+
+def paginate(queryset, cursor=None, per_page=PAGE_SIZE):
+    position = decode_cursor(cursor) if cursor else None
+    return _page(list(page_queryset(queryset, position)[:per_page + 1]), per_page)
+
+
+async def apaginate(queryset, cursor=None, per_page=PAGE_SIZE):
+    position = decode_cursor(cursor) if cursor else None
+    rows = [row async for row in page_queryset(queryset, position)[:per_page + 1].aiterator()]
+    return _page(rows, per_page)
+
+
+def estimated_count(model, using):
+    """A cheap row count for a whole table, or None if there's no estimate."""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # Kept current by autovacuum/ANALYZE
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+            row = cursor.fetchone()
+            return row[0] if row and row[0] is not None and row[0] >= 0 else None
+        if connection.vendor == 'sqlite':
+            # The row count ANALYZE last recorded, which leads each of the
+            # table's sqlite_stat1 rows; without ANALYZE there is none
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+            row = cursor.fetchone()
+            return int(row[0].split()[0]) if row and row[0] else None
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for the admin changelists. An unfiltered changelist over a
+    large table gets the planner's row estimate instead of a COUNT(*) scan
+    (on SQLite only once ANALYZE has run); filtered ones, which the
+    indexes narrow, are counted exactly.
+    """
+    threshold = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > self.threshold:
+                return estimate
+        return super().count
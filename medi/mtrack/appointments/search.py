@@ -0,0 +1,228 @@
+"""
+Full-text index over appointments: the health concern, the prescription
+(medicines and dosage) and the patient's name, one document per
+appointment in the appointments_search table.
+
+On SQLite that table is an FTS5 virtual table ranked with bm25(); on
+PostgreSQL it holds a weighted tsvector behind a GIN index. Other backends
+fall back to unranked LIKE matching. The table is created by migration
+0009, kept current by appointments.signals and rebuilt with
+manage.py rebuild_search_index.
+"""
+import re
+
+from django.db import connections, router
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Appointment, Prescription
+
+TABLE = 'appointments_search'
+PAGE_SIZE = 20
+# Match weights: concern, prescription, patient name
+WEIGHTS = (10.0, 5.0, 2.0)
+
+
+def terms(query):
+    # Words only: FTS5 and to_tsquery both have their own query syntax,
+    # which user input must not be able to reach.
+    return re.findall(r'\w+', query.lower())[:10]
+
+
+def _tables():
+    from django.contrib.auth import get_user_model
+    return {
+        'appointment': Appointment._meta.db_table,
+        'prescription': Prescription._meta.db_table,
+        'user': get_user_model()._meta.db_table,
+    }
+
+
+def _where_ids(ids, column='a.id'):
+    if ids is None:
+        return '', []
+    return f' WHERE {column} IN ({", ".join(["%s"] * len(ids))})', list(ids)
+
+
+class SQLiteBackend:
+    def documents_sql(self):
+        return (
+            "SELECT a.id, a.health_concern,"
+            " COALESCE(p.medicine_names, '') || ' ' || COALESCE(p.dosage_instructions, ''),"
+            " u.first_name || ' ' || u.last_name || ' ' || u.username"
+            " FROM {appointment} a"
+            " JOIN {user} u ON u.id = a.patient_id"
+            " LEFT JOIN {prescription} p ON p.appointment_id = a.id"
+        ).format(**_tables())
+
+    def reindex(self, cursor, ids=None):
+        where, params = _where_ids(ids, 'appointment_id')
+        cursor.execute(f'DELETE FROM {TABLE}{where}', params)
+        where, params = _where_ids(ids)
+        cursor.execute(
+            f'INSERT INTO {TABLE} (appointment_id, concern, prescription, people) {self.documents_sql()}{where}',
+            params,
+        )
+
+    def remove(self, cursor, ids):
+        where, params = _where_ids(ids, 'appointment_id')
+        cursor.execute(f'DELETE FROM {TABLE}{where}', params)
+
+    def match(self, words):
+        # Every word must match, as a prefix ("diab" finds "diabetes")
+        return ' '.join(f'"{word}"*' for word in words)
+
+    def matching_ids_sql(self, words):
+        return f'SELECT appointment_id FROM {TABLE} WHERE {TABLE} MATCH %s', [self.match(words)]
+
+    def ranked_sql(self, words, where):
+        # bm25() is lower for better matches; the first weight is for the
+        # unindexed appointment_id column
+        weights = ', '.join(str(weight) for weight in (0.0,) + WEIGHTS)
+        return (
+            f'SELECT {TABLE}.appointment_id, bm25({TABLE}, {weights}) AS score'
+            f' FROM {TABLE} JOIN {Appointment._meta.db_table} a ON a.id = {TABLE}.appointment_id'
+            f' WHERE {TABLE} MATCH %s AND {where} ORDER BY score, a.id DESC LIMIT %s OFFSET %s',
+            [self.match(words)],
+        )
+
+
+class PostgresBackend:
+    DOCUMENT = (
+        "setweight(to_tsvector('english', a.health_concern), 'A')"
+        " || setweight(to_tsvector('english', COALESCE(p.medicine_names, '') || ' '"
+        " || COALESCE(p.dosage_instructions, '')), 'B')"
+        " || setweight(to_tsvector('simple', u.first_name || ' ' || u.last_name || ' ' || u.username), 'C')"
+    )
+
+    def reindex(self, cursor, ids=None):
+        where, params = _where_ids(ids)
+        if ids is not None:
+            self.remove(cursor, ids)
+        else:
+            cursor.execute(f'TRUNCATE {TABLE}')
+        tables = _tables()
+        cursor.execute(
+            f'INSERT INTO {TABLE} (appointment_id, document) SELECT a.id, {self.DOCUMENT}'
+            f' FROM {tables["appointment"]} a JOIN {tables["user"]} u ON u.id = a.patient_id'
+            f' LEFT JOIN {tables["prescription"]} p ON p.appointment_id = a.id{where}',
+            params,
+        )
+
+    def remove(self, cursor, ids):
+        where, params = _where_ids(ids, 'appointment_id')
+        cursor.execute(f'DELETE FROM {TABLE}{where}', params)
+
+    def match(self, words):
+        return ' & '.join(f'{word}:*' for word in words)
+
+    def matching_ids_sql(self, words):
+        return f"SELECT appointment_id FROM {TABLE} WHERE document @@ to_tsquery('english', %s)", [self.match(words)]
+
+    def ranked_sql(self, words, where):
+        # Weights are listed D, C, B, A and must be in [0, 1]
+        weights = '{0, %s, %s, %s}' % tuple(weight / WEIGHTS[0] for weight in reversed(WEIGHTS))
+        return (
+            f"SELECT s.appointment_id, ts_rank_cd('{weights}', s.document, query) AS score"
+            f" FROM {TABLE} s JOIN {Appointment._meta.db_table} a ON a.id = s.appointment_id,"
+            " to_tsquery('english', %s) query"
+            f" WHERE s.document @@ query AND {where} ORDER BY score DESC, a.id DESC LIMIT %s OFFSET %s",
+            [self.match(words)],
+        )
+
+
+class LikeBackend:
+    # No index: match each word against the same fields with LIKE
+    def reindex(self, cursor, ids=None):
+        pass
+
+    def remove(self, cursor, ids):
+        pass
+
+    def filter(self, words):
+        condition = Q()
+        for word in words:
+            condition &= (
+                Q(health_concern__icontains=word)
+                | Q(prescription__medicine_names__icontains=word)
+                | Q(prescription__dosage_instructions__icontains=word)
+                | Q(patient__first_name__icontains=word)
+                | Q(patient__last_name__icontains=word)
+                | Q(patient__username__icontains=word)
+            )
+        return condition
+
+
+BACKENDS = {'sqlite': SQLiteBackend, 'postgresql': PostgresBackend}
+
+
+def backend(using):
+    return BACKENDS.get(connections[using].vendor, LikeBackend)()
+
+
+def _using(using=None):
+    return using or router.db_for_write(Appointment)
+
+
+def reindex(ids=None, using=None):
+    """Rewrite the documents for these appointment ids (default: all)."""
+    using = _using(using)
+    if ids is not None:
+        ids = list(ids)
+        if not ids:
+            return
+    with connections[using].cursor() as cursor:
+        backend(using).reindex(cursor, ids)
+
+
+def remove(ids, using=None):
+    using = _using(using)
+    with connections[using].cursor() as cursor:
+        backend(using).remove(cursor, list(ids))
+
+
+def filter_queryset(queryset, query):
+    """Narrow an Appointment queryset to matches, unranked (for the admin)."""
+    words = terms(query)
+    if not words:
+        return queryset
+    index = backend(queryset.db)
+    if isinstance(index, LikeBackend):
+        return queryset.filter(id__in=Appointment.objects.filter(index.filter(words)).values('id'))
+    sql, params = index.matching_ids_sql(words)
+    return queryset.filter(id__in=RawSQL(sql, params))
+
+
+def search(query, doctor, page=1, per_page=PAGE_SIZE):
+    """
+    Best matches first among the doctor's appointments (assigned or
+    preferred). Returns the page's appointments, each with a .score, and
+    whether more follow.
+    """
+    words = terms(query)
+    if not words:
+        return [], False
+    offset = (page - 1) * per_page
+    using = router.db_for_read(Appointment)
+    index = backend(using)
+    if isinstance(index, LikeBackend):
+        rows = list(
+            Appointment.objects.filter(Q(doctor=doctor) | Q(preferred_doctor=doctor), index.filter(words))
+            .for_listing().distinct().order_by('-created_at', '-id')[offset:offset + per_page + 1]
+        )
+        for row in rows:
+            row.score = None
+        return rows[:per_page], len(rows) > per_page
+
+    # Rank and page inside the index, then load just that page's rows
+    sql, params = index.ranked_sql(words, '(a.doctor_id = %s OR a.preferred_doctor_id = %s)')
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, params + [doctor.pk, doctor.pk, per_page + 1, offset])
+        ranked = cursor.fetchall()
+    appointments = Appointment.objects.using(using).for_listing().in_bulk([pk for pk, score in ranked[:per_page]])
+    rows = []
+    for pk, score in ranked[:per_page]:
+        appointment = appointments[pk]
+        appointment.score = score
+        rows.append(appointment)
+    return rows, len(ranked) > per_page
@@ -0,0 +1,63 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import events, tasks
+from .models import Appointment, Feedback, Prescription, status_changed
+
+User = get_user_model()
+
+
+# Keep the full-text documents in step with the rows they are built from,
+# off the request (see appointments/tasks.py). Bulk paths (bulk_create,
+# update()) skip these and rebuild the index instead.
+
+@receiver(post_save, sender=Appointment)
+def appointment_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields and 'health_concern' not in update_fields and 'patient' not in update_fields:
+        return
+    tasks.reindex_search.delay([instance.pk])
+
+
+@receiver(post_delete, sender=Appointment)
+def appointment_deleted(sender, instance, **kwargs):
+    tasks.remove_from_search.delay([instance.pk])
+
+
+@receiver(post_save, sender=Prescription)
+@receiver(post_delete, sender=Prescription)
+def prescription_changed(sender, instance, **kwargs):
+    tasks.reindex_search.delay([instance.appointment_id])
+
+
+@receiver(post_save, sender=User)
+def patient_renamed(sender, instance, update_fields=None, **kwargs):
+    if instance.role != 'patient' or kwargs['created']:
+        return
+    if update_fields and not {'first_name', 'last_name', 'username'} & set(update_fields):
+        return
+    tasks.reindex_patient.delay(instance.pk)
+
+
+@receiver(post_save, sender=Prescription)
+@receiver(post_save, sender=Feedback)
+def record_attached(sender, instance, created, **kwargs):
+    # The API's ETag/Last-Modified and the cached list rows key on
+    # updated_at, so a new prescription or feedback counts as a change
+    if created:
+        Appointment.objects.using(kwargs['using']).filter(pk=instance.appointment_id).update(updated_at=timezone.now())
+
+
+# Live updates for open pages, sent once the change commits
+
+@receiver(post_save, sender=Appointment)
+def appointment_published(sender, instance, update_fields=None, **kwargs):
+    if update_fields and 'status' not in update_fields and 'doctor' not in update_fields:
+        return
+    events.publish(instance, using=kwargs['using'])
+
+
+@receiver(status_changed, sender=Appointment)
+def status_published(sender, instance, old_status, using, **kwargs):
+    events.publish(instance, old_status, using=using)
@@ -0,0 +1,120 @@
+import datetime
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import ACTIVE_STATUSES, SLOT_MINUTES, Appointment, DoctorSlotMap
+
+# Bookable times run from 9:00 to 17:00 inclusive in 30 minute slots
+DAY_START = datetime.time(9, 0)
+SLOTS_PER_DAY = 17
+SEARCH_DAYS = 60
+
+
+def slot_number(time):
+    minutes = (time.hour - DAY_START.hour) * 60 + time.minute - DAY_START.minute
+    return minutes // SLOT_MINUTES
+
+
+def slot_time(number):
+    minutes = DAY_START.hour * 60 + DAY_START.minute + number * SLOT_MINUTES
+    return datetime.time(minutes // 60, minutes % 60)
+
+
+def _busy_doctors(appointment):
+    return {doctor_id for doctor_id in (appointment.doctor_id, appointment.preferred_doctor_id) if doctor_id}
+
+
+def mark_busy(doctor_id, date, time):
+    mask = 1 << slot_number(time)
+    if DoctorSlotMap.objects.filter(doctor_id=doctor_id, date=date).update(busy=F('busy').bitor(mask)):
+        return
+    try:
+        with transaction.atomic():
+            DoctorSlotMap.objects.create(doctor_id=doctor_id, date=date, busy=mask)
+    except IntegrityError:
+        # Another booking created the row first
+        DoctorSlotMap.objects.filter(doctor_id=doctor_id, date=date).update(busy=F('busy').bitor(mask))
+
+
+def release(doctor_id, date, time):
+    number = slot_number(time)
+    start, end = slot_time(number), slot_time(number + 1)
+    still_busy = Appointment.objects.filter(
+        Q(doctor_id=doctor_id) | Q(preferred_doctor_id=doctor_id),
+        appointment_date=date,
+        appointment_time__gte=start,
+        appointment_time__lt=end,
+        status__in=ACTIVE_STATUSES,
+    ).exists()
+    if not still_busy:
+        DoctorSlotMap.objects.filter(doctor_id=doctor_id, date=date).update(busy=F('busy').bitand(~(1 << number)))
+
+
+def record_booking(appointment):
+    for doctor_id in _busy_doctors(appointment):
+        mark_busy(doctor_id, appointment.appointment_date, appointment.appointment_time)
+
+
+def record_transition(appointment):
+    # Accepting may assign a doctor other than the preferred one; completing
+    # frees the slot for everyone who was holding it.
+    if appointment.status in ACTIVE_STATUSES:
+        record_booking(appointment)
+    else:
+        for doctor_id in _busy_doctors(appointment):
+            release(doctor_id, appointment.appointment_date, appointment.appointment_time)
+
+
+def is_free(doctor_id, date, time):
+    busy = DoctorSlotMap.objects.filter(doctor_id=doctor_id, date=date).values_list('busy', flat=True).first()
+    return not (busy or 0) & (1 << slot_number(time))
+
+
+def next_free_slots(doctor_id, count, after=None):
+    """The next `count` free slots for a doctor as datetimes, soonest first."""
+    after = after or timezone.localtime().replace(tzinfo=None)
+    first_day = after.date()
+    days = [first_day + datetime.timedelta(days=i) for i in range(SEARCH_DAYS)]
+    busy = dict(
+        DoctorSlotMap.objects
+        .filter(doctor_id=doctor_id, date__gte=days[0], date__lte=days[-1])
+        .values_list('date', 'busy')
+    )
+    free = []
+    for day in days:
+        bits = busy.get(day, 0)
+        for number in range(SLOTS_PER_DAY):
+            start = datetime.datetime.combine(day, slot_time(number))
+            if bits & (1 << number) or start <= after:
+                continue
+            free.append(start)
+            if len(free) == count:
+                return free
+    return free
+
+
+def rebuild(doctor_ids=None):
+    """Recompute the slot maps from open appointments."""
+    rows = Appointment.objects.filter(status__in=ACTIVE_STATUSES).order_by()
+    maps = DoctorSlotMap.objects.all()
+    if doctor_ids is not None:
+        rows = rows.filter(Q(doctor_id__in=doctor_ids) | Q(preferred_doctor_id__in=doctor_ids))
+        maps = maps.filter(doctor_id__in=doctor_ids)
+
+    busy = {}
+    for doctor_id, preferred_id, date, time in rows.values_list(
+        'doctor_id', 'preferred_doctor_id', 'appointment_date', 'appointment_time'
+    ).iterator():
+        for holder in {doctor_id, preferred_id} - {None}:
+            if doctor_ids is None or holder in doctor_ids:
+                busy[holder, date] = busy.get((holder, date), 0) | (1 << slot_number(time))
+
+    with transaction.atomic():
+        maps.delete()
+        DoctorSlotMap.objects.bulk_create(
+            [DoctorSlotMap(doctor_id=doctor_id, date=date, busy=bits) for (doctor_id, date), bits in busy.items()],
+            batch_size=1000,
+        )
+    return len(busy)
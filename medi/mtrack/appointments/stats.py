@@ -0,0 +1,71 @@
+from collections import Counter, defaultdict
+
+from django.contrib.auth import get_user_model
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .models import STAR_FIELDS, AppointmentStats, DoctorRatingSummary
+
+User = get_user_model()
+
+
+def _bump(user_id, **deltas):
+    deltas = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    # Callers run inside the transaction that made the change, so a user
+    # without a stats row yet gets one computed from a state that includes it.
+    if not AppointmentStats.objects.filter(user_id=user_id).update(**deltas):
+        AppointmentStats.rebuild(User.objects.get(pk=user_id))
+
+
+def record_booking(appointment):
+    _bump(appointment.patient_id, pending_count=1)
+
+
+def _transition_deltas(deltas, appointment, old_status, old_doctor_id):
+    old_field = f'{old_status}_count'
+    new_field = f'{appointment.status}_count'
+    for field, delta in ((old_field, -1), (new_field, 1)):
+        deltas[appointment.patient_id][field] += delta
+    if old_doctor_id is not None and old_doctor_id == appointment.doctor_id:
+        deltas[appointment.doctor_id][old_field] -= 1
+        deltas[appointment.doctor_id][new_field] += 1
+        return
+    # Accepting assigns the doctor, so the appointment only now starts
+    # counting towards their totals.
+    if old_doctor_id is not None:
+        deltas[old_doctor_id][old_field] -= 1
+    if appointment.doctor_id is not None:
+        deltas[appointment.doctor_id][new_field] += 1
+
+
+def record_transition(appointment, old_status, old_doctor_id=None):
+    record_transitions([(appointment, old_status, old_doctor_id)])
+
+
+def record_transitions(moves):
+    """
+    record_transition for many (appointment, old_status, old_doctor_id)
+    moves, with one UPDATE per affected user.
+    """
+    deltas = defaultdict(Counter)
+    for appointment, old_status, old_doctor_id in moves:
+        _transition_deltas(deltas, appointment, old_status, old_doctor_id)
+    for user_id, fields in deltas.items():
+        _bump(user_id, **fields)
+
+
+def record_feedback(feedback):
+    # SET expressions see the row's old values, so the average is computed
+    # from the same sum and count being incremented.
+    updated = DoctorRatingSummary.objects.filter(doctor_id=feedback.doctor_id).update(
+        rating_count=F('rating_count') + 1,
+        rating_sum=F('rating_sum') + feedback.rating,
+        average_rating=Cast(F('rating_sum') + feedback.rating, FloatField()) / (F('rating_count') + 1),
+        last_updated=timezone.now(),
+        **{STAR_FIELDS[feedback.rating]: F(STAR_FIELDS[feedback.rating]) + 1},
+    )
+    if not updated:
+        DoctorRatingSummary.rebuild(User.objects.get(pk=feedback.doctor_id))
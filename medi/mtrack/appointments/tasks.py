@@ -0,0 +1,25 @@
+"""Background work for appointments, run by `manage.py run_tasks`."""
+from django.contrib.auth import get_user_model
+
+from tasks.queue import task
+from . import search
+from .models import Appointment
+
+User = get_user_model()
+
+
+# Reindexing rewrites whole documents, so running one twice is harmless
+
+@task
+def reindex_search(ids):
+    search.reindex(ids)
+
+
+@task
+def remove_from_search(ids):
+    search.remove(ids)
+
+
+@task
+def reindex_patient(patient_id):
+    search.reindex(Appointment.objects.filter(patient_id=patient_id).values_list('id', flat=True))
@@ -1,3 +1,1341 @@
-from django.test import TestCase
+import asyncio
+import csv
+import datetime
+import gzip
+import importlib
+import io
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Count, Q
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches, resolve, reverse
+from django.utils.http import urlencode
+from django.utils import timezone
+
+from accounts import directory
+from accounts.testing import make_user
+from tasks.models import Task
+from . import booking, bulk, events, export, search, slots
+from .management.commands.import_meditrack import UserImporter
+from .models import (
+    Appointment, AppointmentStats, DoctorRatingSummary, DoctorSlotMap, Feedback, Prescription,
+)
+from .pagination import PAGE_SIZE, EstimatedCountPaginator, paginate
+
+User = get_user_model()
+
+
+def reload_urls():
+    # The async/sync view choice is made when the URLconfs are imported
+    import accounts.urls
+    import appointments.urls
+    import mtrack.urls
+    importlib.reload(accounts.urls)
+    importlib.reload(appointments.urls)
+    importlib.reload(mtrack.urls)  # its include()s cache the app patterns
+    clear_url_caches()
+
+
+class AppointmentTestMixin:
+    def setUp(self):
+        self.patient = make_user('patient', 'patient')
+        self.doctor = make_user('doctor', 'doctor')
+
+    def make_appointment(self, patient=None, days=1, hour=10, **extra):
+        extra.setdefault('preferred_doctor', self.doctor)
+        extra.setdefault('health_concern', 'Headache')
+        return Appointment.objects.create(
+            patient=patient or self.patient,
+            appointment_date=datetime.date.today() + datetime.timedelta(days=days),
+            appointment_time=datetime.time(hour, 0),
+            **extra
+        )
+
+    def query_count(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+
+class ListingQueryCountTests(AppointmentTestMixin, TestCase):
+    """The listing pages must not issue one query per row."""
+
+    def add_rows(self, count, **extra):
+        for i in range(count):
+            existing = Appointment.objects.count()
+            patient = make_user(f'p{existing}', 'patient')
+            self.make_appointment(patient=patient, days=existing + 1, **extra)
+
+    def assertConstantQueries(self, user, url, **extra):
+        self.client.force_login(user)
+        self.add_rows(1, **extra)
+        self.query_count(url)  # first visit caches the principal and creates stats
+        baseline = self.query_count(url)
+        self.add_rows(10, **extra)
+        self.assertEqual(self.query_count(url), baseline)
+
+    def test_pending_queue_for_doctor(self):
+        self.assertConstantQueries(self.doctor, reverse('appointments:appointments_list'))
+
+    def test_my_appointments_for_doctor(self):
+        self.assertConstantQueries(
+            self.doctor, reverse('appointments:my_appointments'),
+            doctor=self.doctor, status='confirmed'
+        )
+
+    def test_doctor_dashboard(self):
+        self.assertConstantQueries(
+            self.doctor, reverse('accounts:dashboard'),
+            doctor=self.doctor, status='completed'
+        )
+
+    def test_patient_listing_and_dashboard(self):
+        self.client.force_login(self.patient)
+        self.make_appointment(doctor=self.doctor, status='confirmed')
+        list_url = reverse('appointments:appointments_list')
+        dashboard_url = reverse('accounts:dashboard')
+        self.query_count(list_url)  # first visit caches the principal in the session
+        list_queries = self.query_count(list_url)
+        self.query_count(dashboard_url)
+        dashboard_queries = self.query_count(dashboard_url)
+        for i in range(10):
+            self.make_appointment(days=i + 2, doctor=self.doctor, status='confirmed')
+        self.assertEqual(self.query_count(list_url), list_queries)
+        self.assertEqual(self.query_count(dashboard_url), dashboard_queries)
+
+    def test_detail_loads_records_up_front(self):
+        appointment = self.make_appointment(doctor=self.doctor, status='completed')
+        Prescription.objects.create(
+            appointment=appointment, medicine_names='Aspirin',
+            dosage_instructions='After food', frequency='Daily'
+        )
+        Feedback.objects.create(
+            appointment=appointment, patient=self.patient, doctor=self.doctor, rating=5
+        )
+        self.client.force_login(self.patient)
+        url = reverse('appointments:appointment_detail', args=[appointment.id])
+        self.client.get(url)
+        # session, user, appointment (+ joined users), prescription, feedback
+        with self.assertNumQueries(5):
+            response = self.client.get(url)
+        self.assertContains(response, 'Aspirin')
+
+
+class ExplainCommandTests(TestCase):
+    def test_view_queries_use_indexes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            out = io.StringIO()
+            call_command(
+                'explain_appointments', rows=500, fail_on_scan=True,
+                db_path=os.path.join(tmp, 'explain.sqlite3'), stdout=out
+            )
+        # The same-day count searches appt_patient_day_slot_uniq's index
+        # (an autoindex on SQLite)
+        self.assertIn('(patient_id=? AND appointment_date=?)', out.getvalue())
+        self.assertIn('All queries use an index.', out.getvalue())
+
+
+class KeysetPaginationTests(AppointmentTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(PAGE_SIZE * 2 + 5):
+            self.make_appointment(days=i + 1)
+        # Several rows sharing a timestamp must still page deterministically
+        tied = Appointment.objects.order_by('id').values_list('id', flat=True)[10:30]
+        Appointment.objects.filter(id__in=list(tied)).update(created_at=timezone.now())
+
+    def test_pages_cover_every_row_once_in_order(self):
+        queryset = Appointment.objects.for_patient(self.patient)
+        seen, cursor = [], None
+        while True:
+            page = paginate(queryset, cursor)
+            seen.extend(appointment.id for appointment in page)
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        expected = list(queryset.values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_listing_links_to_next_page(self):
+        self.client.force_login(self.patient)
+        url = reverse('appointments:appointments_list')
+        response = self.client.get(url)
+        page = response.context['page']
+        self.assertEqual(len(page), PAGE_SIZE)
+        self.assertContains(response, f'?cursor={page.next_cursor}')
+        response = self.client.get(url, {'cursor': page.next_cursor})
+        self.assertEqual(len(response.context['page']), PAGE_SIZE)
+
+    def test_invalid_cursor_is_rejected(self):
+        self.client.force_login(self.patient)
+        response = self.client.get(reverse('appointments:appointments_list'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_dashboard_fetches_only_recent_rows(self):
+        self.client.force_login(self.patient)
+        response = self.client.get(reverse('accounts:dashboard'))
+        self.assertEqual(len(response.context['appointments']), 5)
+
+
+class AppointmentStatsTests(AppointmentTestMixin, TestCase):
+    def assertStatsCurrent(self, user):
+        stats = AppointmentStats.objects.get(user=user)
+        for field, value in AppointmentStats.compute(user).items():
+            self.assertEqual(getattr(stats, field), value, field)
+
+    def test_counters_follow_the_appointment_lifecycle(self):
+        self.client.force_login(self.patient)
+        self.client.post(reverse('appointments:book_appointment'), {
+            'preferred_doctor': self.doctor.id,
+            'appointment_date': datetime.date.today() + datetime.timedelta(days=1),
+            'appointment_time': '10:00',
+            'health_concern': 'Headache',
+        })
+        appointment = Appointment.objects.get()
+        self.assertStatsCurrent(self.patient)
+
+        self.client.force_login(self.doctor)
+        self.client.get(reverse('appointments:accept_appointment', args=[appointment.id]))
+        for status in ('in_progress', 'completed'):
+            self.client.post(reverse('appointments:update_status', args=[appointment.id]), {'status': status})
+            self.assertStatsCurrent(self.patient)
+            self.assertStatsCurrent(self.doctor)
+
+        self.client.force_login(self.patient)
+        self.client.post(reverse('appointments:submit_feedback', args=[appointment.id]), {'rating': 4})
+        self.assertStatsCurrent(self.doctor)
+        self.assertEqual(DoctorRatingSummary.objects.get(doctor=self.doctor).average_rating, 4)
+
+    def test_dashboard_reads_counters_without_scanning(self):
+        self.make_appointment(status='completed', doctor=self.doctor)
+        self.client.force_login(self.doctor)
+        self.client.get(reverse('accounts:dashboard'))
+        # session, user, stats row (no Appointment or Feedback aggregates)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('accounts:dashboard'))
+        self.assertEqual(response.context['total_appointments'], 1)
+        tables = ' '.join(query['sql'] for query in ctx.captured_queries)
+        self.assertNotIn('appointments_feedback', tables)
+        self.assertNotIn('COUNT(', tables)
+
+    def test_rebuild_command(self):
+        self.make_appointment(status='completed', doctor=self.doctor)
+        call_command('rebuild_appointment_stats', stdout=io.StringIO())
+        self.assertStatsCurrent(self.patient)
+        self.assertStatsCurrent(self.doctor)
+
+
+class BookingTests(AppointmentTestMixin, TestCase):
+    def new_appointment(self, hour=10, patient=None, doctor=None):
+        return Appointment(
+            patient=patient or self.patient,
+            preferred_doctor=doctor or self.doctor,
+            appointment_date=datetime.date.today() + datetime.timedelta(days=1),
+            appointment_time=datetime.time(hour, 0),
+            health_concern='Headache',
+        )
+
+    def test_third_booking_on_same_day_is_refused(self):
+        booking.book(self.new_appointment(hour=10))
+        booking.book(self.new_appointment(hour=11))
+        with self.assertRaisesMessage(booking.BookingError, 'more than 2 appointments'):
+            booking.book(self.new_appointment(hour=12))
+        self.assertEqual(
+            sorted(Appointment.objects.values_list('day_slot', flat=True)), [1, 2]
+        )
+
+    def test_doctor_slot_cannot_be_double_booked(self):
+        booking.book(self.new_appointment(hour=10))
+        other = make_user('other', 'patient')
+        with self.assertRaisesMessage(booking.BookingError, 'already booked'):
+            booking.book(self.new_appointment(hour=10, patient=other))
+
+    def test_database_enforces_the_limits(self):
+        first = booking.book(self.new_appointment(hour=10))
+        duplicate = self.new_appointment(hour=11)
+        duplicate.day_slot = first.day_slot
+        with self.assertRaises(IntegrityError):
+            duplicate.save()
+
+    def test_view_reports_the_limit(self):
+        self.client.force_login(self.patient)
+        data = {
+            'preferred_doctor': self.doctor.id,
+            'appointment_date': datetime.date.today() + datetime.timedelta(days=1),
+            'health_concern': 'Headache',
+        }
+        for hour in ('10:00', '11:00', '12:00'):
+            response = self.client.post(reverse('appointments:book_appointment'), {**data, 'appointment_time': hour})
+        self.assertContains(response, 'more than 2 appointments')
+        self.assertEqual(Appointment.objects.count(), 2)
+
+
+class BookingConcurrencyTests(AppointmentTestMixin, TransactionTestCase):
+    BOOKINGS = 200
+
+    def test_parallel_bookings_keep_invariants(self):
+        patients = [make_user(f'stress{i}', 'patient') for i in range(20)]
+        doctors = [self.doctor, make_user('doctor2', 'doctor')]
+        hours = [9, 10, 11]
+
+        def attempt(i):
+            appointment = Appointment(
+                patient=patients[i % len(patients)],
+                preferred_doctor=doctors[i % len(doctors)],
+                appointment_date=datetime.date.today() + datetime.timedelta(days=1),
+                appointment_time=datetime.time(hours[i % len(hours)], 0),
+                health_concern='Stress test',
+            )
+            try:
+                booking.book(appointment)
+                return True
+            except booking.BookingError:
+                return False
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            booked = sum(pool.map(attempt, range(self.BOOKINGS)))
+
+        self.assertEqual(booked, Appointment.objects.count())
+        per_day = Appointment.objects.values('patient', 'appointment_date').annotate(n=Count('id'))
+        self.assertTrue(all(row['n'] <= 2 for row in per_day))
+        per_slot = Appointment.objects.values(
+            'preferred_doctor', 'appointment_date', 'appointment_time'
+        ).annotate(n=Count('id'))
+        self.assertTrue(all(row['n'] == 1 for row in per_slot))
+        # Every doctor/time combination was requested, so every slot is filled
+        self.assertEqual(booked, len(doctors) * len(hours))
+
+
+class BookingConstraintsMigrationTests(TransactionTestCase):
+    before = [('accounts', '0002_user_specialization'), ('appointments', '0004_appointment_stats')]
+    after = [('accounts', '0002_user_specialization'), ('appointments', '0005_booking_constraints')]
+
+    def setUp(self):
+        self.executor = MigrationExecutor(connection)
+        self.executor.migrate(self.before)
+        apps = self.executor.loader.project_state(self.before).apps
+        self.Appointment = apps.get_model('appointments', 'Appointment')
+        User = apps.get_model('accounts', 'User')
+        self.patient = User.objects.create(username='patient', role='patient')
+        self.doctor = User.objects.create(username='doctor', role='doctor')
+        self.date = datetime.date.today() + datetime.timedelta(days=1)
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def book(self, patient, hour):
+        return self.Appointment.objects.create(
+            patient=patient, preferred_doctor=self.doctor, appointment_date=self.date,
+            appointment_time=datetime.time(hour, 0), health_concern='Headache',
+        ).id
+
+    def migrate(self):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(self.after)
+        return executor.loader.project_state(self.after).apps.get_model('appointments', 'Appointment')
+
+    def test_later_doctor_clashes_lose_the_doctor(self):
+        other = self.patient.__class__.objects.create(username='other', role='patient')
+        first = self.book(self.patient, 10)
+        second = self.book(other, 10)
+        Appointment = self.migrate()
+
+        self.assertEqual(Appointment.objects.get(id=first).preferred_doctor_id, self.doctor.id)
+        self.assertIsNone(Appointment.objects.get(id=second).preferred_doctor_id)
+        self.assertEqual(Appointment.objects.get(id=second).day_slot, 1)
+
+    def test_too_many_bookings_a_day_stop_the_migration(self):
+        ids = [self.book(self.patient, hour) for hour in (9, 10, 11)]
+        with self.assertRaisesMessage(RuntimeError, ', '.join(map(str, ids))):
+            self.migrate()
+        self.Appointment.objects.all().delete()  # so tearDown can migrate forward
+
+
+class TransitionTests(AppointmentTestMixin, TestCase):
+    def test_only_one_stale_copy_wins(self):
+        appointment = self.make_appointment()
+        first = Appointment.objects.get(pk=appointment.pk)
+        second = Appointment.objects.get(pk=appointment.pk)
+        other = make_user('other', 'doctor')
+        self.assertTrue(first.transition_to('confirmed', doctor=self.doctor))
+        self.assertFalse(second.transition_to('confirmed', doctor=other))
+        appointment.refresh_from_db()
+        self.assertEqual((appointment.status, appointment.doctor), ('confirmed', self.doctor))
+
+    def test_disallowed_move_writes_nothing(self):
+        appointment = self.make_appointment()
+        with self.assertNumQueries(0):
+            self.assertFalse(appointment.transition_to('completed'))
+
+    def test_transition_updates_only_changed_columns(self):
+        appointment = self.make_appointment()
+        with CaptureQueriesContext(connection) as ctx:
+            appointment.transition_to('confirmed', doctor=self.doctor)
+        sql = ctx.captured_queries[0]['sql']
+        self.assertTrue(sql.startswith('UPDATE'))
+        self.assertNotIn('health_concern', sql)
+
+    def test_accept_loses_to_earlier_accept(self):
+        appointment = self.make_appointment()
+        Appointment.objects.filter(pk=appointment.pk).update(status='confirmed', doctor=self.doctor)
+        self.client.force_login(self.doctor)
+        response = self.client.get(reverse('appointments:accept_appointment', args=[appointment.id]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_other_doctor_cannot_advance(self):
+        appointment = self.make_appointment(status='confirmed', doctor=self.doctor)
+        self.assertFalse(appointment.transition_to('in_progress', condition=Q(doctor__username='nobody')))
+        appointment.refresh_from_db()
+        self.assertEqual(appointment.status, 'confirmed')
+
+
+class SlotIndexTests(AppointmentTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.date = datetime.date.today() + datetime.timedelta(days=1)
+
+    def book(self, hour, minute=0, patient=None):
+        return booking.book(Appointment(
+            patient=patient or self.patient,
+            preferred_doctor=self.doctor,
+            appointment_date=self.date,
+            appointment_time=datetime.time(hour, minute),
+            health_concern='Headache',
+        ))
+
+    def busy_bits(self):
+        return DoctorSlotMap.objects.get(doctor=self.doctor, date=self.date).busy
+
+    def test_booking_marks_and_completion_releases(self):
+        appointment = self.book(9, 30)
+        self.assertEqual(self.busy_bits(), 0b10)
+        self.assertTrue(appointment.transition_to('confirmed', doctor=self.doctor))
+        slots.record_transition(appointment)
+        self.assertEqual(self.busy_bits(), 0b10)
+        for status in ('in_progress', 'completed'):
+            appointment.transition_to(status)
+            slots.record_transition(appointment)
+        self.assertEqual(self.busy_bits(), 0)
+
+    def test_slot_stays_busy_while_another_booking_holds_it(self):
+        first = self.book(10, 0)
+        # Booked with another doctor, then taken on by this one
+        second = booking.book(Appointment(
+            patient=make_user('other', 'patient'), preferred_doctor=make_user('wilson', 'doctor'),
+            appointment_date=self.date, appointment_time=datetime.time(10, 0), health_concern='Cough',
+        ))
+        second.transition_to('confirmed', doctor=self.doctor)
+        slots.record_transition(second)
+        Appointment.objects.filter(pk=first.pk).update(status='completed')
+        first.status = 'completed'
+        slots.record_transition(first)
+        self.assertFalse(slots.is_free(self.doctor.id, self.date, datetime.time(10, 0)))
+
+    def test_next_free_slots_skip_busy_ones(self):
+        self.book(9, 0)
+        after = datetime.datetime.combine(self.date, datetime.time(8, 0))
+        free = slots.next_free_slots(self.doctor.id, 2, after=after)
+        self.assertEqual([start.time() for start in free], [datetime.time(9, 30), datetime.time(10, 0)])
+
+    def test_lookup_does_not_touch_appointments(self):
+        self.book(9, 0)
+        with CaptureQueriesContext(connection) as ctx:
+            slots.next_free_slots(self.doctor.id, 5)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertNotIn('appointments_appointment', ctx.captured_queries[0]['sql'])
+
+    def test_endpoint_and_form_use_the_index(self):
+        self.book(11, 0)
+        self.client.force_login(self.patient)
+        response = self.client.get(reverse('appointments:free_slots', args=[self.doctor.id]), {'n': 3})
+        self.assertEqual(len(response.json()['slots']), 3)
+        response = self.client.post(reverse('appointments:book_appointment'), {
+            'preferred_doctor': self.doctor.id,
+            'appointment_date': self.date,
+            'appointment_time': '11:00',
+            'health_concern': 'Headache',
+        })
+        self.assertContains(response, 'already booked at that time')
+
+    def test_endpoint_bounds_the_count_and_rejects_non_doctors(self):
+        self.client.force_login(self.patient)
+        response = self.client.get(reverse('appointments:free_slots', args=[self.doctor.id]), {'n': 0})
+        self.assertEqual(len(response.json()['slots']), 1)
+        response = self.client.get(reverse('appointments:free_slots', args=[self.patient.id]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_times_must_start_a_slot(self):
+        self.client.force_login(self.patient)
+        response = self.client.post(reverse('appointments:book_appointment'), {
+            'preferred_doctor': self.doctor.id,
+            'appointment_date': self.date,
+            'appointment_time': '11:10',
+            'health_concern': 'Headache',
+        })
+        self.assertContains(response, 'must be on the hour or half hour')
+        self.assertFalse(Appointment.objects.exists())
+
+    def test_rebuild_matches_incremental_updates(self):
+        self.book(9, 0)
+        self.book(16, 30)
+        incremental = self.busy_bits()
+        DoctorSlotMap.objects.all().delete()
+        call_command('rebuild_slot_index', stdout=io.StringIO())
+        self.assertEqual(self.busy_bits(), incremental)
+
+
+class ImportCommandTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write(self, name, text):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w') as handle:
+            handle.write(text)
+        return path
+
+    def run_import(self, path, kind, **options):
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_meditrack', path, kind=kind, batch_size=2, stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+
+    def import_users(self):
+        path = self.write('users.csv', (
+            'username,email,first_name,last_name,role,specialization\n'
+            'doc,doc@meditrack.local,Greg,House,doctor,Diagnostics\n'
+            'pat,pat@meditrack.local,Pat,Smith,patient,\n'
+            'pat2,pat2@meditrack.local,Pam,Jones,patient,\n'
+            'bad,bad@example.com,Bad,Email,patient,\n'
+            'nospec,nospec@meditrack.local,No,Spec,doctor,\n'
+        ))
+        return self.run_import(path, 'users', password='seed-pass-123')
+
+    def test_users_are_validated_and_share_one_hash(self):
+        out, err = self.import_users()
+        self.assertEqual(User.objects.count(), 3)
+        self.assertIn('Row 4: Email must end with @meditrack.local', err)
+        self.assertIn('Row 5: Specialization is required for doctors.', err)
+        self.assertEqual(len(set(User.objects.values_list('password', flat=True))), 1)
+        self.assertTrue(User.objects.get(username='pat').check_password('seed-pass-123'))
+
+    def test_users_pass_the_registration_checks(self):
+        make_user('taken', 'patient')
+        path = self.write('users.csv', (
+            'username,email,first_name,last_name,role,specialization\n'
+            'bad name,bad@meditrack.local,Bad,Name,patient,\n'
+            'noname,noname@meditrack.local,,Smith,patient,\n'
+            'shouty,TAKEN@MediTrack.local,Shouty,Smith,patient,\n'
+            'first,dup@meditrack.local,First,Dup,patient,\n'
+            'second,Dup@meditrack.local,Second,Dup,patient,\n'
+        ))
+        out, err = self.run_import(path, 'users')
+        self.assertIn('Row 1: username: Enter a valid username.', err)
+        self.assertIn('Row 2: first_name: This field is required.', err)
+        self.assertIn('Row 3: This email is already registered.', err)
+        self.assertIn('Row 5: This email is already registered.', err)
+        self.assertEqual(sorted(User.objects.values_list('username', flat=True)), ['first', 'taken'])
+
+    def test_malformed_jsonl_rows_are_reported(self):
+        path = self.write('users.jsonl', '\n'.join([
+            '{"username": "broken",',
+            json.dumps({'username': None, 'email': 'x@meditrack.local', 'role': 'patient'}),
+            json.dumps({'username': 42, 'email': 'n42@meditrack.local', 'role': 'patient',
+                        'first_name': 'N', 'last_name': 42}),
+            json.dumps(['not', 'an', 'object']),
+            json.dumps({'username': 'ok', 'email': 'ok@meditrack.local', 'role': 'patient',
+                        'first_name': 'O', 'last_name': 'K'}),
+        ]))
+        out, err = self.run_import(path, 'users')
+        self.assertIn('Row 1: Invalid JSON', err)
+        self.assertIn('Row 2: username: This field is required.', err)
+        self.assertIn('Row 4: Expected a JSON object.', err)
+        self.assertEqual(sorted(User.objects.values_list('username', flat=True)), ['42', 'ok'])
+        self.assertFalse(os.path.exists(path + '.checkpoint'))
+
+    def test_appointments_respect_form_rules(self):
+        self.import_users()
+        date = (datetime.date.today() - datetime.timedelta(days=30)).isoformat()
+        rows = [
+            {'patient': 'pat', 'preferred_doctor': 'doc', 'doctor': 'doc', 'appointment_date': date,
+             'appointment_time': '09:00', 'health_concern': 'Flu', 'status': 'completed'},
+            {'patient': 'pat', 'preferred_doctor': 'doc', 'appointment_date': date,
+             'appointment_time': '10:00', 'health_concern': 'Cough'},
+            {'patient': 'pat', 'preferred_doctor': 'doc', 'appointment_date': date,
+             'appointment_time': '11:00', 'health_concern': 'Third'},
+            {'patient': 'pat2', 'preferred_doctor': 'doc', 'appointment_date': date,
+             'appointment_time': '10:00', 'health_concern': 'Same slot'},
+            {'patient': 'pat2', 'preferred_doctor': 'doc', 'appointment_date': date,
+             'appointment_time': '18:00', 'health_concern': 'Late'},
+            {'patient': 'pat2', 'preferred_doctor': 'pat', 'appointment_date': date,
+             'appointment_time': '12:00', 'health_concern': 'Wrong doctor'},
+            {'patient': 'doc', 'preferred_doctor': 'doc', 'appointment_date': date,
+             'appointment_time': '13:00', 'health_concern': 'Wrong patient'},
+            {'patient': 'pat2', 'preferred_doctor': 'doc', 'appointment_date': date,
+             'appointment_time': '14:10', 'health_concern': 'Off the slot'},
+        ]
+        path = self.write('appointments.jsonl', '\n'.join(json.dumps(row) for row in rows))
+        out, err = self.run_import(path, 'appointments')
+        self.assertEqual(Appointment.objects.count(), 2)
+        self.assertIn('Row 3: Patient already has 2 appointments', err)
+        self.assertIn('Row 4: This doctor is already booked', err)
+        self.assertIn('Row 5: Appointment time must be between', err)
+        self.assertIn('Row 6: "pat" in preferred_doctor is not an active doctor.', err)
+        self.assertIn('Row 7: "doc" in patient is not an active patient.', err)
+        self.assertIn('Row 8: Appointment time must be on the hour or half hour', err)
+        patient = User.objects.get(username='pat')
+        self.assertEqual(AppointmentStats.objects.get(user=patient).total_count, 2)
+
+    def test_resumes_from_checkpoint(self):
+        path = self.write('users.jsonl', '\n'.join(
+            json.dumps({'username': f'u{i}', 'email': f'u{i}@meditrack.local', 'role': 'patient',
+                        'first_name': 'U', 'last_name': str(i)})
+            for i in range(5)
+        ))
+        self.write('users.jsonl.checkpoint', json.dumps({'rows': 3}))
+        out, err = self.run_import(path, 'users')
+        self.assertIn('Resuming after row 3.', out)
+        self.assertEqual(sorted(User.objects.values_list('username', flat=True)), ['u3', 'u4'])
+        self.assertFalse(os.path.exists(path + '.checkpoint'))
+
+    def test_checkpoint_commits_with_its_batch(self):
+        path = self.write('users.jsonl', '\n'.join(
+            json.dumps({'username': f'u{i}', 'email': f'u{i}@meditrack.local', 'role': 'patient',
+                        'first_name': 'U', 'last_name': str(i)})
+            for i in range(5)
+        ))
+        save = UserImporter.save
+
+        def crash_on_second_batch(importer, objects, batch_size):
+            save(importer, objects, batch_size)
+            if objects[0].username == 'u2':
+                raise KeyboardInterrupt
+
+        with mock.patch.object(UserImporter, 'save', crash_on_second_batch):
+            with self.assertRaises(KeyboardInterrupt):
+                self.run_import(path, 'users')
+        with open(path + '.checkpoint') as handle:
+            self.assertEqual(json.load(handle), {'rows': 2})
+        self.run_import(path, 'users')
+        self.assertEqual(User.objects.count(), 5)
+
+
+class ExportTests(AppointmentTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.staff = make_user('staff', 'patient', is_staff=True)
+        self.other = make_user('other', 'doctor')
+        self.done = self.make_appointment(days=1, doctor=self.doctor, status='completed')
+        Prescription.objects.create(appointment=self.done, medicine_names='Aspirin',
+                                    dosage_instructions='After food', frequency='Twice daily')
+        Feedback.objects.create(appointment=self.done, patient=self.patient, doctor=self.doctor, rating=4)
+        self.make_appointment(days=2, preferred_doctor=self.other, doctor=self.other, status='confirmed')
+        self.make_appointment(days=40)
+
+    def download(self, **params):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('appointments:export'), params)
+        self.assertEqual(response.status_code, 200)
+        return gzip.decompress(b''.join(response.streaming_content)).decode()
+
+    def test_csv_joins_prescription_and_feedback(self):
+        rows = list(csv.DictReader(io.StringIO(self.download())))
+        self.assertEqual(len(rows), 3)
+        first = rows[0]
+        self.assertEqual(first['appointment_id'], str(self.done.id))
+        self.assertEqual(first['medicine_names'], 'Aspirin')
+        self.assertEqual(first['rating'], '4')
+        self.assertEqual(rows[1]['medicine_names'], '')
+
+    def test_jsonl_filters_by_doctor_and_date(self):
+        lines = self.download(format='jsonl', doctor=self.other.id).splitlines()
+        self.assertEqual([json.loads(line)['doctor'] for line in lines], ['other'])
+        today = datetime.date.today()
+        lines = self.download(format='jsonl', to=(today + datetime.timedelta(days=10)).isoformat()).splitlines()
+        self.assertEqual(len(lines), 2)
+
+    def test_staff_only_and_bad_filters(self):
+        self.client.force_login(self.patient)
+        self.assertEqual(self.client.get(reverse('appointments:export')).status_code, 302)
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(reverse('appointments:export'), {'from': 'soon'}).status_code, 400)
+
+    def test_rows_are_fetched_in_chunks(self):
+        for days in range(3, 8):
+            self.make_appointment(days=days)
+        with CaptureQueriesContext(connection) as ctx:
+            rows = list(export.export_rows(chunk_size=2))
+        self.assertEqual(len(rows), 8)
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_command_writes_importable_file(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, 'export.csv.gz')
+        call_command('export_appointments', path, doctor='doctor', stdout=io.StringIO())
+        with gzip.open(path, 'rt') as handle:
+            rows = list(csv.DictReader(handle))
+        self.assertEqual([row['patient'] for row in rows], ['patient'])
+        self.assertTrue({'patient', 'preferred_doctor', 'appointment_date', 'appointment_time',
+                         'health_concern', 'status'} <= set(rows[0]))
+
+
+class SeedCommandTests(TestCase):
+    def test_seeded_data_is_consistent(self):
+        call_command('seed_meditrack', doctors=3, patients=10, appointments=150, stdout=io.StringIO())
+        self.assertEqual(User.objects.filter(role='doctor').count(), 3)
+        self.assertEqual(Appointment.objects.count(), 150)
+        completed = Appointment.objects.filter(status='completed')
+        self.assertTrue(completed.exists())
+        self.assertFalse(Feedback.objects.exclude(appointment__status='completed').exists())
+        self.assertFalse(Appointment.objects.filter(status='pending', doctor__isnull=False).exists())
+
+        # Counters and slot maps were rebuilt after the bulk inserts
+        doctor = User.objects.filter(role='doctor').first()
+        self.assertEqual(AppointmentStats.for_user(doctor).total_count,
+                         Appointment.objects.filter(doctor=doctor).count())
+        self.assertTrue(DoctorSlotMap.objects.exclude(busy=0).exists())
+
+    def test_same_seed_gives_same_data(self):
+        call_command('seed_meditrack', doctors=2, patients=5, appointments=40, prefix='a', stdout=io.StringIO())
+        call_command('seed_meditrack', doctors=2, patients=5, appointments=40, prefix='b', stdout=io.StringIO())
+
+        def layout(prefix):
+            return list(Appointment.objects.filter(patient__username__startswith=prefix).order_by('id')
+                        .values_list('appointment_date', 'appointment_time', 'status'))
+        self.assertEqual(layout('a-'), layout('b-'))
+
+    def test_prefix_must_be_unused(self):
+        make_user('seed-doctor-0', 'doctor')
+        with self.assertRaises(CommandError):
+            call_command('seed_meditrack', stdout=io.StringIO())
+
+
+class RowFragmentCacheTests(AppointmentTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        caches['template_fragments'].clear()
+
+    def test_badge_class_per_status(self):
+        appointment = Appointment(status='in_progress')
+        self.assertEqual(appointment.badge_class, 'warning')
+        appointment.status = 'completed'
+        self.assertEqual(appointment.badge_class, 'success')
+
+    def test_row_rerenders_when_appointment_changes(self):
+        appointment = self.make_appointment(doctor=self.doctor, status='confirmed')
+        self.client.force_login(self.doctor)
+        url = reverse('appointments:my_appointments')
+        self.assertContains(self.client.get(url), 'Headache')
+
+        # update() leaves updated_at alone, so the cached row is served
+        Appointment.objects.filter(pk=appointment.pk).update(health_concern='Migraine')
+        self.assertContains(self.client.get(url), 'Headache')
+
+        self.assertTrue(appointment.transition_to('in_progress'))
+        response = self.client.get(url)
+        self.assertContains(response, 'Migraine')
+        self.assertContains(response, 'badge-warning')
+
+    def test_row_rerenders_when_names_change(self):
+        self.make_appointment(doctor=self.doctor, status='confirmed')
+        self.client.force_login(self.doctor)
+        url = reverse('appointments:my_appointments')
+        self.client.get(url)
+        self.patient.first_name = 'Renamed'
+        self.patient.save()
+        self.assertContains(self.client.get(url), 'Renamed')
+
+    def test_rows_outlive_the_directory_version(self):
+        appointment = self.make_appointment(doctor=self.doctor, status='confirmed')
+        self.client.force_login(self.doctor)
+        url = reverse('appointments:my_appointments')
+        self.client.get(url)
+        Appointment.objects.filter(pk=appointment.pk).update(health_concern='Migraine')
+        # Rolls on any account change, or every 30s without a shared cache
+        directory.invalidate()
+        self.assertContains(self.client.get(url), 'Headache')
+
+    def test_accept_button_is_per_doctor(self):
+        self.make_appointment()
+        other = make_user('other', 'doctor')
+        url = reverse('appointments:appointments_list')
+        self.client.force_login(other)
+        self.assertNotContains(self.client.get(url), '>Accept<')
+        self.client.force_login(self.doctor)
+        self.assertContains(self.client.get(url), '>Accept<')
+
+
+@override_settings(ASYNC_VIEWS=True)
+class AsyncViewTests(AppointmentTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        reload_urls()
+        self.addCleanup(reload_urls)
+        self.appointment = self.make_appointment(doctor=self.doctor, status='confirmed')
+        Prescription.objects.create(appointment=self.appointment, medicine_names='Aspirin',
+                                    dosage_instructions='After food', frequency='Daily')
+
+    async def get(self, user, url):
+        await sync_to_async(self.async_client.force_login)(user)
+        return await self.async_client.get(url)
+
+    def test_async_views_are_routed(self):
+        self.assertEqual(resolve(reverse('appointments:appointments_list')).func.__module__, 'appointments.async_views')
+        self.assertEqual(resolve(reverse('accounts:dashboard')).func.__module__, 'accounts.async_views')
+
+    async def test_listing_pages(self):
+        response = await self.get(self.patient, reverse('appointments:appointments_list'))
+        self.assertContains(response, 'badge-info')
+        response = await self.get(self.doctor, reverse('appointments:my_appointments'))
+        self.assertContains(response, 'Headache')
+
+    async def test_detail_checks_access(self):
+        url = reverse('appointments:appointment_detail', args=[self.appointment.id])
+        self.assertContains(await self.get(self.patient, url), 'Aspirin')
+        other = await sync_to_async(make_user)('other', 'patient')
+        self.assertEqual((await self.get(other, url)).status_code, 404)
+
+    async def test_dashboard(self):
+        response = await self.get(self.doctor, reverse('accounts:dashboard'))
+        self.assertEqual(response.context['total_appointments'], 1)
+        self.assertEqual(len(response.context['appointments']), 1)
+
+    async def test_roles_and_login_are_enforced(self):
+        response = await self.async_client.get(reverse('appointments:appointments_list'))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse('accounts:login'), response.url)
+        response = await self.get(self.patient, reverse('appointments:my_appointments'))
+        self.assertRedirects(response, reverse('accounts:dashboard'), fetch_redirect_response=False)
+
+
+class DoctorRatingSummaryTests(AppointmentTestMixin, TestCase):
+    def rate(self, doctor, *ratings):
+        for rating in ratings:
+            existing = Appointment.objects.count()
+            patient = make_user(f'rater{existing}', 'patient')
+            appointment = self.make_appointment(patient=patient, days=existing + 1, doctor=doctor,
+                                                preferred_doctor=doctor, status='completed')
+            self.client.force_login(patient)
+            self.client.post(reverse('appointments:submit_feedback', args=[appointment.id]), {'rating': rating})
+
+    def assertSummaryCurrent(self, doctor):
+        summary = DoctorRatingSummary.objects.get(doctor=doctor)
+        for field, value in DoctorRatingSummary.compute(doctor).items():
+            self.assertAlmostEqual(getattr(summary, field), value, msg=field)
+
+    def test_feedback_updates_the_summary(self):
+        self.rate(self.doctor, 5, 4, 4)
+        summary = DoctorRatingSummary.objects.get(doctor=self.doctor)
+        self.assertEqual(summary.rating_count, 3)
+        self.assertAlmostEqual(summary.average_rating, 13 / 3)
+        self.assertEqual(summary.histogram, [(1, 0), (2, 0), (3, 0), (4, 2), (5, 1)])
+        self.assertSummaryCurrent(self.doctor)
+
+    def test_dashboard_reads_the_summary(self):
+        self.rate(self.doctor, 3, 5)
+        self.client.force_login(self.doctor)
+        self.client.get(reverse('accounts:dashboard'))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('accounts:dashboard'))
+        self.assertEqual(response.context['average_rating'], 4)
+        self.assertNotIn('appointments_feedback', ' '.join(query['sql'] for query in ctx.captured_queries))
+
+    def test_rebuild_command(self):
+        self.rate(self.doctor, 2, 5)
+        DoctorRatingSummary.objects.all().delete()
+        call_command('rebuild_rating_summaries', stdout=io.StringIO())
+        self.assertSummaryCurrent(self.doctor)
+
+    def test_top_rated_listing(self):
+        good = make_user('good', 'doctor', specialization='Cardiology')
+        few = make_user('few', 'doctor')
+        self.rate(self.doctor, 3, 4, 3)
+        self.rate(good, 5, 5, 4)
+        self.rate(few, 5)
+        self.client.logout()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('appointments:top_rated_doctors'))
+        self.assertEqual([summary.doctor for summary in response.context['summaries']], [good, self.doctor])
+        self.assertContains(response, 'Cardiology')
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+
+# Index updates run inline, as the queue's worker would run them
+@override_settings(TASKS_EAGER=True)
+class SearchTests(AppointmentTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.doctor)
+
+    def search(self, q, **params):
+        response = self.client.get(reverse('appointments:search'), {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def found(self, q):
+        return [appointment.id for appointment in self.search(q).context['results']]
+
+    def test_ranks_concern_above_prescription_and_name(self):
+        mia = User.objects.create(username='mia', first_name='Mia', last_name='Migraine', role='patient')
+        by_name = self.make_appointment(patient=mia, days=1, health_concern='Check-up')
+        by_prescription = self.make_appointment(days=2, health_concern='Follow-up', doctor=self.doctor)
+        Prescription.objects.create(appointment=by_prescription, medicine_names='Migraine relief',
+                                    dosage_instructions='Once daily')
+        by_concern = self.make_appointment(days=3, health_concern='Migraine with aura')
+        self.assertEqual(self.found('migraine'), [by_concern.id, by_prescription.id, by_name.id])
+
+    def test_prefix_and_every_word_must_match(self):
+        appointment = self.make_appointment(health_concern='Diabetes review')
+        self.make_appointment(days=2, health_concern='Diabetes')
+        self.assertIn(appointment.id, self.found('diab'))
+        self.assertEqual(self.found('diab revi'), [appointment.id])
+
+    def test_only_the_doctors_own_appointments(self):
+        other = make_user('other', 'doctor')
+        mine = self.make_appointment(health_concern='Rash')
+        self.make_appointment(days=2, health_concern='Rash', preferred_doctor=other)
+        self.assertEqual(self.found('rash'), [mine.id])
+
+    def test_index_follows_edits(self):
+        appointment = self.make_appointment(health_concern='Cough')
+        appointment.health_concern = 'Sprained ankle'
+        appointment.save()
+        self.assertEqual(self.found('cough'), [])
+        self.assertEqual(self.found('ankle'), [appointment.id])
+
+        Prescription.objects.create(appointment=appointment, medicine_names='Ibuprofen')
+        self.assertEqual(self.found('ibuprofen'), [appointment.id])
+        appointment.prescription.delete()
+        self.assertEqual(self.found('ibuprofen'), [])
+
+        self.patient.last_name = 'Okonkwo'
+        self.patient.save()
+        self.assertEqual(self.found('okonkwo'), [appointment.id])
+
+        appointment.delete()
+        self.assertEqual(self.found('ankle'), [])
+
+    @override_settings(TASKS_EAGER=False)
+    def test_index_updates_are_queued(self):
+        appointment = self.make_appointment(health_concern='Cough')
+        self.assertEqual(self.found('cough'), [])
+        self.assertTrue(Task.objects.filter(name='appointments.tasks.reindex_search', args=[[appointment.id]]).exists())
+        call_command('run_tasks', threads=1, once=True, stdout=io.StringIO())
+        self.assertEqual(self.found('cough'), [appointment.id])
+        self.assertFalse(Task.objects.exists())
+
+    def test_rebuild_command(self):
+        appointment = self.make_appointment(health_concern='Insomnia')
+        Appointment.objects.filter(pk=appointment.pk).update(health_concern='Vertigo')
+        self.assertEqual(self.found('vertigo'), [])
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        self.assertEqual(self.found('vertigo'), [appointment.id])
+        self.assertEqual(self.found('insomnia'), [])
+
+    def test_pages(self):
+        created = [self.make_appointment(days=day, health_concern='Fever') for day in range(1, search.PAGE_SIZE + 3)]
+        first = self.search('fever')
+        self.assertTrue(first.context['has_next'])
+        second = self.search('fever', page=2)
+        self.assertFalse(second.context['has_next'])
+        ids = [a.id for a in first.context['results']] + [a.id for a in second.context['results']]
+        self.assertEqual(sorted(ids), sorted(a.id for a in created))
+        self.assertEqual(self.search('fever', page='x').context['page_number'], 1)
+
+    def test_query_syntax_is_not_passed_through(self):
+        appointment = self.make_appointment(health_concern='Back pain')
+        for q in ['"', 'back AND', 'NEAR(pain', 'pain*', "pain' OR 1=1 --", 'concern:back', '^back']:
+            with self.subTest(q=q):
+                self.search(q)
+        self.assertEqual(self.found('"back" pain*'), [appointment.id])
+        self.assertEqual(self.search('  ').context['results'], [])
+
+    def test_patients_cannot_search(self):
+        self.client.force_login(self.patient)
+        response = self.client.get(reverse('appointments:search'), {'q': 'x'})
+        self.assertNotEqual(response.status_code, 200)
+
+    def test_admin_search_uses_the_index(self):
+        admin = make_user('admin', 'patient', is_staff=True, is_superuser=True)
+        appointment = self.make_appointment(health_concern='Tinnitus')
+        self.make_appointment(days=2, health_concern='Other')
+        self.client.force_login(admin)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('admin:appointments_appointment_changelist'), {'q': 'tinnit'})
+        self.assertEqual([row.id for row in response.context['cl'].result_list], [appointment.id])
+        self.assertFalse([q['sql'] for q in ctx.captured_queries if ' LIKE ' in q['sql']])
+
+
+class AdminChangelistTests(AppointmentTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(make_user('admin', 'patient', is_staff=True, is_superuser=True))
+
+    def add_rows(self, count):
+        for i in range(count):
+            existing = Appointment.objects.count()
+            patient = make_user(f'p{existing}', 'patient')
+            appointment = self.make_appointment(patient=patient, days=existing + 1, doctor=self.doctor,
+                                                status='completed')
+            Prescription.objects.create(appointment=appointment, medicine_names='Aspirin')
+            Feedback.objects.create(appointment=appointment, patient=patient, doctor=self.doctor, rating=4)
+
+    def assertConstantQueries(self, model, **params):
+        url = reverse(f'admin:appointments_{model}_changelist')
+        self.add_rows(2)
+        self.client.get(url, params)
+        baseline = self.query_count(f'{url}?{urlencode(params)}')
+        self.add_rows(10)
+        self.assertEqual(self.query_count(f'{url}?{urlencode(params)}'), baseline)
+
+    def test_appointment_changelist(self):
+        self.assertConstantQueries('appointment')
+
+    def test_appointment_date_hierarchy(self):
+        today = datetime.date.today() + datetime.timedelta(days=1)
+        self.assertConstantQueries('appointment', appointment_date__year=today.year)
+
+    def test_prescription_changelist(self):
+        self.assertConstantQueries('prescription')
+
+    def test_feedback_changelist(self):
+        self.assertConstantQueries('feedback')
+
+    def test_large_tables_are_not_counted(self):
+        self.add_rows(3)
+        total = Appointment.objects.count()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        Appointment.objects.filter(pk=Appointment.objects.order_by('id').first().pk).delete()
+        paginator = EstimatedCountPaginator(Appointment.objects.order_by('id'), 2)
+        paginator.threshold = 1
+        with CaptureQueriesContext(connection) as ctx:
+            # As of the last ANALYZE
+            self.assertEqual(paginator.count, total)
+        self.assertFalse([q['sql'] for q in ctx.captured_queries if 'COUNT(' in q['sql']])
+
+        # Filtered lists are counted exactly
+        filtered = EstimatedCountPaginator(Appointment.objects.filter(status='completed').order_by('id'), 2)
+        filtered.threshold = 1
+        self.assertEqual(filtered.count, 2)
+
+    def test_tables_without_statistics_are_counted(self):
+        self.add_rows(3)
+        paginator = EstimatedCountPaginator(Appointment.objects.order_by('id'), 2)
+        paginator.threshold = 1
+        self.assertEqual(paginator.count, Appointment.objects.count())
+
+
+class BulkStatusTests(AppointmentTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = make_user('other', 'doctor')
+        self.url = reverse('appointments:bulk_status')
+
+    def make_rows(self, count, **extra):
+        rows = []
+        for i in range(count):
+            existing = Appointment.objects.count()
+            rows.append(self.make_appointment(patient=make_user(f'p{existing}', 'patient'), days=existing + 1,
+                                              hour=9 + i % 8, **extra))
+        call_command('rebuild_appointment_stats', stdout=io.StringIO())
+        call_command('rebuild_slot_index', stdout=io.StringIO())
+        return rows
+
+    def post(self, status, ids, json=True):
+        self.client.force_login(self.doctor)
+        headers = {'HTTP_ACCEPT': 'application/json'} if json else {}
+        return self.client.post(self.url, {'status': status, 'appointment_ids': ids}, **headers)
+
+    def assertStatsCurrent(self, *users):
+        for user in users:
+            stats = AppointmentStats.objects.get(user=user)
+            for field, value in AppointmentStats.compute(user).items():
+                self.assertEqual(getattr(stats, field), value, field)
+
+    def test_accepts_many_with_one_update(self):
+        mine = self.make_rows(3)
+        theirs = self.make_rows(1, preferred_doctor=self.other)
+        done = self.make_rows(1, doctor=self.doctor, status='completed')
+        ids = [a.id for a in mine + theirs + done] + [999999]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.post('confirmed', ids)
+        self.assertEqual(response.json()['results'], {
+            **{str(a.id): 'updated' for a in mine},
+            str(theirs[0].id): 'not_found',
+            str(done[0].id): 'invalid_transition',
+            '999999': 'not_found',
+        })
+        updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "appointments_appointment"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(set(Appointment.objects.filter(doctor=self.doctor, status='confirmed')), set(mine))
+        self.assertStatsCurrent(self.doctor, self.other, *[a.patient for a in mine])
+
+    def test_advances_only_the_doctors_own(self):
+        confirmed = self.make_rows(2, doctor=self.doctor, status='confirmed')
+        foreign = self.make_rows(1, doctor=self.other, status='confirmed')
+        results = self.post('in_progress', [a.id for a in confirmed + foreign]).json()['results']
+        self.assertEqual(results[str(foreign[0].id)], 'not_found')
+        self.assertEqual(Appointment.objects.filter(status='in_progress').count(), 2)
+
+        results = self.post('completed', [a.id for a in confirmed]).json()['results']
+        self.assertEqual(set(results.values()), {'updated'})
+        for appointment in confirmed:
+            self.assertTrue(slots.is_free(self.doctor.id, appointment.appointment_date, appointment.appointment_time))
+        self.assertStatsCurrent(self.doctor, *[a.patient for a in confirmed])
+
+    def test_form_post_redirects_with_a_summary(self):
+        rows = self.make_rows(2)
+        done = self.make_rows(1, doctor=self.doctor, status='completed')
+        response = self.post('confirmed', [a.id for a in rows + done], json=False)
+        self.assertRedirects(response, reverse('appointments:appointments_list'), fetch_redirect_response=False)
+        page = self.client.get(response.url)
+        self.assertContains(page, '2 appointment(s) updated to confirmed.')
+        self.assertContains(page, '1 appointment(s) could not be updated.')
+
+    def test_rejects_bad_requests(self):
+        row = self.make_rows(1)[0]
+        self.assertEqual(self.post('cancelled', [row.id]).status_code, 400)
+        self.assertEqual(self.post('confirmed', []).status_code, 400)
+        self.assertEqual(self.post('confirmed', ['x']).status_code, 400)
+        self.assertEqual(self.post('confirmed', list(range(1, bulk.MAX_BATCH + 2))).status_code, 400)
+        self.client.force_login(self.patient)
+        self.client.post(self.url, {'status': 'confirmed', 'appointment_ids': [row.id]})
+        self.assertEqual(Appointment.objects.get(pk=row.pk).status, 'pending')
+
+    def test_admin_actions(self):
+        rows = self.make_rows(2)
+        orphan = self.make_rows(1, preferred_doctor=None)[0]
+        self.client.force_login(make_user('admin', 'patient', is_staff=True, is_superuser=True))
+        self.client.post(reverse('admin:appointments_appointment_changelist'), {
+            'action': 'mark_confirmed',
+            '_selected_action': [a.id for a in rows] + [orphan.id],
+        })
+        self.assertEqual(
+            list(Appointment.objects.filter(status='confirmed').values_list('doctor', flat=True)),
+            [self.doctor.id, self.doctor.id],
+        )
+        self.assertEqual(Appointment.objects.get(pk=orphan.pk).status, 'pending')
+        self.client.post(reverse('admin:appointments_appointment_changelist'), {
+            'action': 'mark_in_progress', '_selected_action': [a.id for a in rows],
+        })
+        self.assertEqual(Appointment.objects.filter(status='in_progress').count(), 2)
+        self.assertStatsCurrent(self.doctor, *[a.patient for a in rows])
+
+
+class ApiTests(AppointmentTestMixin, TestCase):
+    def get(self, name, *args, **headers):
+        return self.client.get(reverse(f'appointments:{name}', args=args), **headers)
+
+    def post(self, name, *args, data=None):
+        return self.client.post(reverse(f'appointments:{name}', args=args), json.dumps(data or {}),
+                                content_type='application/json')
+
+    def test_list_and_conditional_get(self):
+        appointment = self.make_appointment()
+        self.client.force_login(self.patient)
+        response = self.get('api_appointments')
+        self.assertEqual(response.status_code, 200)
+        row, = response.json()['results']
+        self.assertEqual(row['id'], appointment.id)
+        self.assertEqual(row['patient'], {'id': self.patient.id, 'name': 'Patient Test'})
+        self.assertNotIn('day_slot', row)
+
+        etag = response['ETag']
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.get('api_appointments', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # The session and user, then one query for the ETag
+        self.assertEqual(len(ctx.captured_queries), 3)
+
+        appointment.transition_to('confirmed', doctor=self.doctor)
+        response = self.get('api_appointments', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['status'], 'confirmed')
+
+    def test_detail_validators_follow_updated_at(self):
+        appointment = self.make_appointment(doctor=self.doctor, status='completed')
+        self.client.force_login(self.patient)
+        response = self.get('api_appointment', appointment.id)
+        self.assertIsNone(response.json()['prescription'])
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        self.assertEqual(self.get('api_appointment', appointment.id, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(
+            self.get('api_appointment', appointment.id, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304
+        )
+
+        Prescription.objects.create(appointment=appointment, medicine_names='Aspirin', frequency='Daily')
+        response = self.get('api_appointment', appointment.id, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['prescription']['medicine_names'], 'Aspirin')
+
+    def test_detail_is_private(self):
+        appointment = self.make_appointment()
+        self.client.force_login(make_user('stranger', 'patient'))
+        self.assertEqual(self.get('api_appointment', appointment.id).status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.get('api_appointment', appointment.id).status_code, 401)
+
+    def test_booking_uses_the_form_and_booking_rules(self):
+        self.client.force_login(self.patient)
+        data = {
+            'preferred_doctor': self.doctor.id,
+            'appointment_date': (datetime.date.today() + datetime.timedelta(days=1)).isoformat(),
+            'appointment_time': '10:00',
+            'health_concern': 'Headache',
+        }
+        response = self.post('api_appointments', data=data)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['preferred_doctor']['id'], self.doctor.id)
+
+        response = self.post('api_appointments', data={**data, 'appointment_date': '2000-01-01'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('appointment_date', response.json()['errors'])
+
+        self.client.force_login(self.doctor)
+        self.assertEqual(self.post('api_appointments', data=data).status_code, 403)
+
+    def test_doctor_moves_and_records(self):
+        appointment = self.make_appointment()
+        self.client.force_login(self.doctor)
+        self.assertEqual(self.post('api_accept', appointment.id).json()['status'], 'confirmed')
+        self.assertEqual(self.post('api_status', appointment.id, data={'status': 'completed'}).status_code, 409)
+        for status in ('in_progress', 'completed'):
+            self.assertEqual(self.post('api_status', appointment.id, data={'status': status}).json()['status'], status)
+
+        prescription = {'medicine_names': 'Ibuprofen', 'dosage_instructions': 'After food', 'frequency': 'Daily'}
+        self.assertEqual(self.post('api_prescription', appointment.id, data=prescription).status_code, 201)
+        self.assertEqual(self.post('api_prescription', appointment.id, data=prescription).status_code, 409)
+
+        self.client.force_login(make_user('other', 'doctor'))
+        self.assertEqual(self.post('api_accept', appointment.id).status_code, 404)
+
+        self.client.force_login(self.patient)
+        response = self.post('api_feedback', appointment.id, data={'rating': 5, 'comment': 'Great'})
+        self.assertEqual(response.json()['feedback'], {'rating': 5, 'comment': 'Great'})
+        self.assertEqual(DoctorRatingSummary.objects.get(doctor=self.doctor).rating_count, 1)
+        self.assertEqual(self.get('api_feedback', appointment.id).status_code, 405)
+
+
+class RecordingBroker:
+    def __init__(self):
+        self.messages = []
+
+    def publish(self, message):
+        self.messages.append(message)
+
+    def listen(self):
+        pass
+
+
+class LiveEventTests(AppointmentTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.appointment = self.make_appointment()
+        self.broker = RecordingBroker()
+        events._broker = self.broker
+        self.addCleanup(setattr, events, '_broker', None)
+
+    def test_transitions_publish_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.appointment.transition_to('confirmed', doctor=self.doctor)
+            self.assertEqual(self.broker.messages, [])
+        [message] = self.broker.messages
+        self.assertEqual((message['id'], message['status'], message['old_status']),
+                         (self.appointment.id, 'confirmed', 'pending'))
+        self.assertEqual(events.channels_for(message),
+                         {f'user:{self.patient.id}', f'user:{self.doctor.id}', 'pending'})
+        self.assertNotIn('health_concern', message)
+
+    def test_rolled_back_change_publishes_nothing(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.appointment.transition_to('confirmed', doctor=self.doctor)
+                transaction.set_rollback(True)
+        self.assertEqual(self.broker.messages, [])
+
+    def test_bulk_moves_and_bookings_publish(self):
+        other = self.make_appointment(days=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk.transition([self.appointment.id, other.id], 'confirmed', doctor=self.doctor)
+        self.assertEqual(sorted(message['id'] for message in self.broker.messages), [self.appointment.id, other.id])
+
+        self.broker.messages.clear()
+        appointment = Appointment(patient=self.patient, preferred_doctor=self.doctor, health_concern='Cough',
+                                  appointment_date=datetime.date.today() + datetime.timedelta(days=3),
+                                  appointment_time=datetime.time(11, 0))
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.book(appointment)
+        [message] = self.broker.messages
+        self.assertEqual((message['status'], message['old_status']), ('pending', None))
+
+    async def test_hub_fans_out_by_channel(self):
+        other = await sync_to_async(make_user)('other', 'doctor')
+        patient = events.hub.subscribe(events.user_channels(self.patient))
+        doctor = events.hub.subscribe(events.user_channels(self.doctor))
+        bystander = events.hub.subscribe(events.user_channels(other))
+        try:
+            await sync_to_async(self.appointment.transition_to)('confirmed', doctor=self.doctor)
+            # Leaving the queue reaches every doctor
+            self.assertEqual(events.hub.dispatch(events.message(self.appointment, 'pending')), 3)
+            await sync_to_async(self.appointment.transition_to)('in_progress')
+            self.assertEqual(events.hub.dispatch(events.message(self.appointment, 'confirmed')), 2)
+
+            self.assertEqual([(await patient.get(1))['status'], (await patient.get(1))['status']],
+                             ['confirmed', 'in_progress'])
+            self.assertEqual((await bystander.get(1))['status'], 'confirmed')
+            self.assertIsNone(await bystander.get(0.01))
+        finally:
+            for subscription in (patient, doctor, bystander):
+                events.hub.unsubscribe(subscription)
+        self.assertEqual(len(events.hub), 0)
+
+    async def test_slow_stream_is_told_to_resync(self):
+        subscription = events.hub.subscribe(events.user_channels(self.patient), size=1)
+        try:
+            for _ in range(2):
+                events.hub.dispatch(events.message(self.appointment, None))
+            await asyncio.sleep(0)
+            self.assertIs(await subscription.get(1), events.RESYNC)
+            self.assertIsNone(await subscription.get(0.01))
+        finally:
+            events.hub.unsubscribe(subscription)
+
+    async def test_stream(self):
+        await sync_to_async(self.async_client.force_login)(self.patient)
+        response = await self.async_client.get(reverse('appointments:events'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = response.streaming_content
+        self.assertIn(b'event: ready', await anext(chunks))
+
+        await sync_to_async(self.appointment.transition_to)('confirmed', doctor=self.doctor)
+        events.hub.dispatch(events.message(self.appointment, 'pending'))
+        event, data = (await anext(chunks)).decode().splitlines()[:2]
+        self.assertEqual(event, 'event: appointment')
+        self.assertEqual(json.loads(data.removeprefix('data: '))['status_display'], 'Confirmed')
+        # As the ASGI handler does when the stream ends
+        await sync_to_async(response.close)()
+        self.assertEqual(len(events.hub), 0)
+
+    def test_stream_needs_asgi(self):
+        self.client.force_login(self.patient)
+        self.assertEqual(self.client.get(reverse('appointments:events')).status_code, 204)
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('appointments:events')).status_code, 302)
@@ -1,15 +1,31 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import api, async_views, events, views
+
+# The read-only pages have async versions for ASGI deployments
+reads = async_views if settings.ASYNC_VIEWS else views
 
 app_name = 'appointments'
 
 urlpatterns = [
     path('book/', views.book_appointment, name='book_appointment'),
-    path('list/', views.appointments_list, name='appointments_list'),
-    path('my-appointments/', views.my_appointments, name='my_appointments'),
+    path('list/', reads.appointments_list, name='appointments_list'),
+    path('my-appointments/', reads.my_appointments, name='my_appointments'),
     path('accept/<int:appointment_id>/', views.accept_appointment, name='accept_appointment'),
-    path('detail/<int:appointment_id>/', views.appointment_detail, name='appointment_detail'),
+    path('detail/<int:appointment_id>/', reads.appointment_detail, name='appointment_detail'),
     path('update-status/<int:appointment_id>/', views.update_appointment_status, name='update_status'),
+    path('bulk-status/', views.bulk_update_status, name='bulk_status'),
     path('add-prescription/<int:appointment_id>/', views.add_prescription, name='add_prescription'),
     path('submit-feedback/<int:appointment_id>/', views.submit_feedback, name='submit_feedback'),
+    path('free-slots/<int:doctor_id>/', views.free_slots, name='free_slots'),
+    path('export/', views.export_appointments, name='export'),
+    path('search/', views.search_appointments, name='search'),
+    path('events/', events.stream, name='events'),
+    path('top-rated/', views.top_rated_doctors, name='top_rated_doctors'),
+    path('api/', api.appointments, name='api_appointments'),
+    path('api/<int:appointment_id>/', api.appointment, name='api_appointment'),
+    path('api/<int:appointment_id>/accept/', api.accept, name='api_accept'),
+    path('api/<int:appointment_id>/status/', api.update_status, name='api_status'),
+    path('api/<int:appointment_id>/prescription/', api.add_prescription, name='api_prescription'),
+    path('api/<int:appointment_id>/feedback/', api.submit_feedback, name='api_feedback'),
 ]
\ No newline at end of file
@@ -3,48 +3,67 @@
 # Create your views here.
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
 from django.contrib import messages
-from django.http import Http404
-from django.db.models import Count
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import BadRequest
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.db.models import Count, Q
 from django.db import transaction
 from django.utils import timezone
-from .models import Appointment, Prescription, Feedback
+from .models import Appointment, DoctorRatingSummary, Prescription, Feedback
 from .forms import AppointmentForm, PrescriptionForm, FeedbackForm
+from .pagination import paginate
+from accounts import directory
+from . import booking, bulk, export, search, slots, stats
+from functools import wraps
+import asyncio
 import datetime
 
+TOP_RATED = 20
+# Fewer ratings than this and a single review decides the ranking
+TOP_RATED_MIN_RATINGS = 3
+
+def _denied(request, role):
+    if not request.user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    if role is not None and request.user.role != role:
+        messages.error(request, 'You do not have permission to access this page.')
+        return redirect('accounts:dashboard')
+    return None
+
 def role_required(role):
+    # Also covers login_required, so views don't need both decorators.
+    # role=None only requires a login; Django's login_required can't wrap
+    # async views.
     def decorator(view_func):
+        if asyncio.iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                # Load the user off the event loop; templates and views then
+                # read the resolved object instead of the lazy one.
+                request.user = await request.auser()
+                return _denied(request, role) or await view_func(request, *args, **kwargs)
+            return async_wrapper
+
+        @wraps(view_func)
         def wrapper(request, *args, **kwargs):
-            if not request.user.is_authenticated:
-                return redirect('accounts:login')
-            if request.user.role != role:
-                messages.error(request, 'You do not have permission to access this page.')
-                return redirect('accounts:dashboard')
-            return view_func(request, *args, **kwargs)
+            return _denied(request, role) or view_func(request, *args, **kwargs)
         return wrapper
     return decorator
 
-@login_required
 @role_required('patient')
 def book_appointment(request):
     if request.method == 'POST':
         form = AppointmentForm(request.POST)
         if form.is_valid():
-            appointment_date = form.cleaned_data['appointment_date']
-            
-            # Check if patient already has 2 appointments on the same day
-            same_day_appointments = Appointment.objects.filter(
-                patient=request.user,
-                appointment_date=appointment_date
-            ).count()
-            
-            if same_day_appointments >= 2:
-                messages.error(request, 'You cannot book more than 2 appointments on the same day.')
-                return render(request, 'appointments/book_appointment.html', {'form': form})
-            
             appointment = form.save(commit=False)
             appointment.patient = request.user
-            appointment.save()
+            try:
+                booking.book(appointment)
+            except booking.BookingError as e:
+                messages.error(request, str(e))
+                return render(request, 'appointments/book_appointment.html', {'form': form})
             
             messages.success(request, 'Appointment booked successfully!')
             return redirect('appointments:appointments_list')
@@ -56,11 +75,15 @@ def book_appointment(request):
 @login_required
 def appointments_list(request):
     if request.user.is_patient():
-        appointments = Appointment.objects.filter(patient=request.user).order_by('-created_at')
+        appointments = Appointment.objects.for_patient(request.user)
     else:
-        appointments = Appointment.objects.filter(status='pending').order_by('-created_at')
+        appointments = Appointment.objects.pending_queue()
     
-    return render(request, 'appointments/appointments_list.html', {'appointments': appointments})
+    page = paginate(appointments, request.GET.get('cursor'))
+    return render(request, 'appointments/appointments_list.html', {
+        'appointments': page,
+        'page': page,
+    })
 
 '''@login_required
 @role_required('doctor')
@@ -74,40 +97,69 @@ def accept_appointment(request, appointment_id):
         messages.success(request, 'Appointment accepted successfully!')
     
     return redirect('appointments:my_appointments')'''
-@login_required
 @role_required('doctor')
 def accept_appointment(request, appointment_id):
     appointment = get_object_or_404(Appointment, id=appointment_id, status='pending')
     
     # Check if the current doctor is the assigned doctor for this appointment
-    if not (appointment.doctor == request.user or appointment.preferred_doctor == request.user):
+    if request.user.id not in (appointment.doctor_id, appointment.preferred_doctor_id):
         messages.error(request, 'You are not authorized to accept this appointment.')
         return redirect('appointments:my_appointments')
     
     with transaction.atomic():
-        appointment.status = 'confirmed'
-        appointment.doctor = request.user  # Assign the doctor who accepted
-        appointment.save()
-        
+        old_doctor_id = appointment.doctor_id
+        # Only one doctor can win the pending -> confirmed move
+        accepted = appointment.transition_to(
+            'confirmed',
+            condition=Q(doctor=request.user) | Q(preferred_doctor=request.user),
+            doctor=request.user,  # Assign the doctor who accepted
+        )
+        if accepted:
+            stats.record_transition(appointment, 'pending', old_doctor_id)
+            slots.record_transition(appointment)
+    
+    if accepted:
         messages.success(request, 'Appointment accepted successfully!')
-        return redirect('appointments:my_appointments')
+    else:
+        messages.error(request, 'This appointment has already been accepted.')
+    return redirect('appointments:my_appointments')
 
-@login_required
 @role_required('doctor')
 def my_appointments(request):
-    appointments = Appointment.objects.filter(doctor=request.user).order_by('-created_at')
-    return render(request, 'appointments/my_appointments.html', {'appointments': appointments})
+    appointments = Appointment.objects.for_doctor(request.user)
+    page = paginate(appointments, request.GET.get('cursor'))
+    return render(request, 'appointments/my_appointments.html', {
+        'appointments': page,
+        'page': page,
+    })
 
 @login_required
+def free_slots(request, doctor_id):
+    if doctor_id not in directory.doctor_ids():
+        raise Http404("Doctor not found")
+    try:
+        count = max(1, min(int(request.GET.get('n', 5)), 50))
+    except ValueError:
+        count = 5
+    available = slots.next_free_slots(doctor_id, count)
+    return JsonResponse({
+        'doctor': doctor_id,
+        'slots': [start.isoformat(timespec='minutes') for start in available],
+    })
+
 @role_required('doctor')
 def update_appointment_status(request, appointment_id):
     appointment = get_object_or_404(Appointment, id=appointment_id, doctor=request.user)
     
     if request.method == 'POST':
         new_status = request.POST.get('status')
-        if appointment.can_transition_to(new_status):
-            appointment.status = new_status
-            appointment.save()
+        with transaction.atomic():
+            old_status = appointment.status
+            updated = appointment.transition_to(new_status, condition=Q(doctor=request.user))
+            if updated:
+                stats.record_transition(appointment, old_status, appointment.doctor_id)
+                slots.record_transition(appointment)
+        if updated:
             messages.success(request, f'Appointment status updated to {new_status}.')
         else:
             messages.error(request, 'Invalid status transition.')
@@ -116,9 +168,39 @@ def update_appointment_status(request, appointment_id):
 
 
 
+@role_required('doctor')
+def bulk_update_status(request):
+    if request.method != 'POST':
+        return redirect('appointments:my_appointments')
+    new_status = request.POST.get('status')
+    if new_status not in dict(Appointment.STATUS_CHOICES):
+        raise BadRequest('Unknown status.')
+    try:
+        ids = [int(pk) for pk in request.POST.getlist('appointment_ids')]
+    except ValueError:
+        raise BadRequest('Invalid appointment id.')
+    if not ids or len(ids) > bulk.MAX_BATCH:
+        raise BadRequest(f'Select between 1 and {bulk.MAX_BATCH} appointments.')
+
+    results = bulk.transition(ids, new_status, doctor=request.user)
+    if not request.accepts('text/html'):
+        return JsonResponse({'status': new_status, 'results': {str(pk): result for pk, result in results.items()}})
+
+    updated = sum(result == bulk.UPDATED for result in results.values())
+    if updated:
+        messages.success(request, f'{updated} appointment(s) updated to {new_status}.')
+    if updated < len(results):
+        messages.error(request, f'{len(results) - updated} appointment(s) could not be updated.')
+    if new_status == 'confirmed':
+        return redirect('appointments:appointments_list')
+    return redirect('appointments:my_appointments')
+
 @login_required
 def appointment_detail(request, appointment_id):
-    appointment = get_object_or_404(Appointment, id=appointment_id)
+    appointment = get_object_or_404(
+        Appointment.objects.select_related('patient', 'doctor', 'preferred_doctor').with_records(),
+        id=appointment_id
+    )
     
     # Check if user has permission to view this appointment
     # Allow patient, assigned doctor, or preferred doctor to view
@@ -152,7 +234,6 @@ def appointment_detail(request, appointment_id):
     
     return render(request, 'appointments/appointment_detail.html', context)
 
-@login_required
 @role_required('doctor')
 def add_prescription(request, appointment_id):
     appointment = get_object_or_404(Appointment, id=appointment_id, doctor=request.user, status='completed')
@@ -174,7 +255,6 @@ def add_prescription(request, appointment_id):
     
     return render(request, 'appointments/add_prescription.html', {'form': form, 'appointment': appointment})
 
-@login_required
 @role_required('patient')
 def submit_feedback(request, appointment_id):
     appointment = get_object_or_404(Appointment, id=appointment_id, patient=request.user, status='completed')
@@ -190,10 +270,58 @@ def submit_feedback(request, appointment_id):
             feedback.appointment = appointment
             feedback.patient = request.user
             feedback.doctor = appointment.doctor
-            feedback.save()
+            with transaction.atomic():
+                feedback.save()
+                stats.record_feedback(feedback)
             messages.success(request, 'Feedback submitted successfully!')
             return redirect('appointments:appointment_detail', appointment_id=appointment.id)
     else:
         form = FeedbackForm()
     
-    return render(request, 'appointments/feedback_form.html', {'form': form, 'appointment': appointment})
\ No newline at end of file
+    return render(request, 'appointments/feedback_form.html', {'form': form, 'appointment': appointment})
+
+@staff_member_required
+def export_appointments(request):
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in ('csv', 'jsonl'):
+        raise BadRequest('Unknown export format.')
+    try:
+        date_from = datetime.date.fromisoformat(request.GET['from']) if request.GET.get('from') else None
+        date_to = datetime.date.fromisoformat(request.GET['to']) if request.GET.get('to') else None
+        doctor_id = int(request.GET['doctor']) if request.GET.get('doctor') else None
+    except ValueError:
+        raise BadRequest('Invalid export filter.')
+    # Rows are fetched, encoded and compressed chunk by chunk as the client reads
+    response = StreamingHttpResponse(
+        export.export(fmt, date_from=date_from, date_to=date_to, doctor_id=doctor_id),
+        content_type='application/gzip',
+    )
+    response['Content-Disposition'] = f'attachment; filename="appointments.{fmt}.gz"'
+    return response
+
+def top_rated_doctors(request):
+    # Public. Reads the summary table in rating_top_idx order; nothing is
+    # averaged over Feedback here.
+    summaries = DoctorRatingSummary.top_rated(min_ratings=TOP_RATED_MIN_RATINGS).filter(
+        doctor__is_active=True
+    )[:TOP_RATED]
+    return render(request, 'appointments/top_rated_doctors.html', {
+        'summaries': summaries,
+        'min_ratings': TOP_RATED_MIN_RATINGS,
+    })
+
+
+@role_required('doctor')
+def search_appointments(request):
+    query = request.GET.get('q', '').strip()
+    try:
+        page = max(1, int(request.GET.get('page', 1)))
+    except ValueError:
+        page = 1
+    results, has_next = search.search(query, request.user, page=page)
+    return render(request, 'appointments/search.html', {
+        'query': query,
+        'results': results,
+        'page_number': page,
+        'has_next': has_next,
+    })
@@ -0,0 +1,64 @@
+"""
+Benchmarks for MediTrack Lite. Run them from medi/mtrack, e.g.
+
+    python -m benchmarks.transitions
+
+Every benchmark builds a throwaway test database; db.sqlite3 is never touched.
+"""
+import os
+import statistics
+import time
+from contextlib import contextmanager
+
+
+def setup():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mtrack.settings')
+    import django
+    django.setup()
+
+
+@contextmanager
+def test_database():
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def shared_caches():
+    # CACHES with the 'shared' cache that SHARED_CACHE_DIR would configure;
+    # one process plays every worker, so local memory stands in for it
+    from django.conf import settings
+
+    shared = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bench-shared'}
+    return {**settings.CACHES, 'shared': shared}
+
+
+def timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def summarize(samples):
+    return {
+        'p50': percentile(samples, 50),
+        'p95': percentile(samples, 95),
+        'p99': percentile(samples, 99),
+        'mean': statistics.fmean(samples),
+    }
+
+
+def report(name, count, seconds):
+    print(f'{name:<40} {count:>8} ops {seconds:>8.3f}s {count / seconds:>12.0f} ops/s')
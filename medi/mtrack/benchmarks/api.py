@@ -0,0 +1,66 @@
+"""
+What a polling client pays per request: the HTML pages versus the JSON
+API, and the API again with If-None-Match once the client has an ETag.
+
+    python -m benchmarks.api [--requests 200]
+"""
+import argparse
+import io
+
+from benchmarks import setup, summarize, test_database, timed
+
+
+def run(client, url, requests, **headers):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    client.get(url, **headers)  # warm caches (principal, templates)
+    samples, sizes = [], []
+    with CaptureQueriesContext(connection) as ctx:
+        for _ in range(requests):
+            seconds, response = timed(client.get, url, **headers)
+            assert response.status_code in (200, 304), (url, response.status_code)
+            samples.append(seconds * 1000)
+            sizes.append(len(response.content))
+    return summarize(samples), sum(sizes) / requests, len(ctx.captured_queries) / requests, response
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    setup()
+    from django.core.management import call_command
+    from django.db.models import Count
+    from django.test import Client
+    from django.urls import reverse
+
+    from accounts.models import User
+    from appointments.models import Appointment
+
+    with test_database():
+        call_command('seed_meditrack', doctors=10, patients=50, appointments=2000, stdout=io.StringIO())
+        patient = User.objects.filter(role='patient').annotate(n=Count('patient_appointments')).latest('n')
+        appointment = Appointment.objects.filter(patient=patient, prescription__isnull=False).first()
+        client = Client()
+        client.force_login(patient)
+
+        pages = [
+            ('list', reverse('appointments:appointments_list'), reverse('appointments:api_appointments')),
+            ('detail', reverse('appointments:appointment_detail', args=[appointment.id]),
+             reverse('appointments:api_appointment', args=[appointment.id])),
+        ]
+        print(f'{args.requests} requests per row')
+        print(f'{"request":<22} {"p50 ms":>8} {"p95 ms":>8} {"bytes":>8} {"queries":>8}')
+        for name, html_url, api_url in pages:
+            latency, size, queries, _ = run(client, html_url, args.requests)
+            print(f'{name + " html":<22} {latency["p50"]:>8.2f} {latency["p95"]:>8.2f} {size:>8.0f} {queries:>8.1f}')
+            latency, size, queries, response = run(client, api_url, args.requests)
+            print(f'{name + " json":<22} {latency["p50"]:>8.2f} {latency["p95"]:>8.2f} {size:>8.0f} {queries:>8.1f}')
+            latency, size, queries, _ = run(client, api_url, args.requests, HTTP_IF_NONE_MATCH=response['ETag'])
+            print(f'{name + " json 304":<22} {latency["p50"]:>8.2f} {latency["p95"]:>8.2f} {size:>8.0f} {queries:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+Read-page throughput under concurrent load: the sync views behind the WSGI
+handler (one thread per in-flight request) versus the async views behind
+the ASGI handler (one event loop), in-process like a uvicorn/daphne worker.
+
+    python -m benchmarks.asgi [--concurrency 32] [--requests 20]
+
+Requests are driven through Django's test clients, so the numbers cover
+middleware, views and templates but not socket I/O.
+"""
+import argparse
+import asyncio
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import setup, summarize, test_database
+
+PAGES = ['accounts:dashboard', 'appointments:appointments_list', 'appointments:my_appointments']
+
+
+def use_async_views(enabled):
+    import importlib
+
+    from django.conf import settings
+    from django.urls import clear_url_caches
+
+    import accounts.urls
+    import appointments.urls
+    import mtrack.urls
+
+    settings.ASYNC_VIEWS = enabled
+    for module in (accounts.urls, appointments.urls, mtrack.urls):
+        importlib.reload(module)
+    clear_url_caches()
+
+
+def wsgi_clients(users, urls):
+    from django.test import Client
+
+    clients = []
+    for user in users:
+        client = Client()
+        client.force_login(user)
+        # Log in and fill each session's cached principal up front: SQLite
+        # can't take those session writes concurrently
+        for url in urls:
+            client.get(url)
+        clients.append(client)
+    return clients
+
+
+def asgi_clients(users, urls):
+    from django.test import AsyncClient
+
+    clients = []
+    for user in users:
+        client = AsyncClient()
+        client.force_login(user)
+        clients.append(client)
+
+    async def warm():
+        for client in clients:
+            for url in urls:
+                await client.get(url)
+
+    asyncio.run(warm())
+    return clients
+
+
+def fetch_all(client, urls, requests):
+    samples = []
+    for i in range(requests):
+        started = time.perf_counter()
+        response = client.get(urls[i % len(urls)])
+        assert response.status_code == 200, response.status_code
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+async def afetch_all(client, urls, requests):
+    samples = []
+    for i in range(requests):
+        started = time.perf_counter()
+        response = await client.get(urls[i % len(urls)])
+        assert response.status_code == 200, response.status_code
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def run_wsgi(clients, urls, requests):
+    from django.db import connections
+
+    def worker(client):
+        try:
+            return fetch_all(client, urls, requests)
+        finally:
+            connections.close_all()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(clients)) as pool:
+        results = list(pool.map(worker, clients))
+    return time.perf_counter() - started, [sample for result in results for sample in result]
+
+
+def run_asgi(clients, urls, requests):
+    async def main():
+        return await asyncio.gather(*(afetch_all(client, urls, requests) for client in clients))
+
+    started = time.perf_counter()
+    results = asyncio.run(main())
+    return time.perf_counter() - started, [sample for result in results for sample in result]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=20, help='Requests per concurrent client.')
+    args = parser.parse_args()
+
+    setup()
+    from django.core.management import call_command
+    from django.urls import reverse
+
+    from accounts.models import User
+
+    with test_database():
+        call_command('seed_meditrack', doctors=args.concurrency, patients=args.concurrency * 5,
+                     appointments=args.concurrency * 60, stdout=io.StringIO())
+        doctors = list(User.objects.filter(role='doctor'))
+        print(f'{args.concurrency} concurrent doctors x {args.requests} requests')
+        print(f'{"handler":<8} {"req/s":>9} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9}')
+        modes = (('wsgi', False, wsgi_clients, run_wsgi), ('asgi', True, asgi_clients, run_asgi))
+        for name, async_views, make_clients, run in modes:
+            use_async_views(async_views)
+            urls = [reverse(page) for page in PAGES]
+            clients = make_clients(doctors[:args.concurrency], urls)
+            seconds, samples = run(clients, urls, args.requests)
+            latency = summarize([sample * 1000 for sample in samples])
+            print(f'{name:<8} {len(samples) / seconds:>9.0f} {latency["p50"]:>9.2f} '
+                  f'{latency["p95"]:>9.2f} {latency["p99"]:>9.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Per-request authentication overhead: Django's AuthenticationMiddleware
+versus accounts.middleware.PrincipalAuthenticationMiddleware, with a
+shared cache configured as it requires.
+
+    python -m benchmarks.auth [--requests 2000]
+"""
+import argparse
+
+from benchmarks import setup, shared_caches, summarize, test_database, timed
+
+STOCK = 'django.contrib.auth.middleware.AuthenticationMiddleware'
+PRINCIPAL = 'accounts.middleware.PrincipalAuthenticationMiddleware'
+
+
+def run(middleware, requests, user):
+    from django.conf import settings
+    from django.db import connection
+    from django.test import Client, override_settings
+    from django.test.utils import CaptureQueriesContext
+    from django.urls import reverse
+
+    stack = [middleware if name in (STOCK, PRINCIPAL) else name for name in settings.MIDDLEWARE]
+    url = reverse('accounts:doctor_lookup')
+    # The principal cache needs the shared cache (SHARED_CACHE_DIR)
+    with override_settings(MIDDLEWARE=stack, CACHES=shared_caches()):
+        client = Client()
+        client.force_login(user)
+        client.get(url)
+        samples = []
+        with CaptureQueriesContext(connection) as ctx:
+            for _ in range(requests):
+                seconds, response = timed(client.get, url)
+                assert response.status_code == 200
+                samples.append(seconds * 1000)
+    return summarize(samples), len(ctx.captured_queries) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    setup()
+    from accounts.models import User
+
+    with test_database():
+        user = User.objects.create(username='bench', role='patient', first_name='Bench')
+        print(f'{"middleware":<20} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"queries/req":>12}')
+        for name, middleware in (('stock', STOCK), ('principal cache', PRINCIPAL)):
+            latency, queries = run(middleware, args.requests, user)
+            print(f'{name:<20} {latency["p50"]:>8.3f} {latency["p95"]:>8.3f} {latency["p99"]:>8.3f} {queries:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+Concurrent booking throughput for each database profile: SQLite with its
+defaults (rollback journal, synchronous=FULL), SQLite with the pragmas from
+mtrack/db.py, and PostgreSQL when one is reachable.
+
+    python -m benchmarks.booking [--threads 16] [--bookings 400]
+
+Each profile runs in its own process against a file-backed test database,
+so journal and fsync settings take effect as they would in production. For
+the PostgreSQL run, start a throwaway server first, e.g.
+
+    docker run --rm -p 5432:5432 -e POSTGRES_USER=meditrack \\
+        -e POSTGRES_PASSWORD=meditrack postgres:16
+
+and pass --postgres (the DB_* variables from settings apply).
+"""
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import setup, summarize, test_database
+
+PROFILES = {
+    'sqlite default': {'DB_ENGINE': 'sqlite', 'SQLITE_TUNED': 'False'},
+    'sqlite tuned': {'DB_ENGINE': 'sqlite', 'SQLITE_TUNED': 'True'},
+    'postgresql': {'DB_ENGINE': 'postgresql'},
+}
+
+
+def run_bookings(threads, bookings):
+    from django.contrib.auth import get_user_model
+    from django.db import connections
+
+    from appointments import booking, slots
+    from appointments.models import Appointment
+
+    User = get_user_model()
+    patients = User.objects.bulk_create([User(username=f'bench-patient{i}', role='patient') for i in range(threads * 4)])
+    doctors = User.objects.bulk_create([User(username=f'bench-doctor{i}', role='doctor') for i in range(threads)])
+    start = datetime.date.today() + datetime.timedelta(days=1)
+
+    def book(i):
+        # Spread over days, doctors and hours so most bookings succeed and
+        # the run measures write throughput, not rejections
+        appointment = Appointment(
+            patient=patients[i % len(patients)],
+            preferred_doctor=doctors[i % len(doctors)],
+            appointment_date=start + datetime.timedelta(days=i // len(patients)),
+            appointment_time=slots.slot_time((i // len(doctors)) % slots.SLOTS_PER_DAY),
+            health_concern='Benchmark',
+        )
+        started = time.perf_counter()
+        try:
+            booking.book(appointment)
+            ok = True
+        except booking.BookingError:
+            ok = False
+        return time.perf_counter() - started, ok
+
+    def worker(indexes):
+        try:
+            return [book(i) for i in indexes]
+        finally:
+            connections.close_all()
+
+    batches = [range(t, bookings, threads) for t in range(threads)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = [result for batch in pool.map(worker, batches) for result in batch]
+    seconds = time.perf_counter() - started
+    latency = summarize([sample * 1000 for sample, ok in results])
+    return {
+        'booked': Appointment.objects.count(),
+        'rejected': sum(not ok for sample, ok in results),
+        'per_second': len(results) / seconds,
+        **latency,
+    }
+
+
+def child(args):
+    setup()
+    from django.db import connection
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if connection.vendor == 'sqlite':
+            # The default in-memory test database would hide journal and fsync costs
+            connection.settings_dict['TEST']['NAME'] = os.path.join(tmp, 'bench.sqlite3')
+        with test_database():
+            print(json.dumps(run_bookings(args.threads, args.bookings)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--bookings', type=int, default=400)
+    parser.add_argument('--postgres', action='store_true', help='Include the PostgreSQL profile.')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args)
+
+    print(f'{args.bookings} bookings from {args.threads} threads')
+    print(f'{"profile":<16} {"book/s":>8} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"booked":>7} {"rejected":>9}')
+    for name, env in PROFILES.items():
+        if env['DB_ENGINE'] == 'postgresql' and not args.postgres:
+            print(f'{name:<16} skipped (pass --postgres with a server running)')
+            continue
+        process = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.booking', '--child',
+             '--threads', str(args.threads), '--bookings', str(args.bookings)],
+            env={**os.environ, **env}, capture_output=True, text=True,
+        )
+        if process.returncode:
+            print(f'{name:<16} failed: {process.stderr.strip().splitlines()[-1]}')
+            continue
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+        print(f'{name:<16} {result["per_second"]:>8.0f} {result["p50"]:>9.2f} {result["p95"]:>9.2f} '
+              f'{result["p99"]:>9.2f} {result["booked"]:>7} {result["rejected"]:>9}')
+
+
+if __name__ == '__main__':
+    main()
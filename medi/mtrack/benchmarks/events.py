@@ -0,0 +1,169 @@
+"""
+Memory per idle live-update stream, and how long one change takes to reach
+every stream. Thousands of doctors' EventSource connections are opened
+through the ASGI application in one event loop, as a uvicorn/daphne worker
+would hold them, then one pending booking is published to all of them.
+
+    python -m benchmarks.events [--connections 5000] [--doctors 20]
+
+Memory is measured twice: with tracemalloc (Python objects only: the
+handler task, request, response, stream generator and hub subscription)
+and as the growth of the process RSS. Neither includes the server's
+socket buffers.
+"""
+import argparse
+import asyncio
+import gc
+import io
+import resource
+import time
+import tracemalloc
+
+from benchmarks import setup, test_database
+
+
+def rss_kb():
+    with open('/proc/self/statm') as handle:
+        return int(handle.read().split()[1]) * resource.getpagesize() // 1024
+
+
+class Connection:
+    """One ASGI http connection that stays open and counts the chunks received."""
+
+    never = None
+    # Fan-out bookkeeping shared by all connections
+    received = 0
+    expected = 0
+    delivered = None
+
+    def __init__(self, cookie, url):
+        self.scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+            'method': 'GET', 'scheme': 'http', 'path': url, 'raw_path': url.encode(),
+            'query_string': b'', 'root_path': '',
+            'headers': [(b'host', b'testserver'), (b'accept', b'text/event-stream'), (b'cookie', cookie)],
+            'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+        }
+        self.status = None
+        self.ready = False
+        self.events = 0
+        self.requested = False
+
+    async def receive(self):
+        if not self.requested:
+            self.requested = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await Connection.never.wait()  # an idle client sends nothing more
+
+    async def send(self, message):
+        if message['type'] == 'http.response.start':
+            self.status = message['status']
+        elif b'event: ready' in message.get('body', b''):
+            self.ready = True
+        elif b'event: appointment' in message.get('body', b''):
+            self.events += 1
+            Connection.received += 1
+            if Connection.received == Connection.expected:
+                Connection.delivered.set()
+
+
+async def open_streams(application, cookies, url, count):
+    from appointments import events
+
+    connections = [Connection(cookies[i % len(cookies)], url) for i in range(count)]
+    tasks = [asyncio.create_task(application(c.scope, c.receive, c.send)) for c in connections]
+    # Open once the response has been through the middleware and the
+    # stream has sent its first event
+    while not all(c.ready for c in connections):
+        await asyncio.sleep(0.05)
+        failed = [c.status for c in connections if c.status not in (None, 200)]
+        assert not failed, f'streams refused: {failed[:5]}'
+    assert len(events.hub) == count
+    return connections, tasks
+
+
+async def close_streams(tasks):
+    from appointments import events
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    # Cancelled handlers don't close their responses
+    events.hub = events.Hub()
+
+
+async def fan_out(connections, appointment):
+    from appointments import events
+
+    Connection.received, Connection.expected = 0, len(connections)
+    Connection.delivered = asyncio.Event()
+    started = time.perf_counter()
+    events.broker().publish(events.message(appointment, None))
+    await Connection.delivered.wait()
+    seconds = time.perf_counter() - started
+    assert all(c.events == 1 for c in connections)
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--connections', type=int, default=5000)
+    parser.add_argument('--doctors', type=int, default=20)
+    args = parser.parse_args()
+
+    setup()
+    from django.conf import settings
+    from django.core.management import call_command
+    from django.test import Client
+    from django.urls import reverse
+
+    from accounts.models import User
+    from appointments import events
+    from appointments.models import Appointment
+    from mtrack.asgi import application
+
+    with test_database():
+        call_command('seed_meditrack', doctors=args.doctors, patients=10, appointments=20, stdout=io.StringIO())
+        cookies = []
+        for doctor in User.objects.filter(role='doctor'):
+            client = Client()
+            client.force_login(doctor)
+            # Fill the session's cached principal now; concurrent first
+            # requests would all try to write it
+            client.get(reverse('accounts:dashboard'))
+            cookies.append(f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'.encode())
+        appointment = Appointment.objects.filter(status='pending').first()
+        url = reverse('appointments:events')
+
+        async def run(trace):
+            Connection.never = asyncio.Event()
+            # Warm up the handler, middleware and session cache
+            connections, tasks = await open_streams(application, cookies, url, len(cookies))
+            await close_streams(tasks)
+            events._broker = None
+
+            gc.collect()
+            if trace:
+                tracemalloc.start()
+            before = tracemalloc.get_traced_memory()[0] if trace else rss_kb() * 1024
+            started = time.perf_counter()
+            connections, tasks = await open_streams(application, cookies, url, args.connections)
+            opened = time.perf_counter() - started
+            gc.collect()
+            after = tracemalloc.get_traced_memory()[0] if trace else rss_kb() * 1024
+            if trace:
+                tracemalloc.stop()
+            seconds = await fan_out(connections, appointment)
+            await close_streams(tasks)
+            return (after - before) / args.connections, opened, seconds
+
+        rss, opened, seconds = asyncio.run(run(trace=False))
+        traced, _, _ = asyncio.run(run(trace=True))
+        print(f'{args.connections} idle streams over {len(cookies)} doctors, opened in {opened:.2f}s')
+        print(f'{"memory per stream (tracemalloc)":<36} {traced / 1024:>8.1f} KB')
+        print(f'{"memory per stream (RSS growth)":<36} {rss / 1024:>8.1f} KB')
+        print(f'{"one change to every stream":<36} {seconds * 1000:>8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Database round trips and latency per step of a patient's visit (log in,
+dashboard, list, book, list again) under each session engine and message
+storage.
+
+    python -m benchmarks.sessions [--visits 50]
+
+Passwords use a fast hasher here so the login step measures the session
+work rather than PBKDF2.
+"""
+import argparse
+import datetime
+import io
+
+from benchmarks import setup, shared_caches, summarize, test_database, timed
+
+PROFILES = [
+    ('db + fallback messages (before)', 'db', 'django.contrib.messages.storage.fallback.FallbackStorage'),
+    ('cached_db + cookie messages', 'cached_db', 'django.contrib.messages.storage.cookie.CookieStorage'),
+    ('signed_cookies + cookie messages', 'signed_cookies', 'django.contrib.messages.storage.cookie.CookieStorage'),
+]
+STEPS = ['login', 'dashboard', 'list', 'book', 'list after book']
+
+
+def visit(client, patient, doctor, day):
+    from django.urls import reverse
+
+    list_url = reverse('appointments:appointments_list')
+    yield 'login', lambda: client.post(reverse('accounts:login'), {'username': patient.username, 'password': 'bench'})
+    yield 'dashboard', lambda: client.get(reverse('accounts:dashboard'))
+    yield 'list', lambda: client.get(list_url)
+    yield 'book', lambda: client.post(reverse('appointments:book_appointment'), {
+        'preferred_doctor': doctor.id,
+        'appointment_date': datetime.date.today() + datetime.timedelta(days=day),
+        'appointment_time': '10:00',
+        'health_concern': 'Benchmark',
+    })
+    yield 'list after book', lambda: client.get(list_url)
+
+
+def run(engine, storage, visits, patients, doctor, first_day):
+    from django.core.cache import caches
+    from django.db import connection
+    from django.test import Client, override_settings
+    from django.test.utils import CaptureQueriesContext
+
+    queries = {step: [] for step in STEPS}
+    latency = {step: [] for step in STEPS}
+    # As deployed with SHARED_CACHE_DIR, which cached_db needs
+    with override_settings(
+        SESSION_ENGINE=f'django.contrib.sessions.backends.{engine}', MESSAGE_STORAGE=storage,
+        CACHES=shared_caches(), SESSION_CACHE_ALIAS='shared',
+    ):
+        caches['shared'].clear()
+        for i in range(visits):
+            # A new browser each visit; the client builds its middleware
+            # (and so its session engine) on first use
+            client = Client()
+            for step, send in visit(client, patients[i % len(patients)], doctor, first_day + i):
+                with CaptureQueriesContext(connection) as ctx:
+                    seconds, response = timed(send)
+                assert response.status_code < 400, (step, response.status_code)
+                queries[step].append(len(ctx.captured_queries))
+                latency[step].append(seconds * 1000)
+    return queries, latency
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--visits', type=int, default=50)
+    args = parser.parse_args()
+
+    setup()
+    from django.contrib.auth.hashers import make_password
+    from django.core.management import call_command
+    from django.test import override_settings
+
+    from accounts.models import User
+
+    with override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher']), test_database():
+        call_command('seed_meditrack', doctors=5, patients=50, appointments=500, stdout=io.StringIO())
+        User.objects.update(password=make_password('bench'))
+        patients = list(User.objects.filter(role='patient'))
+        doctor = User.objects.filter(role='doctor').first()
+
+        print(f'{args.visits} visits; queries per step (mean) and p50 ms')
+        print(f'{"profile":<34}' + ''.join(f' {step:>16}' for step in STEPS) + f' {"total q":>8}')
+        first_day = 60  # past the seeded range
+        for name, engine, storage in PROFILES:
+            queries, latency = run(engine, storage, args.visits, patients, doctor, first_day)
+            first_day += args.visits
+            cells = [
+                f'{sum(queries[step]) / args.visits:>5.1f}q {summarize(latency[step])["p50"]:>7.2f}ms'
+                for step in STEPS
+            ]
+            total = sum(sum(counts) for counts in queries.values()) / args.visits
+            print(f'{name:<34}' + ''.join(f' {cell:>16}' for cell in cells) + f' {total:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
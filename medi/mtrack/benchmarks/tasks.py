@@ -0,0 +1,92 @@
+"""
+Task queue throughput: enqueueing with delay() one transaction per task and
+many per transaction, then draining the queue with 1..N worker threads
+running a no-op task, so the numbers are the queue's own overhead.
+
+    python -m benchmarks.tasks [--tasks 2000] [--threads 1,2,4,8] [--batch 20]
+
+Runs against a file-backed test database so commits cost what they do in
+production; set DB_ENGINE=postgresql (and the DB_* variables) to measure
+SKIP LOCKED claiming instead of SQLite's write lock.
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from benchmarks import report, setup, test_database
+
+
+def enqueue(noop, count, per_transaction):
+    from django.db import transaction
+
+    started = time.perf_counter()
+    for start in range(0, count, per_transaction):
+        with transaction.atomic():
+            for i in range(start, min(count, start + per_transaction)):
+                noop.delay(i)
+    return time.perf_counter() - started
+
+
+def drain(threads, batch):
+    from django.db import connections
+
+    from tasks import queue
+
+    stop = threading.Event()
+    results = []
+
+    def worker(number):
+        try:
+            results.append(queue.work(queue.worker_name(number), stop, batch=batch, poll=0.01, once=True))
+        finally:
+            connections.close_all()
+
+    pool = [threading.Thread(target=worker, args=(number,)) for number in range(threads)]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return time.perf_counter() - started, sum(succeeded for succeeded, failed in results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=2000)
+    parser.add_argument('--threads', default='1,2,4,8', help='Comma-separated worker thread counts.')
+    parser.add_argument('--batch', type=int, default=20, help='Tasks a worker claims at a time.')
+    args = parser.parse_args()
+
+    setup()
+    from django.db import connection
+    from django.test import override_settings
+
+    from tasks.models import Task
+    from tasks.queue import task
+
+    @task
+    def noop(i):
+        pass
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if connection.vendor == 'sqlite':
+            connection.settings_dict['TEST']['NAME'] = os.path.join(tmp, 'bench.sqlite3')
+        with override_settings(TASKS_EAGER=False), test_database():
+            print(f'{connection.vendor}, {args.tasks} tasks')
+            for per_transaction in (1, 100):
+                Task.objects.all().delete()
+                seconds = enqueue(noop, args.tasks, per_transaction)
+                report(f'enqueue, {per_transaction} per transaction', args.tasks, seconds)
+
+            for threads in [int(n) for n in args.threads.split(',')]:
+                Task.objects.all().delete()
+                enqueue(noop, args.tasks, 100)
+                seconds, ran = drain(threads, args.batch)
+                assert ran == args.tasks and not Task.objects.exists(), (ran, Task.objects.count())
+                report(f'dequeue+run, {threads} thread(s), batch {args.batch}', ran, seconds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Rendering a 1,000-row my_appointments page: templates re-read and re-parsed
+with no fragment cache, compiled once with no fragment cache, and compiled
+with the per-row {% cache %} fragments cold and warm.
+
+    python -m benchmarks.templates [--rows 1000] [--renders 20]
+"""
+import argparse
+import io
+import re
+
+from benchmarks import setup, summarize, test_database, timed
+
+TEMPLATE = 'appointments/my_appointments.html'
+DUMMY = {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+# The CSRF token is masked differently on every render
+CSRF_TOKEN = re.compile(r'name="csrfmiddlewaretoken" value="\w+"')
+
+
+def uncompiled_engine():
+    from django.template import Engine, engines
+
+    engine = engines['django'].engine
+    # Same dirs and context processors, minus the cached loader
+    return Engine(
+        dirs=engine.dirs,
+        context_processors=engine.context_processors,
+        loaders=['django.template.loaders.filesystem.Loader', 'django.template.loaders.app_directories.Loader'],
+        libraries=engine.libraries,
+    )
+
+
+def render(get_template, request, context):
+    from django.template import RequestContext
+
+    return get_template(TEMPLATE).render(RequestContext(request, context))
+
+
+def run(name, get_template, fragments, request, context, renders, warm):
+    from django.conf import settings
+    from django.core.cache import caches
+    from django.test import override_settings
+
+    with override_settings(CACHES={**settings.CACHES, 'template_fragments': fragments}):
+        caches['template_fragments'].clear()
+        if warm:
+            render(get_template, request, context)
+        samples = []
+        for _ in range(renders):
+            if not warm:
+                caches['template_fragments'].clear()
+            seconds, html = timed(render, get_template, request, context)
+            samples.append(seconds * 1000)
+    result = summarize(samples)
+    print(f'{name:<34} {result["p50"]:>9.2f} {result["p95"]:>9.2f} {result["mean"]:>9.2f}')
+    return html
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--renders', type=int, default=20)
+    args = parser.parse_args()
+
+    setup()
+    from django.conf import settings
+    from django.core.management import call_command
+    from django.template import engines
+    from django.test import RequestFactory
+
+    from accounts.models import User
+    from appointments.models import Appointment
+
+    with test_database():
+        call_command('seed_meditrack', doctors=1, patients=args.rows // 10 + 1, appointments=args.rows,
+                     stdout=io.StringIO())
+        doctor = User.objects.get(role='doctor')
+        request = RequestFactory().get('/appointments/my-appointments/')
+        request.user = doctor
+        context = {
+            'appointments': list(Appointment.objects.for_listing().order_by('-created_at', '-id')[:args.rows]),
+        }
+        print(f'{len(context["appointments"])} rows, {args.renders} renders')
+        print(f'{"mode":<34} {"p50 ms":>9} {"p95 ms":>9} {"mean ms":>9}')
+
+        compiled = engines['django'].engine.get_template
+        fragments = settings.CACHES['template_fragments']
+        baseline = run('re-parsed, no fragment cache', uncompiled_engine().get_template,
+                       DUMMY, request, context, args.renders, warm=False)
+        run('compiled, no fragment cache', compiled, DUMMY, request, context, args.renders, warm=False)
+        run('compiled, fragment cache cold', compiled, fragments, request, context, args.renders, warm=False)
+        cached = run('compiled, fragment cache warm', compiled, fragments, request, context, args.renders, warm=True)
+        assert CSRF_TOKEN.sub('', cached) == CSRF_TOKEN.sub('', baseline), 'cached rows render differently'
+
+
+if __name__ == '__main__':
+    main()
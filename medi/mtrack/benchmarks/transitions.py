@@ -0,0 +1,88 @@
+"""
+Status transition throughput: full-row save() versus the conditional
+UPDATE in Appointment.transition_to, plus a check that concurrent accepts
+of the same appointment produce exactly one winner.
+
+    python -m benchmarks.transitions [--count 2000] [--threads 8]
+"""
+import argparse
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import report, setup, test_database, timed
+
+
+def make_appointments(count, patient, doctor):
+    from appointments.models import Appointment
+
+    # One appointment per day keeps every batch clear of the per-day limit
+    start = datetime.date.today() + datetime.timedelta(days=1 + Appointment.objects.count())
+    Appointment.objects.bulk_create([
+        Appointment(
+            patient=patient,
+            preferred_doctor=doctor,
+            appointment_date=start + datetime.timedelta(days=i),
+            appointment_time=datetime.time(10, 0),
+            health_concern='Benchmark',
+        )
+        for i in range(count)
+    ])
+    return list(Appointment.objects.filter(status='pending').order_by('id'))[:count]
+
+
+def full_save(appointments, doctor):
+    for appointment in appointments:
+        for status in ('confirmed', 'in_progress', 'completed'):
+            if appointment.can_transition_to(status):
+                appointment.status = status
+                appointment.doctor = doctor
+                appointment.save()
+
+
+def compare_and_swap(appointments, doctor):
+    for appointment in appointments:
+        appointment.transition_to('confirmed', doctor=doctor)
+        appointment.transition_to('in_progress')
+        appointment.transition_to('completed')
+
+
+def contended_accepts(appointment, doctor, threads):
+    from django.db import connections
+    from appointments.models import Appointment
+
+    def accept(_):
+        try:
+            return Appointment.objects.get(pk=appointment.pk).transition_to('confirmed', doctor=doctor)
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return sum(pool.map(accept, range(threads)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    setup()
+    from django.contrib.auth import get_user_model
+    User = get_user_model()
+
+    with test_database():
+        patient = User.objects.create(username='bench-patient', role='patient')
+        doctor = User.objects.create(username='bench-doctor', role='doctor')
+        transitions = args.count * 3
+
+        for name, func in (('full-row save()', full_save), ('conditional UPDATE', compare_and_swap)):
+            appointments = make_appointments(args.count, patient, doctor)
+            seconds, _ = timed(func, appointments, doctor)
+            report(name, transitions, seconds)
+
+        winners = contended_accepts(make_appointments(1, patient, doctor)[0], doctor, args.threads)
+        print(f'{args.threads} concurrent accepts of one appointment: {winners} succeeded')
+
+
+if __name__ == '__main__':
+    main()
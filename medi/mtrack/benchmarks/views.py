@@ -0,0 +1,230 @@
+"""
+Latency, queries and allocations for every page in accounts/ and
+appointments/, on a database filled by the seed_meditrack command.
+
+    python -m benchmarks.views [--requests 50] [--appointments 2000]
+    python -m benchmarks.views --write-baseline   # after an intended change
+
+Settings are those of a multi-worker deployment: a shared cache
+(SHARED_CACHE_DIR, with cached_db sessions) and run_tasks workers
+(TASKS_EAGER=False). Results are compared with
+benchmarks/baselines/views.json; the exit status is 1 when a view needs
+more queries than the baseline, or its p95 latency or allocations grow
+beyond --tolerance.
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import tracemalloc
+
+from benchmarks import setup, shared_caches, summarize, test_database, timed
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baselines', 'views.json')
+ALLOCATION_SAMPLES = 10
+
+
+def scenarios(patient, doctor, staff, appointment, pending, completed, unprescribed, confirmed_ids):
+    """(name, user, method, url name, url kwargs, data) for every route."""
+    return [
+        ('accounts:register', None, 'get', 'accounts:register', {}, None),
+        ('accounts:login', None, 'get', 'accounts:login', {}, None),
+        ('accounts:logout', patient, 'post', 'accounts:logout', {}, None),
+        ('accounts:dashboard patient', patient, 'get', 'accounts:dashboard', {}, None),
+        ('accounts:dashboard doctor', doctor, 'get', 'accounts:dashboard', {}, None),
+        ('accounts:doctor_lookup', patient, 'get', 'accounts:doctor_lookup', {}, {'q': 'Cardio'}),
+        ('appointments:book_appointment', patient, 'get', 'appointments:book_appointment', {}, None),
+        ('appointments:appointments_list patient', patient, 'get', 'appointments:appointments_list', {}, None),
+        ('appointments:appointments_list doctor', doctor, 'get', 'appointments:appointments_list', {}, None),
+        ('appointments:my_appointments', doctor, 'get', 'appointments:my_appointments', {}, None),
+        ('appointments:accept_appointment', pending.preferred_doctor, 'post',
+         'appointments:accept_appointment', {'appointment_id': pending.id}, None),
+        ('appointments:appointment_detail', patient, 'get',
+         'appointments:appointment_detail', {'appointment_id': appointment.id}, None),
+        ('appointments:update_status', doctor, 'post',
+         'appointments:update_status', {'appointment_id': appointment.id}, {'status': 'in_progress'}),
+        ('appointments:bulk_status', doctor, 'post', 'appointments:bulk_status', {},
+         {'status': 'in_progress', 'appointment_ids': confirmed_ids}),
+        ('appointments:add_prescription', unprescribed.doctor, 'get',
+         'appointments:add_prescription', {'appointment_id': unprescribed.id}, None),
+        ('appointments:submit_feedback', completed.patient, 'get',
+         'appointments:submit_feedback', {'appointment_id': completed.id}, None),
+        ('appointments:free_slots', patient, 'get', 'appointments:free_slots', {'doctor_id': doctor.id}, None),
+        ('appointments:export', staff, 'get', 'appointments:export', {}, {'format': 'jsonl'}),
+        ('appointments:search', doctor, 'get', 'appointments:search', {}, {'q': 'pain'}),
+        # 204 under WSGI; benchmarks/events.py covers the ASGI stream
+        ('appointments:events', patient, 'get', 'appointments:events', {}, None),
+        ('appointments:top_rated_doctors', None, 'get', 'appointments:top_rated_doctors', {}, None),
+        ('appointments:api_appointments', patient, 'get', 'appointments:api_appointments', {}, None),
+        ('appointments:api_appointment', patient, 'get',
+         'appointments:api_appointment', {'appointment_id': appointment.id}, None),
+        ('appointments:api_accept', pending.preferred_doctor, 'post',
+         'appointments:api_accept', {'appointment_id': pending.id}, None),
+        ('appointments:api_status', doctor, 'post',
+         'appointments:api_status', {'appointment_id': appointment.id}, {'status': 'in_progress'}),
+        ('appointments:api_prescription', unprescribed.doctor, 'post',
+         'appointments:api_prescription', {'appointment_id': unprescribed.id},
+         {'medicine_names': 'Paracetamol', 'dosage_instructions': 'After food', 'frequency': 'Twice daily'}),
+        ('appointments:api_feedback', completed.patient, 'post',
+         'appointments:api_feedback', {'appointment_id': completed.id}, {'rating': 5}),
+    ]
+
+
+def check_coverage(cases):
+    from django.urls import get_resolver
+
+    resolver = get_resolver()
+    names = set()
+    for namespace in ('accounts', 'appointments'):
+        prefix, sub_resolver = resolver.namespace_dict[namespace]
+        names.update(f'{namespace}:{pattern.name}' for pattern in sub_resolver.url_patterns)
+    missing = names - {url_name for name, user, method, url_name, kwargs, data in cases}
+    if missing:
+        sys.exit(f'No benchmark scenario for: {", ".join(sorted(missing))}')
+
+
+def request(client, method, url, data):
+    response = getattr(client, method)(url, data or {})
+    if hasattr(response, 'streaming_content'):
+        b''.join(response.streaming_content)
+    assert response.status_code < 400, (url, response.status_code)
+    return response
+
+
+def measure(user, method, url, data, requests):
+    from django.contrib.auth import SESSION_KEY
+    from django.db import connection, transaction
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+
+    client = Client()
+
+    def login():
+        # Outside the timing and allocation windows; only the logout
+        # scenario ends the session and needs a new login every time
+        if user is not None and SESSION_KEY not in client.session:
+            client.force_login(user)
+
+    def once():
+        # Roll back so POSTs measure the same work on every iteration
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as ctx:
+                seconds, response = timed(request, client, method, url, data)
+            transaction.set_rollback(True)
+        return seconds, len(ctx.captured_queries)
+
+    login()
+    once()  # warm caches (principal, directory, templates)
+    samples, queries = [], []
+    for _ in range(requests):
+        login()
+        seconds, count = once()
+        samples.append(seconds * 1000)
+        queries.append(count)
+
+    tracemalloc.start()
+    peaks = []
+    for _ in range(ALLOCATION_SAMPLES):
+        login()
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        once()
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+
+    result = summarize(samples)
+    result['queries'] = max(queries)
+    result['alloc_kb'] = sorted(peaks)[len(peaks) // 2] / 1024
+    return result
+
+
+def compare(results, baseline, tolerance, slack_ms):
+    failures = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if result['queries'] > expected['queries']:
+            failures.append(f'{name}: {result["queries"]} queries (baseline {expected["queries"]})')
+        # The absolute slack keeps millisecond-scale views from failing on noise
+        if result['p95'] > expected['p95'] * (1 + tolerance) + slack_ms:
+            failures.append(f'{name}: p95 {result["p95"]:.2f} ms (baseline {expected["p95"]:.2f})')
+        if result['alloc_kb'] > expected['alloc_kb'] * (1 + tolerance):
+            failures.append(f'{name}: {result["alloc_kb"]:.1f} KB allocated (baseline {expected["alloc_kb"]:.1f})')
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--doctors', type=int, default=20)
+    parser.add_argument('--patients', type=int, default=200)
+    parser.add_argument('--appointments', type=int, default=2000)
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--write-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed relative growth of p95 latency and allocations.')
+    parser.add_argument('--slack-ms', type=float, default=5.0,
+                        help='Extra p95 latency allowed on top of --tolerance.')
+    args = parser.parse_args()
+
+    setup()
+    from django.core.management import call_command
+    from django.db.models import Count
+    from django.test import override_settings
+    from django.urls import reverse
+
+    from accounts.models import User
+    from appointments.models import Appointment
+
+    deployment = override_settings(
+        CACHES=shared_caches(), SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+        SESSION_CACHE_ALIAS='shared', TASKS_EAGER=False,
+    )
+    with deployment, test_database():
+        call_command('seed_meditrack', doctors=args.doctors, patients=args.patients,
+                     appointments=args.appointments, stdout=io.StringIO())
+        # The busiest accounts make the listing pages worst-case
+        patient = User.objects.filter(role='patient').annotate(n=Count('patient_appointments')).latest('n')
+        doctor = User.objects.filter(role='doctor').annotate(n=Count('doctor_appointments')).latest('n')
+        staff = User.objects.create(username='bench-staff', role='patient', is_staff=True)
+        appointment = Appointment.objects.filter(patient=patient, doctor=doctor, status='confirmed').first() \
+            or Appointment.objects.filter(doctor=doctor, status='confirmed').first()
+        patient = appointment.patient
+        pending = Appointment.objects.filter(status='pending').select_related('preferred_doctor').first()
+        completed = Appointment.objects.filter(status='completed', feedback__isnull=True) \
+            .select_related('patient').first()
+        unprescribed = Appointment.objects.filter(status='completed', prescription__isnull=True) \
+            .select_related('doctor').first()
+        confirmed_ids = list(Appointment.objects.filter(doctor=doctor, status='confirmed')
+                             .values_list('id', flat=True)[:20])
+
+        cases = scenarios(patient, doctor, staff, appointment, pending, completed, unprescribed, confirmed_ids)
+        check_coverage(cases)
+        results = {}
+        print(f'{"view":<42} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"queries":>8} {"alloc KB":>9}')
+        for name, user, method, url_name, kwargs, data in cases:
+            result = measure(user, method, reverse(url_name, kwargs=kwargs), data, args.requests)
+            results[name] = result
+            print(f'{name:<42} {result["p50"]:>8.2f} {result["p95"]:>8.2f} {result["p99"]:>8.2f} '
+                  f'{result["queries"]:>8} {result["alloc_kb"]:>9.1f}')
+
+    if args.write_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as handle:
+            json.dump(results, handle, indent=2, sort_keys=True)
+        print(f'Baseline written to {args.baseline}')
+        return
+    if not os.path.exists(args.baseline):
+        print('No baseline to compare with; run with --write-baseline.')
+        return
+    with open(args.baseline) as handle:
+        failures = compare(results, json.load(handle), args.tolerance, args.slack_ms)
+    for failure in failures:
+        print(f'REGRESSION {failure}')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
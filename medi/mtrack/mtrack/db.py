@@ -0,0 +1,28 @@
+"""
+Per-connection database setup. SQLite gets WAL journaling and a relaxed
+fsync policy so readers don't block the writer and commits are cheap;
+PostgreSQL needs nothing here (see DATABASES in settings).
+"""
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+SQLITE_PRAGMAS = {
+    # Readers keep reading while one writer commits
+    'journal_mode': 'WAL',
+    # Under WAL, NORMAL only risks the last commits on power loss, never corruption
+    'synchronous': 'NORMAL',
+    # Wait for the write lock instead of failing with "database is locked"
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite' or not settings.SQLITE_TUNED:
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
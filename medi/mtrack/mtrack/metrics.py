@@ -0,0 +1,180 @@
+"""
+Opt-in request metrics (METRICS_ENABLED): wall time, DB time, query count
+and repeated queries per URL name, kept in an in-process ring buffer and
+exposed at /metrics/ (Prometheus text) and /metrics/summary/ (staff HTML).
+"""
+import cProfile
+import io
+import pstats
+import random
+import statistics
+import threading
+import time
+from collections import Counter, deque, namedtuple
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import Http404, HttpResponse
+from django.shortcuts import render
+
+Sample = namedtuple('Sample', 'view method status wall db queries duplicates at')
+Profile = namedtuple('Profile', 'view path wall stats at')
+
+# deque.append with maxlen is atomic under the GIL, so request threads
+# record without taking a lock; readers work on a list() snapshot.
+samples = deque(maxlen=getattr(settings, 'METRICS_BUFFER_SIZE', 2048))
+profiles = deque(maxlen=20)
+# Only one cProfile may be active per process (Python 3.12+ raises
+# ValueError otherwise), so a sampled request that finds another one
+# running goes unprofiled.
+_profile_lock = threading.Lock()
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            # SQL arrives with placeholders, so N+1 lookups share one text
+            self.statements[sql] += 1
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        profiler = None
+        if random.random() < settings.METRICS_PROFILE_SAMPLE_RATE and _profile_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(recorder))
+                if profiler:
+                    profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    if profiler:
+                        profiler.disable()
+        finally:
+            if profiler:
+                _profile_lock.release()
+        wall = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = match.view_name if match else '<unresolved>'
+        duplicates = {sql: count for sql, count in recorder.statements.items() if count > 1}
+        samples.append(Sample(
+            view, request.method, response.status_code, wall, recorder.seconds,
+            sum(recorder.statements.values()), duplicates, time.time(),
+        ))
+        if profiler and wall * 1000 >= settings.METRICS_PROFILE_THRESHOLD_MS:
+            output = io.StringIO()
+            pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(30)
+            profiles.append(Profile(view, request.get_full_path(), wall, output.getvalue(), time.time()))
+        return response
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def summarize():
+    by_view = {}
+    for sample in list(samples):
+        by_view.setdefault(sample.view, []).append(sample)
+    summary = []
+    for view, rows in sorted(by_view.items()):
+        walls = [row.wall for row in rows]
+        repeated = Counter()
+        for row in rows:
+            repeated.update(row.duplicates)
+        summary.append({
+            'view': view,
+            'count': len(rows),
+            'errors': sum(row.status >= 500 for row in rows),
+            'wall_sum': sum(walls),
+            'wall_p50': percentile(walls, 50),
+            'wall_p95': percentile(walls, 95),
+            'wall_p99': percentile(walls, 99),
+            'db_sum': sum(row.db for row in rows),
+            'queries_sum': sum(row.queries for row in rows),
+            'queries_mean': statistics.fmean(row.queries for row in rows),
+            'queries_max': max(row.queries for row in rows),
+            'duplicates_sum': sum(sum(row.duplicates.values()) - len(row.duplicates) for row in rows),
+            'top_duplicates': repeated.most_common(5),
+        })
+    return summary
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def prometheus_text(summary):
+    # Values cover the requests still in the ring buffer, hence gauges
+    lines = [
+        '# HELP meditrack_request_seconds Request wall time over the sample window.',
+        '# TYPE meditrack_request_seconds summary',
+    ]
+    for row in summary:
+        view = _label(row['view'])
+        for quantile in ('50', '95', '99'):
+            lines.append(f'meditrack_request_seconds{{view="{view}",quantile="0.{quantile}"}} {row["wall_p" + quantile]:.6f}')
+        lines.append(f'meditrack_request_seconds_sum{{view="{view}"}} {row["wall_sum"]:.6f}')
+        lines.append(f'meditrack_request_seconds_count{{view="{view}"}} {row["count"]}')
+    gauges = [
+        ('meditrack_request_errors', 'errors', 'Responses with a 5xx status.'),
+        ('meditrack_db_seconds', 'db_sum', 'Time spent in database queries.'),
+        ('meditrack_db_queries', 'queries_sum', 'Database queries issued.'),
+        ('meditrack_db_queries_max', 'queries_max', 'Most queries issued by one request.'),
+        ('meditrack_db_duplicate_queries', 'duplicates_sum', 'Repeats of an identical SQL statement within a request.'),
+    ]
+    for name, key, help_text in gauges:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} gauge')
+        for row in summary:
+            lines.append(f'{name}{{view="{_label(row["view"])}"}} {row[key]}')
+    return '\n'.join(lines) + '\n'
+
+
+def _enabled():
+    if not settings.METRICS_ENABLED:
+        raise Http404
+
+
+def prometheus(request):
+    _enabled()
+    # Scrapers authenticate with METRICS_TOKEN; people need a staff login
+    token = settings.METRICS_TOKEN
+    authorized = token and request.headers.get('Authorization') == f'Bearer {token}'
+    if not (authorized or (request.user.is_active and request.user.is_staff)):
+        return HttpResponse(status=403)
+    return HttpResponse(prometheus_text(summarize()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@staff_member_required
+def summary(request):
+    _enabled()
+    return render(request, 'metrics/summary.html', {
+        'summary': sorted(summarize(), key=lambda row: row['wall_p95'], reverse=True),
+        'profiles': list(reversed(profiles)),
+        'buffer_size': samples.maxlen,
+    })
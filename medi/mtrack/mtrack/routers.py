@@ -0,0 +1,84 @@
+"""
+Primary/replica routing (DATABASE_REPLICAS). Writes always go to the
+primary ('default'). Reads go to a replica only inside a GET or HEAD
+request whose client hasn't written recently: a request that writes sets
+a cookie pinning that client to the primary for REPLICA_PIN_SECONDS, so
+the page it is redirected to reads its own writes.
+"""
+import contextvars
+import random
+import time
+
+from django.conf import settings
+from django.db import connections
+
+PRIMARY = 'default'
+PIN_COOKIE = 'db_pin'
+# Session rows are written on login and read on the very next request
+PRIMARY_ONLY_APPS = {'sessions'}
+
+# Per request: whether reads may use a replica, and whether it has written.
+# A dict rather than flags so writes made under sync_to_async are seen.
+_state = contextvars.ContextVar('replica_state', default=None)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if not (state and state['replicas']) or model._meta.app_label in PRIMARY_ONLY_APPS:
+            return PRIMARY
+        # A read inside a transaction must see that transaction's writes
+        if connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None and model._meta.app_label not in PRIMARY_ONLY_APPS:
+            state['wrote'] = True
+            state['replicas'] = False
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        databases = {PRIMARY, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema by replication
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+def _pinned(request):
+    try:
+        return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+class ReplicaPinningMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        replicas = (
+            bool(settings.DATABASE_REPLICAS)
+            and request.method in ('GET', 'HEAD')
+            and not _pinned(request)
+        )
+        state = {'replicas': replicas, 'wrote': False}
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state['wrote'] and settings.DATABASE_REPLICAS:
+            response.set_cookie(
+                PIN_COOKIE, str(time.time() + settings.REPLICA_PIN_SECONDS),
+                max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax',
+            )
+        return response
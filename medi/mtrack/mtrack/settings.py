@@ -11,7 +11,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 import os
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
+from django.core.exceptions import ImproperlyConfigured
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -40,26 +41,45 @@ INSTALLED_APPS = [
     'bootstrap4',
     'accounts',
     'appointments',
+    'tasks',
 ]
 
 MIDDLEWARE = [
+    # Outermost so it times the whole stack; removes itself unless METRICS_ENABLED
+    'mtrack.metrics.MetricsMiddleware',
+    'mtrack.routers.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'accounts.middleware.PrincipalAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
 ROOT_URLCONF = 'mtrack.urls'
 
+# Request metrics, see mtrack/metrics.py
+METRICS_ENABLED = config('METRICS_ENABLED', default=False, cast=bool)
+METRICS_BUFFER_SIZE = config('METRICS_BUFFER_SIZE', default=2048, cast=int)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+# Fraction of requests run under cProfile; profiles slower than the threshold are kept
+METRICS_PROFILE_SAMPLE_RATE = config('METRICS_PROFILE_SAMPLE_RATE', default=0.0, cast=float)
+METRICS_PROFILE_THRESHOLD_MS = config('METRICS_PROFILE_THRESHOLD_MS', default=500, cast=float)
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
+        'APP_DIRS': False,
         'OPTIONS': {
+            # Compile each template once per process, whatever DEBUG is
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -71,18 +91,110 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'mtrack.wsgi.application'
+# Route the read-only pages to their async versions; turn on when serving
+# through mtrack.asgi, since under WSGI each async view costs an event loop.
+ASYNC_VIEWS = config('ASYNC_VIEWS', default=False, cast=bool)
+# Live appointment updates (appointments/events.py): 'local' reaches the
+# streams in this process only; with several workers use 'postgresql'
+EVENTS_BROKER = config('EVENTS_BROKER', default='local')
+# Background tasks (tasks/queue.py), such as search indexing. By default
+# they run inline, so a plain runserver keeps search results current. Set
+# TASKS_EAGER=False to queue them instead, and only with `manage.py
+# run_tasks` workers running: nothing else runs queued tasks.
+TASKS_EAGER = config('TASKS_EAGER', default=True, cast=bool)
 
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE=postgresql is the production profile. Connections persist for
+# DB_CONN_MAX_AGE seconds and are checked before reuse; Django 4.2 has no
+# built-in pool, so put PgBouncer (transaction mode, DB_PGBOUNCER=True)
+# in front when workers outnumber the connections Postgres should hold.
+DB_ENGINE = config('DB_ENGINE', default='sqlite')
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('DB_NAME', default='meditrack'),
+            'USER': config('DB_USER', default='meditrack'),
+            'PASSWORD': config('DB_PASSWORD', default=''),
+            'HOST': config('DB_HOST', default='localhost'),
+            'PORT': config('DB_PORT', default=5432, cast=int),
+            'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int),
+            'CONN_HEALTH_CHECKS': True,
+            # Server-side cursors don't survive transaction pooling
+            'DISABLE_SERVER_SIDE_CURSORS': config('DB_PGBOUNCER', default=False, cast=bool),
+            'OPTIONS': {'connect_timeout': 5},
+        }
     }
+elif DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': config('DB_NAME', default=str(BASE_DIR / 'db.sqlite3')),
+        }
+    }
+else:
+    raise ImproperlyConfigured(f'DB_ENGINE must be "sqlite" or "postgresql", not {DB_ENGINE!r}')
+
+# Read replicas: hosts for PostgreSQL, files for SQLite. See mtrack/routers.py
+DATABASE_REPLICAS = []
+for number, location in enumerate(config('DB_REPLICAS', default='', cast=Csv()), 1):
+    replica = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+    replica['HOST' if DB_ENGINE == 'postgresql' else 'NAME'] = location
+    DATABASES[f'replica{number}'] = replica
+    DATABASE_REPLICAS.append(f'replica{number}')
+DATABASE_ROUTERS = ['mtrack.routers.PrimaryReplicaRouter']
+# How long a client that wrote keeps reading from the primary; cover the
+# replicas' usual lag
+REPLICA_PIN_SECONDS = config('REPLICA_PIN_SECONDS', default=5, cast=int)
+
+# WAL and friends on every SQLite connection, see mtrack/db.py
+SQLITE_TUNED = config('SQLITE_TUNED', default=True, cast=bool)
+
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # {% cache %} row fragments; sized so a full page of rows isn't culled
+    'template_fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'template-fragments',
+        'TIMEOUT': 60 * 60,
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
 }
 
+# A cache every worker process shares, for state they must agree on:
+# sessions, revoked logins and the doctor directory. Set SHARED_CACHE_DIR
+# to a directory all of them can write. Without it the local-memory caches
+# above are per process, which is only right for a single process: logins
+# are verified against the database on every request, sessions default to
+# the database (see SESSION_ENGINE), and a worker can show a doctor list
+# (and the names in cached rows) up to 30 seconds out of date.
+SHARED_CACHE_DIR = config('SHARED_CACHE_DIR', default='')
+if SHARED_CACHE_DIR:
+    CACHES['shared'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': SHARED_CACHE_DIR,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+
+# Sessions: 'cached_db' reads through the shared cache and only writes hit
+# the database; it is the default only with a shared cache, since a session
+# logged out in one worker would stay cached in the others. Otherwise 'db',
+# Django's default. 'signed_cookies' keeps the whole session in the cookie
+# and never touches the database.
+SESSION_ENGINE = 'django.contrib.sessions.backends.' + config(
+    'SESSION_BACKEND', default='cached_db' if SHARED_CACHE_DIR else 'db'
+)
+SESSION_CACHE_ALIAS = 'shared' if SHARED_CACHE_DIR else 'default'
+# Flash messages ride in a cookie instead of costing a session write
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
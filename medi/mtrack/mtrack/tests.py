@@ -0,0 +1,205 @@
+import datetime
+import os
+import sqlite3
+import tempfile
+import time
+
+from django.contrib.sessions.models import Session
+from django.db import connection, connections, router, transaction
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from accounts.models import User
+from accounts.testing import make_user
+from appointments.models import Appointment
+from . import db, metrics, routers
+
+
+@override_settings(METRICS_ENABLED=True, METRICS_TOKEN='scrape-me')
+class MetricsMiddlewareTests(TestCase):
+    def setUp(self):
+        metrics.samples.clear()
+        metrics.profiles.clear()
+        self.doctor = make_user('doctor', 'doctor')
+        self.staff = make_user('staff', 'patient', is_staff=True)
+
+    def test_requests_are_recorded_per_url_name(self):
+        self.client.force_login(self.doctor)
+        self.client.get(reverse('appointments:appointments_list'))
+        sample = metrics.samples[-1]
+        self.assertEqual(sample.view, 'appointments:appointments_list')
+        self.assertEqual(sample.status, 200)
+        self.assertGreater(sample.queries, 0)
+        self.assertGreaterEqual(sample.wall, sample.db)
+
+    def test_repeated_statements_are_fingerprinted(self):
+        recorder = metrics.QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for pk in (1, 2, 3):
+                list(User.objects.filter(pk=pk))
+            User.objects.count()
+        self.assertEqual(sum(recorder.statements.values()), 4)
+        self.assertEqual(sorted(recorder.statements.values()), [1, 3])
+
+    def test_prometheus_endpoint(self):
+        self.client.force_login(self.doctor)
+        self.client.get(reverse('accounts:dashboard'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+        self.client.logout()
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-me')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('meditrack_request_seconds_count{view="accounts:dashboard"} 1', body)
+        self.assertIn('meditrack_db_queries{view="accounts:dashboard"}', body)
+
+    def test_summary_is_staff_only(self):
+        self.client.force_login(self.doctor)
+        self.client.get(reverse('accounts:dashboard'))
+        self.assertEqual(self.client.get(reverse('metrics_summary')).status_code, 302)
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('metrics_summary'))
+        self.assertContains(response, 'accounts:dashboard')
+
+    @override_settings(METRICS_PROFILE_SAMPLE_RATE=1.0, METRICS_PROFILE_THRESHOLD_MS=0)
+    def test_slow_requests_are_profiled(self):
+        self.client.force_login(self.doctor)
+        self.client.get(reverse('accounts:dashboard'))
+        self.assertEqual(metrics.profiles[-1].view, 'accounts:dashboard')
+        self.assertIn('cumulative', metrics.profiles[-1].stats)
+
+    @override_settings(METRICS_PROFILE_SAMPLE_RATE=1.0, METRICS_PROFILE_THRESHOLD_MS=0)
+    def test_overlapping_samples_run_unprofiled(self):
+        self.client.force_login(self.doctor)
+        # As if another thread's request were being profiled
+        with metrics._profile_lock:
+            response = self.client.get(reverse('accounts:dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(metrics.profiles), 0)
+        self.client.get(reverse('accounts:dashboard'))
+        self.assertEqual(len(metrics.profiles), 1)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled_by_default(self):
+        self.client.force_login(self.staff)
+        self.client.get(reverse('accounts:dashboard'))
+        self.assertEqual(len(metrics.samples), 0)
+        self.assertEqual(self.client.get(reverse('metrics_summary')).status_code, 404)
+
+
+class SQLitePragmaTests(SimpleTestCase):
+    def connect(self, path):
+        wrapper = DatabaseWrapper({**connection.settings_dict, 'NAME': path}, alias='pragma-test')
+        wrapper.ensure_connection()
+        self.addCleanup(wrapper.close)
+        with wrapper.cursor() as cursor:
+            return {pragma: cursor.execute(f'PRAGMA {pragma}').fetchone()[0] for pragma in db.SQLITE_PRAGMAS}
+
+    def test_new_connections_are_tuned(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            pragmas = self.connect(os.path.join(tmp, 'tuned.sqlite3'))
+        self.assertEqual(pragmas['journal_mode'], 'wal')
+        self.assertEqual(pragmas['synchronous'], 1)  # NORMAL
+        self.assertEqual(pragmas['busy_timeout'], db.SQLITE_PRAGMAS['busy_timeout'])
+        self.assertEqual(pragmas['mmap_size'], db.SQLITE_PRAGMAS['mmap_size'])
+
+    @override_settings(SQLITE_TUNED=False)
+    def test_tuning_can_be_turned_off(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            pragmas = self.connect(os.path.join(tmp, 'plain.sqlite3'))
+        self.assertEqual(pragmas['journal_mode'], 'delete')
+        self.assertEqual(pragmas['synchronous'], 2)  # FULL
+
+
+REPLICA = 'replica_test'
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA], REPLICA_PIN_SECONDS=5)
+class ReplicaRoutingTests(TransactionTestCase):
+    # The test database is the primary; a SQLite file refreshed from it
+    # with the backup API stands in for a lagging replica. The alias is
+    # added after the test-case setup so it isn't guarded like an
+    # undeclared database, and isn't flushed between tests.
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.replica_path = os.path.join(cls.tmp.name, 'replica.sqlite3')
+        connections.settings[REPLICA] = {**connections.settings['default'], 'NAME': cls.replica_path}
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.settings[REPLICA]
+        cls.tmp.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.patient = make_user('patient', 'patient')
+        self.doctor = make_user('doctor', 'doctor')
+        self.replicate()
+        self.client.force_login(self.patient)
+
+    def replicate(self):
+        connections[REPLICA].close()
+        connection.ensure_connection()
+        target = sqlite3.connect(self.replica_path)
+        connection.connection.backup(target)
+        target.close()
+
+    def book(self, days=1):
+        return Appointment.objects.create(
+            patient=self.patient,
+            preferred_doctor=self.doctor,
+            appointment_date=datetime.date.today() + datetime.timedelta(days=days),
+            appointment_time=datetime.time(10, 0),
+            health_concern='Headache',
+        )
+
+    def listed(self):
+        response = self.client.get(reverse('appointments:appointments_list'))
+        return [appointment.id for appointment in response.context['appointments']]
+
+    def test_reads_go_to_the_replica(self):
+        appointment = self.book()
+        self.assertEqual(self.listed(), [])
+        self.replicate()
+        self.assertEqual(self.listed(), [appointment.id])
+
+    def test_writer_reads_its_own_writes(self):
+        response = self.client.post(reverse('appointments:book_appointment'), {
+            'preferred_doctor': self.doctor.id,
+            'appointment_date': datetime.date.today() + datetime.timedelta(days=1),
+            'appointment_time': '10:00',
+            'health_concern': 'Headache',
+        })
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+        booked = Appointment.objects.get()
+        self.assertEqual(self.listed(), [booked.id])
+
+        # Once the pin lapses the stale replica answers again
+        self.client.cookies[routers.PIN_COOKIE] = str(time.time() - 1)
+        self.assertEqual(self.listed(), [])
+
+    def test_reads_without_writes_do_not_pin(self):
+        response = self.client.get(reverse('appointments:appointments_list'))
+        self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+
+    def test_routing_rules(self):
+        self.assertEqual(router.db_for_read(Appointment), 'default')  # outside a request
+        token = routers._state.set({'replicas': True, 'wrote': False})
+        try:
+            self.assertEqual(router.db_for_read(Appointment), REPLICA)
+            self.assertEqual(router.db_for_read(Session), 'default')
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(Appointment), 'default')
+            self.assertEqual(router.db_for_write(Appointment), 'default')
+            # Later reads in the same request follow the write
+            self.assertEqual(router.db_for_read(Appointment), 'default')
+        finally:
+            routers._state.reset(token)
+        self.assertFalse(router.allow_migrate(REPLICA, 'appointments'))
@@ -17,10 +17,13 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from django.views.generic import TemplateView
+from . import metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('accounts/', include('accounts.urls')),
     path('appointments/', include('appointments.urls')),
+    path('metrics/', metrics.prometheus, name='metrics'),
+    path('metrics/summary/', metrics.summary, name='metrics_summary'),
     path('', TemplateView.as_view(template_name='landing.html'), name='landing'),
 ]
\ No newline at end of file
@@ -0,0 +1,36 @@
+// Live appointment updates: patch the status badges on this page and offer
+// a refresh for everything else. See appointments/events.py.
+(function () {
+    var script = document.currentScript;
+    if (!window.EventSource || !script) {
+        return;
+    }
+    var notice = document.getElementById('live-notice');
+    var source = new EventSource(script.dataset.url);
+    var connected = false;
+
+    function showNotice() {
+        if (notice) {
+            notice.classList.remove('d-none');
+        }
+    }
+
+    source.addEventListener('ready', function () {
+        // A reconnect may have missed changes
+        if (connected) {
+            showNotice();
+        }
+        connected = true;
+    });
+    source.addEventListener('resync', showNotice);
+    source.addEventListener('appointment', function (event) {
+        var change = JSON.parse(event.data);
+        var badges = document.querySelectorAll('[data-status-for="' + change.id + '"]');
+        badges.forEach(function (badge) {
+            badge.className = 'badge badge-' + change.badge;
+            badge.textContent = change.status_display;
+        });
+        // Buttons and queues depend on the status too
+        showNotice();
+    });
+})();
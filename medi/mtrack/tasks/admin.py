@@ -0,0 +1,18 @@
+from django.contrib import admin, messages
+from django.utils import timezone
+
+from .models import Task
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'attempts', 'max_attempts', 'run_at', 'locked_by', 'created_at')
+    list_filter = ('status', 'name')
+    readonly_fields = ('attempts', 'locked_by', 'locked_at', 'last_error', 'created_at')
+    actions = ('retry',)
+
+    @admin.action(description='Run selected tasks again')
+    def retry(self, request, queryset):
+        updated = queryset.exclude(status='running').update(
+            status='queued', attempts=0, run_at=timezone.now(), locked_by='', locked_at=None,
+        )
+        self.message_user(request, f'{updated} task(s) queued again.', messages.SUCCESS)
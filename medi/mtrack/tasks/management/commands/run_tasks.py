@@ -0,0 +1,78 @@
+import multiprocessing
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from tasks import queue
+
+
+class Command(BaseCommand):
+    help = 'Run queued background tasks until stopped (SIGINT/SIGTERM finish the current batch first).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4, help='Worker threads per process.')
+        parser.add_argument('--processes', type=int, default=1,
+                            help='Worker processes, each with --threads threads.')
+        parser.add_argument('--batch', type=int, default=queue.BATCH_SIZE,
+                            help='Tasks each thread claims at a time.')
+        parser.add_argument('--poll', type=float, default=queue.POLL_INTERVAL,
+                            help='Seconds to wait when no task is due.')
+        parser.add_argument('--once', action='store_true', help='Exit once no task is due.')
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        children = []
+
+        def shutdown(signum, frame):
+            stop.set()
+            for child in children:
+                child.terminate()  # SIGTERM: the child finishes its batch too
+
+        signal.signal(signal.SIGINT, shutdown)
+        signal.signal(signal.SIGTERM, shutdown)
+
+        if options['processes'] > 1:
+            # Forked children must not share the parent's connections
+            connections.close_all()
+            context = multiprocessing.get_context('fork')
+            children.extend(
+                context.Process(target=self.child, args=(number, options), daemon=False)
+                for number in range(options['processes'])
+            )
+            for child in children:
+                child.start()
+            for child in children:
+                child.join()
+            return
+
+        succeeded, failed = self.run_threads(stop, options)
+        self.stdout.write(self.style.SUCCESS(f'Ran {succeeded + failed} task(s): {failed} failed.'))
+
+    def child(self, number, options):
+        stop = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda signum, frame: stop.set())
+        succeeded, failed = self.run_threads(stop, options)
+        self.stdout.write(f'Process {number}: ran {succeeded + failed} task(s): {failed} failed.')
+
+    def run_threads(self, stop, options):
+        work = dict(stop=stop, batch=options['batch'], poll=options['poll'], once=options['once'])
+        if options['threads'] == 1:
+            return queue.work(queue.worker_name(0), **work)
+
+        results = []
+
+        def thread(number):
+            try:
+                results.append(queue.work(queue.worker_name(number), **work))
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=thread, args=(number,)) for number in range(options['threads'])]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return sum(r[0] for r in results), sum(r[1] for r in results)
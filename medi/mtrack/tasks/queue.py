@@ -0,0 +1,180 @@
+"""
+A task queue in a database table, for work that shouldn't hold up the
+request that caused it: search indexing now, notifications later.
+
+    @task
+    def reindex_search(ids):
+        ...
+
+    reindex_search.delay([appointment.pk])
+
+delay() inserts the task row in the caller's transaction, so it commits
+with the change that queued it: a task never runs for a change that was
+rolled back, nor before its rows are visible, and is never lost between
+the change committing and the task being queued. Arguments must be
+JSON-serializable. `manage.py run_tasks` runs
+the queue: each worker thread claims a batch of due tasks (SELECT ... FOR
+UPDATE SKIP LOCKED on PostgreSQL; on SQLite by taking the write lock
+first), runs them one by one and deletes each that succeeds. A task that
+raises is retried with exponential backoff until max_attempts, then left
+as failed. A worker that dies mid-batch leaves its tasks running; they
+are claimed again after LOCK_TIMEOUT, so tasks must be safe to run twice.
+
+All of this applies with TASKS_EAGER=False. TASKS_EAGER is on by default,
+and then delay() runs the task inline, as the code did before the queue
+existed, so a deployment without a worker still does the work.
+"""
+import os
+import random
+import socket
+import time
+import traceback
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import OperationalError, connections, router, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Task
+
+MAX_ATTEMPTS = 5
+BATCH_SIZE = 20
+POLL_INTERVAL = 1.0  # seconds a worker waits when nothing is due
+RETRY_DELAY = 2  # seconds before the first retry, doubled on every retry
+MAX_RETRY_DELAY = 60 * 60
+# A claimed task still running after this is assumed lost with its worker
+LOCK_TIMEOUT = timedelta(minutes=10)
+WRITE_ATTEMPTS = 8  # about 2.5s of backoff in all
+
+registry = {}
+
+
+def task(func=None, *, max_attempts=MAX_ATTEMPTS):
+    """Register func as a task; func.delay(*args, **kwargs) queues a call."""
+    def register(func):
+        func.task_name = f'{func.__module__}.{func.__name__}'
+        func.max_attempts = max_attempts
+        func.delay = partial(enqueue, func)
+        registry[func.task_name] = func
+        return func
+    return register(func) if func is not None else register
+
+
+def _using():
+    return router.db_for_write(Task)
+
+
+def enqueue(func, *args, **kwargs):
+    if settings.TASKS_EAGER:
+        func(*args, **kwargs)
+        return
+    Task.objects.using(_using()).create(
+        name=func.task_name, args=list(args), kwargs=kwargs, max_attempts=func.max_attempts,
+    )
+
+
+def worker_name(thread=0):
+    # Unique per thread: processes differ by pid
+    return f'{socket.gethostname()}:{os.getpid()}:{thread}'
+
+
+def _due(now):
+    return Q(status='queued', run_at__lte=now) | Q(status='running', locked_at__lt=now - LOCK_TIMEOUT)
+
+
+def claim(worker, limit=BATCH_SIZE):
+    """Lock up to `limit` due tasks for this worker and return them, oldest first."""
+    using = _using()
+    connection = connections[using]
+    now = timezone.now()
+    with transaction.atomic(using=using):
+        rows = Task.objects.using(using).filter(_due(now)).order_by('run_at', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            # Concurrent workers skip each other's rows instead of waiting
+            rows = rows.select_for_update(skip_locked=True)
+        elif connection.vendor == 'sqlite':
+            # No row locks: take the write lock before reading so no other
+            # worker can claim the same rows in between
+            with connection.cursor() as cursor:
+                cursor.execute(f'UPDATE {Task._meta.db_table} SET id = id WHERE 0')
+        tasks = list(rows[:limit])
+        if tasks:
+            Task.objects.using(using).filter(pk__in=[t.pk for t in tasks]).update(
+                status='running', locked_by=worker, locked_at=now, attempts=F('attempts') + 1,
+            )
+    for t in tasks:
+        t.status, t.locked_by, t.locked_at, t.attempts = 'running', worker, now, t.attempts + 1
+    return tasks
+
+
+def retry_delay(attempts):
+    # Jittered so tasks that failed together don't all retry together
+    return min(MAX_RETRY_DELAY, RETRY_DELAY * 2 ** (attempts - 1)) * random.uniform(0.5, 1.5)
+
+
+def _retry_busy(func):
+    # SQLite reports a busy write lock as OperationalError; back off and
+    # try again rather than leave a finished task to LOCK_TIMEOUT
+    for attempt in range(WRITE_ATTEMPTS):
+        try:
+            return func()
+        except OperationalError:
+            if attempt == WRITE_ATTEMPTS - 1:
+                raise
+            time.sleep(0.01 * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+def run(row):
+    """Run one claimed task; returns whether it succeeded."""
+    using = _using()
+    mine = Task.objects.using(using).filter(pk=row.pk, locked_by=row.locked_by, locked_at=row.locked_at)
+    try:
+        func = registry.get(row.name)
+        if func is None:
+            raise LookupError(f'No task named {row.name!r} is registered')
+        # The task's writes commit or roll back as one, so a retry starts clean
+        with transaction.atomic(using=using):
+            func(*row.args, **row.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        if row.attempts >= row.max_attempts:
+            changes = {'status': 'failed'}
+        else:
+            changes = {'status': 'queued', 'run_at': timezone.now() + timedelta(seconds=retry_delay(row.attempts))}
+        _retry_busy(lambda: mine.update(last_error=error, locked_by='', locked_at=None, **changes))
+        return False
+    _retry_busy(mine.delete)
+    return True
+
+
+def work(worker, stop, batch=BATCH_SIZE, poll=POLL_INTERVAL, once=False):
+    """
+    Claim and run tasks until `stop` (a threading.Event) is set, or with
+    once=True until none are due. Returns (succeeded, failed).
+    """
+    succeeded = failed = 0
+    while not stop.is_set():
+        try:
+            rows = claim(worker, batch)
+        except OperationalError:
+            # SQLite's write lock stayed busy past its timeout; try again
+            rows = None
+        if not rows:
+            if once and rows is not None:
+                break
+            stop.wait(poll)
+            continue
+        for row in rows:
+            try:
+                ok = run(row)
+            except OperationalError:
+                # Couldn't record the outcome; the task is claimed again
+                # after LOCK_TIMEOUT
+                ok = False
+            if ok:
+                succeeded += 1
+            else:
+                failed += 1
+    return succeeded, failed
@@ -0,0 +1,111 @@
+import io
+import threading
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from . import queue
+from .models import Task
+
+calls = []
+calls_lock = threading.Lock()
+
+
+@queue.task
+def record(value):
+    with calls_lock:
+        calls.append(value)
+
+
+@queue.task(max_attempts=2)
+def explode():
+    raise ValueError('boom')
+
+
+def run_worker(**options):
+    call_command('run_tasks', once=True, stdout=io.StringIO(), **{'threads': 1, **options})
+
+
+@override_settings(TASKS_EAGER=False)
+class QueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_delay_commits_with_the_callers_transaction(self):
+        with transaction.atomic():
+            record.delay('rolled back')
+            transaction.set_rollback(True)
+        self.assertFalse(Task.objects.exists())
+
+        record.delay('kept')
+        task = Task.objects.get()
+        self.assertEqual((task.name, task.args, task.status), ('tasks.tests.record', ['kept'], 'queued'))
+        self.assertEqual(calls, [])
+
+    @override_settings(TASKS_EAGER=True)
+    def test_eager_runs_inline(self):
+        record.delay('now')
+        self.assertEqual(calls, ['now'])
+        self.assertFalse(Task.objects.exists())
+
+    def test_worker_runs_and_deletes_tasks(self):
+        for value in range(3):
+            record.delay(value)
+        run_worker(batch=2)
+        self.assertEqual(calls, [0, 1, 2])
+        self.assertFalse(Task.objects.exists())
+
+    def test_failures_retry_with_backoff_then_stop(self):
+        explode.delay()
+        run_worker()
+        task = Task.objects.get()
+        self.assertEqual((task.status, task.attempts, task.locked_by), ('queued', 1, ''))
+        self.assertIn('ValueError: boom', task.last_error)
+        self.assertGreater(task.run_at, timezone.now())
+
+        # Not due yet
+        run_worker()
+        self.assertEqual(Task.objects.get().attempts, 1)
+
+        Task.objects.update(run_at=timezone.now())
+        run_worker()
+        task = Task.objects.get()
+        self.assertEqual((task.status, task.attempts), ('failed', 2))
+
+    def test_unknown_task_fails_instead_of_vanishing(self):
+        Task.objects.create(name='tasks.tests.missing', max_attempts=1)
+        run_worker()
+        self.assertIn('No task named', Task.objects.get(status='failed').last_error)
+
+    def test_lost_worker_tasks_are_claimed_again(self):
+        record.delay('lost')
+        Task.objects.update(status='running', locked_by='gone:1:0',
+                            locked_at=timezone.now() - queue.LOCK_TIMEOUT - timedelta(seconds=1))
+        record.delay('fresh')
+        Task.objects.filter(status='queued').update(run_at=timezone.now() + timedelta(hours=1))
+        [task] = queue.claim('me:1:0')
+        self.assertEqual((task.args, task.locked_by), (['lost'], 'me:1:0'))
+        self.assertEqual(queue.claim('other:1:0'), [])
+
+    def test_retry_delay_grows_and_is_capped(self):
+        self.assertLess(queue.retry_delay(1), queue.retry_delay(6))
+        self.assertLessEqual(queue.retry_delay(50), queue.MAX_RETRY_DELAY * 1.5)
+
+
+@override_settings(TASKS_EAGER=False)
+class WorkerConcurrencyTests(TransactionTestCase):
+    TASKS = 200
+
+    def setUp(self):
+        calls.clear()
+
+    def test_threads_run_each_task_once(self):
+        Task.objects.bulk_create(
+            Task(name=record.task_name, args=[value]) for value in range(self.TASKS)
+        )
+        run_worker(threads=4, batch=5, poll=0.01)
+        self.assertEqual(sorted(calls), list(range(self.TASKS)))
+        self.assertFalse(Task.objects.exists())